@@ -0,0 +1,225 @@
+"""
+Admission control untuk endpoint yang memicu verifikasi wajah
+Caps how many face requests run at once and makes the rest wait in a short FIFO queue,
+so a morning rush gets fast "come back in N seconds" answers instead of timeouts
+
+admission_controlled wraps a Flask view (app.py, register_web.py); busy_response and
+face_unavailable_response turn a rejection / FaceServiceBusy / FaceServiceTimeout into
+429/503/504 with Retry-After.
+
+Konfigurasi lewat environment variable (per proses):
+    ADMISSION_LIMIT   request yang boleh diproses bersamaan (default: 2x FACE_WORKERS)
+    ADMISSION_QUEUE   request yang boleh menunggu giliran (default: 4x limit)
+    ADMISSION_WAIT    batas tunggu di antrian dalam detik (default 10)
+"""
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from functools import wraps
+
+from flask import g, jsonify, session
+
+from face_service import FACE_WORKERS, FaceServiceTimeout
+
+ADMISSION_LIMIT = int(os.environ.get('ADMISSION_LIMIT', max(FACE_WORKERS, 1) * 2))
+ADMISSION_QUEUE = int(os.environ.get('ADMISSION_QUEUE', ADMISSION_LIMIT * 4))
+ADMISSION_WAIT = float(os.environ.get('ADMISSION_WAIT', 10))
+
+# Perkiraan awal lama satu request (detik) sebelum ada pengukuran
+INITIAL_SERVICE_TIME = 2.0
+# Bobot pengukuran terbaru untuk rata-rata bergerak (EWMA)
+SERVICE_TIME_WEIGHT = 0.2
+MAX_RETRY_AFTER = 60
+# Detik yang disarankan sebelum mengulang tap saat worker wajah penuh / timeout
+FACE_RETRY_AFTER = 5
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; carries the HTTP status and back-off hints"""
+
+    def __init__(self, status_code, message, retry_after, position):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.position = position
+
+
+class Ticket:
+    __slots__ = ('owner', 'queued_at', 'admitted_at', 'released')
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.queued_at = time.time()
+        self.admitted_at = None
+        self.released = False
+
+
+class AdmissionController:
+    def __init__(self, limit=ADMISSION_LIMIT, max_queue=ADMISSION_QUEUE, max_wait=ADMISSION_WAIT):
+        self.limit = max(limit, 1)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._owners = set()
+        self.active = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.rejected_duplicate = 0
+        self.service_time = INITIAL_SERVICE_TIME
+        self.max_wait_seen = 0.0
+
+    def retry_after(self, position):
+        """Seconds until a request at this queue position is likely to get a slot"""
+        estimate = self.service_time * position / self.limit
+        return min(max(math.ceil(estimate), 1), MAX_RETRY_AFTER)
+
+    def acquire(self, owner=None):
+        """Wait for a slot (FIFO), returns a Ticket or raises AdmissionRejected
+
+        One owner (user) may hold a single slot or queue place at a time; a second
+        request from the same user gets 429 while the first is still being handled.
+        """
+        with self._cond:
+            if owner is not None and owner in self._owners:
+                self.rejected_duplicate += 1
+                raise AdmissionRejected(
+                    429, 'Absensi Anda sebelumnya masih diproses, tunggu sebentar...',
+                    self.retry_after(1), 0
+                )
+
+            ticket = Ticket(owner)
+            if self.active < self.limit and not self._waiting:
+                return self._admit(ticket)
+
+            if len(self._waiting) >= self.max_queue:
+                self.rejected_full += 1
+                position = len(self._waiting) + 1
+                raise AdmissionRejected(
+                    503, 'Server sedang sibuk, silakan coba lagi sebentar lagi',
+                    self.retry_after(position), position
+                )
+
+            self._waiting.append(ticket)
+            if owner is not None:
+                self._owners.add(owner)
+            deadline = ticket.queued_at + self.max_wait
+            while not (self._waiting[0] is ticket and self.active < self.limit):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    position = self._waiting.index(ticket) + 1
+                    self._waiting.remove(ticket)
+                    self._owners.discard(owner)
+                    self.rejected_timeout += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected(
+                        503, 'Antrian verifikasi penuh, silakan coba lagi sebentar lagi',
+                        self.retry_after(position), position
+                    )
+                self._cond.wait(remaining)
+
+            self._waiting.popleft()
+            # Giliran berikutnya mungkin juga sudah bisa masuk
+            self._cond.notify_all()
+            return self._admit(ticket)
+
+    def _admit(self, ticket):
+        ticket.admitted_at = time.time()
+        self.active += 1
+        self.admitted += 1
+        if ticket.owner is not None:
+            self._owners.add(ticket.owner)
+        self.max_wait_seen = max(self.max_wait_seen, ticket.admitted_at - ticket.queued_at)
+        return ticket
+
+    def release(self, ticket):
+        """Give the slot back (safe to call more than once)"""
+        with self._cond:
+            if ticket.released:
+                return
+            ticket.released = True
+            self.active -= 1
+            self._owners.discard(ticket.owner)
+            elapsed = time.time() - ticket.admitted_at
+            self.service_time += SERVICE_TIME_WEIGHT * (elapsed - self.service_time)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'max_queue': self.max_queue,
+                'max_wait': self.max_wait,
+                'active': self.active,
+                'queue_depth': len(self._waiting),
+                'admitted': self.admitted,
+                'rejected': {
+                    'queue_full': self.rejected_full,
+                    'timeout': self.rejected_timeout,
+                    'duplicate': self.rejected_duplicate,
+                },
+                'avg_service_time': round(self.service_time, 3),
+                'max_wait_seen': round(self.max_wait_seen, 3),
+            }
+
+
+# Process-wide instance dipakai app.py
+admission = AdmissionController()
+
+
+def busy_response(error):
+    """429/503 with Retry-After and the queue position, for clients to back off"""
+    response = jsonify({
+        'success': False,
+        'busy': True,
+        'message': str(error),
+        'queue_position': error.position,
+        'retry_after': error.retry_after
+    })
+    response.status_code = error.status_code
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def face_unavailable_response(error):
+    """503 (verification queue full) / 504 (verification timed out) with Retry-After"""
+    response = jsonify({
+        'success': False,
+        'busy': True,
+        'message': str(error),
+        'retry_after': FACE_RETRY_AFTER
+    })
+    response.status_code = 504 if isinstance(error, FaceServiceTimeout) else 503
+    response.headers['Retry-After'] = str(FACE_RETRY_AFTER)
+    return response
+
+
+def admission_controlled(f=None, per_user=True):
+    """Decorator: run the view only after admission grants a slot
+
+    per_user=False for shared devices (kiosk tablets logged in as admin): taps of
+    different students are not treated as duplicate requests of one user.
+    """
+    if f is None:
+        return lambda f: admission_controlled(f, per_user)
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        try:
+            ticket = admission.acquire(session.get('user_id') if per_user else None)
+        except AdmissionRejected as e:
+            return busy_response(e)
+
+        g.admission_ticket = ticket
+        try:
+            return f(*args, **kwargs)
+        finally:
+            # Mode async memindahkan ticket ke job verifikasi (lihat app.run_face_verification)
+            ticket = g.pop('admission_ticket', None)
+            if ticket is not None:
+                admission.release(ticket)
+    return decorated_function
@@ -1,38 +1,69 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, Request, render_template, request, redirect, url_for, session, flash, jsonify, g
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
-import sqlite3
 import os
 from datetime import datetime
 import uuid
 import json
+import hmac
+import hashlib
 import numpy as np  
-import pandas as pd
 from io import BytesIO
 from flask import send_file
 from datetime import datetime, timedelta
 import tempfile
-
-
-# Face recognition imports (optional)
-try:
-    import cv2
-    import face_recognition
-    FACE_RECOGNITION_AVAILABLE = True
-except ImportError:
-    FACE_RECOGNITION_AVAILABLE = False
+import glob
+import shutil
+import threading
+import time
+
+
+# Face recognition libraries (optional). Only check they are installed: cv2/dlib are
+# imported lazily by face_pipeline inside the face worker processes
+import importlib.util
+FACE_RECOGNITION_AVAILABLE = all(
+    importlib.util.find_spec(name) is not None for name in ('cv2', 'face_recognition')
+)
+if not FACE_RECOGNITION_AVAILABLE:
     print("Warning: Face recognition libraries not installed. Install with:")
     print("pip install opencv-python face_recognition")
 
 # Import custom modules
 from register_web import init_web_registration
+from db import get_connection, init_app as init_db_pool
+from face_cache import (face_cache, sample_distance, as_samples, FACE_MATCH_STRATEGY, FACE_MATCH_THRESHOLD,
+                        FACE_MAX_SAMPLES)
+from face_codec import encode_encoding, decode_encoding
+from face_service import face_service, FaceServiceBusy, FaceServiceTimeout
+from geofence import (POLYGON_MAX_RADIUS, circle_bounds, decode_polygon, encode_polygon, ensure_schema,
+                      geofence, parse_polygon, polygon_zone)
+from idempotency import idempotency, valid_key, ensure_schema as ensure_idempotency_schema
+from admission import admission, admission_controlled, face_unavailable_response
+from attendance_log import attendance_log, ensure_schema as ensure_log_schema
+import daily_summary
+from work_time import seconds_of_day, ensure_schema as ensure_work_time_schema
+import archive
+from cache_version import ensure_schema as ensure_cache_version_schema
+from user_import import (IMPORT_HTTP_MAX_ROWS, ImportFileError, import_users, import_job, start_import_job,
+                         read_file as read_import_file, ensure_schema as ensure_import_schema)
+
+class InMemoryUploadRequest(Request):
+    """Keep uploaded files in memory (bounded by MAX_CONTENT_LENGTH) instead of spooling to temp files"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
 
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Ganti dengan secret key yang aman
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['FACES_FOLDER'] = 'faces'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Preload default untuk create_app() (mis. di gunicorn: FACE_PRELOAD=1 gunicorn 'app:create_app()')
+FACE_PRELOAD = os.environ.get('FACE_PRELOAD', '0') == '1'
+FACE_WARM_UP = os.environ.get('FACE_WARM_UP', '0') == '1'
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -40,10 +71,8 @@ def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect('database.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get pooled database connection (close() returns it to the pool)"""
+    return get_connection()
 
 def login_required(f):
     """Decorator to require login for routes"""
@@ -55,52 +84,224 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Kiosk 1:N: jarak ke user terdekat kedua harus lebih jauh minimal sebesar ini
+KIOSK_MATCH_MARGIN = 0.05
+
+# Sampel enrollment yang lebih jauh dari ini ke sampel lain dianggap orang berbeda
+FACE_SAMPLE_CONSISTENCY = 0.6
+
+def match_face(stored_encoding, face_encodings):
+    """Compare encodings found in an uploaded photo with the stored sample(s)"""
+    if not face_encodings:
+        return False, "Wajah tidak terdeteksi."
+    
+    if len(face_encodings) > 1:
+        return False, "Terdeteksi lebih dari satu wajah!"
+    
+    face_distance = sample_distance(stored_encoding, face_encodings[0], FACE_MATCH_STRATEGY)
+    
+    if face_distance < FACE_MATCH_THRESHOLD:
+        confidence = (1 - face_distance) * 100
+        return True, f"Wajah terverifikasi! Akurasi: {confidence:.1f}%"
+    else:
+        return False, f"Wajah tidak dikenali."
+
 def verify_face_for_attendance(image_file, user_id):
-    """Verify face for attendance"""
+    """Verify face for attendance
+    
+    (False, message) only means the face was rejected. Errors (FaceServiceBusy/Timeout,
+    a crashed worker) are raised so the route answers 503/504/500 and the tap can be retried.
+    """
     if not FACE_RECOGNITION_AVAILABLE:
         return True, "Face recognition not available, skipping verification"
     
+    # Get stored face encoding (cached, lihat face_cache.py)
+    stored_encoding = face_cache.get(user_id)
+    
+    if stored_encoding is None:
+        # No face data stored, allow attendance but warn
+        return True, "No face data registered, attendance allowed"
+    
+    # Encode uploaded image in the worker pool (lihat face_service.py)
+    face_encodings = face_service.encode(image_file)
+    
+    return match_face(stored_encoding, face_encodings)
+
+def save_photo(photo_bytes, photo_path):
+    """Persist an attendance photo (only called after verification succeeded)"""
+    with open(photo_path, 'wb') as f:
+        f.write(photo_bytes)
+
+def extra_sample_photos(photo_path):
+    """Extra enrollment photos stored next to photo_path ({id}_face_2.jpg, {id}_face_a<attendance_id>.jpg)"""
+    if not photo_path:
+        return []
+    base, ext = os.path.splitext(photo_path)
+    return glob.glob(f"{glob.escape(base)}_*{glob.escape(ext)}")
+
+def remove_photo(photo_path):
+    """Delete an attendance photo whose record could not be written"""
+    if photo_path and os.path.exists(photo_path):
+        try:
+            os.remove(photo_path)
+        except OSError:
+            pass
+
+def run_face_verification(photo_bytes, photo_path, user_id, finalize, on_rejected=None):
+    """Verify the in-memory attendance photo, then save it and call finalize(face_message)
+    
+    The photo is only written to photo_path once the face matched, rejected faces never
+    touch the disk (on_rejected(message) is called instead; not for FaceServiceBusy/Timeout
+    or worker errors, which propagate). Returns (result_dict, status_code).
+    With form field mode=async the verification is queued instead and the client polls
+    /api/verify/status/<job_id>.
+    """
+    if not FACE_RECOGNITION_AVAILABLE:
+        save_photo(photo_bytes, photo_path)
+        return finalize(""), 200
+    
+    stored_encoding = face_cache.get(user_id)
+    
+    if request.form.get('mode') == 'async' and stored_encoding is not None:
+        def on_done(face_encodings):
+            face_verified, face_message = match_face(stored_encoding, face_encodings)
+            if not face_verified:
+                if on_rejected:
+                    on_rejected(face_message)
+                return {'success': False, 'message': face_message}
+            save_photo(photo_bytes, photo_path)
+            return finalize(face_message)
+        
+        # Slot admission ikut job: baru dilepas setelah verifikasi di worker selesai
+        ticket = g.get('admission_ticket')
+        replay_key = g.get('idempotency_key')
+        
+        def on_settled(job):
+            try:
+                if replay_key:
+                    # Hasil akhir ke idempotency_keys: retry/poll di worker lain tidak butuh job ini
+                    store_job_outcome(*replay_key, job)
+            finally:
+                if ticket:
+                    admission.release(ticket)
+        
+        job_id = face_service.submit_encode(photo_bytes, on_done, owner=user_id, on_settled=on_settled)
+        g.pop('admission_ticket', None)
+        return {
+            'success': True,
+            'pending': True,
+            'job_id': job_id,
+            'status_url': url_for('api_verify_status', job_id=job_id)
+        }, 202
+    
+    face_verified, face_message = verify_face_for_attendance(photo_bytes, user_id)
+    if not face_verified:
+        if on_rejected:
+            on_rejected(face_message)
+        return {'success': False, 'message': f'{face_message}'}, 200
+    
+    save_photo(photo_bytes, photo_path)
+    return finalize(face_message), 200
+
+def request_meta():
+    """ip_address / device_info of the current request for attendance_logs (captured in the request thread)"""
+    return {
+        'ip_address': request.remote_addr,
+        'device_info': (request.user_agent.string or '')[:255] or None
+    }
+
+def log_rejected(user_id, action, latitude, longitude, meta):
+    """Callback that records a failed attempt (face rejected, out of area) in attendance_logs"""
+    def on_rejected(message):
+        attendance_log.log(user_id, action, success=False, latitude=latitude, longitude=longitude,
+                           error_message=message, **meta)
+    return on_rejected
+
+def attendance_state(user_id, today):
+    """User name/class plus today's attendance row in one query (None if the user does not exist)"""
+    conn = get_db_connection()
+    row = conn.execute(
+        '''SELECT u.id, u.full_name, u.active, COALESCE(c.name, 'Tidak ada kelas') AS class_name,
+                  a.id AS attendance_id, a.time_in, a.time_out
+           FROM users u
+           LEFT JOIN classes c ON u.class_id = c.id
+           LEFT JOIN attendance a ON a.user_id = u.id AND a.date = ?
+           WHERE u.id = ?''',
+        (today, user_id)
+    ).fetchone()
+    conn.close()
+    return row
+
+def record_check_in(user_id, today, now, latitude, longitude, photo_path, face_message, meta=None):
+    """Insert the check-in row (and bump daily_summary) in one short write transaction, log write-behind"""
+    conn = get_db_connection()
     try:
-        # Get stored face encoding from database
-        conn = get_db_connection()
-        face_data = conn.execute(
-            'SELECT face_encoding FROM face_data WHERE user_id = ? AND active = 1',
-            (user_id,)
+        conn.execute('BEGIN IMMEDIATE')
+        daily_summary.ensure_day(conn, today)
+        # Dua tap bersamaan: yang kalah tidak kena IntegrityError, cukup tidak menulis apa-apa
+        cursor = conn.execute(
+            '''INSERT INTO attendance (user_id, date, time_in, time_in_sec, latitude, longitude, photo_path)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(user_id, date) DO NOTHING''',
+            (user_id, today, now, seconds_of_day(now), latitude, longitude, photo_path)
+        )
+        if cursor.rowcount == 0:
+            conn.rollback()
+            remove_photo(photo_path)
+            return {'success': False, 'message': 'Anda sudah absen hari ini!'}
+        daily_summary.check_in(conn, user_id, today)
+        conn.commit()
+    finally:
+        conn.close()
+
+    attendance_log.log(user_id, 'check_in', latitude=latitude, longitude=longitude, **(meta or {}))
+
+    return {
+        'success': True,
+        'message': f'Absen masuk berhasil! {face_message}'
+    }
+
+def record_check_out(user, today, now, latitude, longitude, photo_path, face_message, meta=None):
+    """Set today's check-out (only if there is none yet) in one write transaction, log write-behind"""
+    conn = get_db_connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        out_sec = seconds_of_day(now)
+        attendance = conn.execute(
+            '''UPDATE attendance SET time_out = ?, time_out_sec = ?, work_minutes = (? - time_in_sec) / 60,
+                      latitude_out = ?, longitude_out = ?, photo_path_out = ?
+               WHERE user_id = ? AND date = ? AND time_out IS NULL
+               RETURNING id, time_in''',
+            (now, out_sec, out_sec, latitude, longitude, photo_path, user['id'], today)
         ).fetchone()
+        if attendance is None:
+            conn.rollback()
+            remove_photo(photo_path)
+            return {'success': False, 'message': 'Anda sudah absen keluar hari ini!'}
+        daily_summary.check_out(conn, user['id'], today)
+        conn.commit()
+    finally:
         conn.close()
-        
-        if not face_data:
-            # No face data stored, allow attendance but warn
-            return True, "No face data registered, attendance allowed"
-        
-        # Load stored encoding
-        stored_encoding = np.array(json.loads(face_data[0]))
-        
-        # Process uploaded image
-        image = face_recognition.load_image_file(image_file)
-        face_encodings = face_recognition.face_encodings(image)
-        
-        if not face_encodings:
-            return False, "Wajah tidak terdeteksi."
-        
-        if len(face_encodings) > 1:
-            return False, "Terdeteksi lebih dari satu wajah!"
-        
-        # Compare faces
-        matches = face_recognition.compare_faces([stored_encoding], face_encodings[0])
-        face_distance = face_recognition.face_distance([stored_encoding], face_encodings[0])
-        
-        # Threshold for face matching (lower = more strict)
-        threshold = 0.4
-        
-        if matches[0] and face_distance[0] < threshold:
-            confidence = (1 - face_distance[0]) * 100
-            return True, f"Wajah terverifikasi! Akurasi: {confidence:.1f}%"
-        else:
-            return False, f"Wajah tidak dikenali."
-            
-    except Exception as e:
-        return False, f"Error verifying face: {str(e)}"
+
+    attendance_log.log(user['id'], 'check_out', latitude=latitude, longitude=longitude, **(meta or {}))
+
+    # Calculate duration
+    time_in = datetime.strptime(attendance['time_in'], '%H:%M:%S')
+    time_out = datetime.strptime(now, '%H:%M:%S')
+    duration_seconds = (time_out - time_in).total_seconds()
+    hours = int(duration_seconds // 3600)
+    minutes = int((duration_seconds % 3600) // 60)
+    duration_text = f"{hours} jam {minutes} menit"
+
+    return {
+        'success': True, 
+        'message': f'Absen keluar berhasil! {face_message}',
+        'user_name': user['full_name'],
+        'class_name': user['class_name'],
+        'time_in': attendance['time_in'],
+        'time_out': now,
+        'duration': duration_text
+    }
 
 def cleanup_old_attendance_photos(days_to_keep=7):
     """
@@ -172,7 +373,7 @@ def absensi():
     coordinates_rows = conn.execute('SELECT * FROM coordinates WHERE active = 1').fetchall()
     
     # Convert Row objects to dict untuk JSON serialization
-    coordinates = [dict(row) for row in coordinates_rows]
+    coordinates = [coordinate_dict(row) for row in coordinates_rows]
     
     # Check if user has face recognition enabled
     face_enabled = conn.execute(
@@ -202,238 +403,694 @@ def haversine(lat1, lon1, lat2, lon2):
     a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
     return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1-a)))
 
+def locate_site(latitude, longitude):
+    """Nearest active attendance site for a position, see geofence.py (None if there are no sites)"""
+    return geofence.locate(latitude, longitude)
+
+def out_of_area(site, message):
+    """Response dict for a position outside every active area"""
+    if site and site.get('shape') == 'polygon':
+        message = f"{message} Lokasi terdekat: {site['name']} ({site['outside_by']:.0f} m di luar batas area)"
+    elif site:
+        message = f"{message} Lokasi terdekat: {site['name']} ({site['distance']:.0f} m, radius {site['radius']:.0f} m)"
+    return {'success': False, 'message': message, 'nearest_site': site}
+
+# Browser boleh pakai snapshot zona selama ini tanpa revalidate
+OFFICE_COORDINATES_MAX_AGE = 60
+
+@app.route('/api/office-coordinates', methods=['GET'])
+@login_required
+def api_office_coordinates():
+    """Active attendance zones for the client-side pre-check (ETag / 304 aware)"""
+    snapshot = geofence.zones()
+    zones = snapshot['zones']
+
+    response = jsonify({
+        'success': True,
+        'version': snapshot['version'],
+        'zones': zones,
+        # Zona pertama, untuk client lama yang hanya membaca satu lokasi
+        'coordinates': zones[0] if zones else None
+    })
+    response.set_etag(snapshot['version'])
+    response.headers['Cache-Control'] = f'private, max-age={OFFICE_COORDINATES_MAX_AGE}'
+    return response.make_conditional(request)
+
+def job_outcome(job):
+    """(status_code, result) of a finished async verification job"""
+    result = {**job['result'], 'job_id': job['id'], 'status': job['status'], 'pending': False}
+    return (200 if job['status'] == 'done' else 500), result
+
+def store_job_outcome(user_id, key, endpoint, job):
+    """Replace the stored 202 of an Idempotency-Key with the finished job's outcome"""
+    status_code, result = job_outcome(job)
+    if job['status'] == 'done':
+        idempotency.complete(user_id, key, endpoint, status_code, result)
+    else:
+        # Verifikasi gagal karena error, bukan ditolak: key dibuang supaya tap bisa diulang
+        idempotency.discard(user_id, key)
+
+def replay_outcome(user_id, key, entry):
+    """Response for a repeated Idempotency-Key (the job stores its own final outcome)"""
+    status_code, result = entry['status_code'], entry['response']
+
+    if status_code == 202 and result.get('job_id'):
+        # Job di proses ini yang baru selesai tapi belum sempat menulis hasilnya
+        job = face_service.job_status(result['job_id'])
+        if job and job['status'] != 'pending':
+            status_code, result = job_outcome(job)
+
+    response = jsonify(result)
+    response.status_code = status_code
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def idempotent(f):
+    """Decorator: replay the stored outcome of a repeated Idempotency-Key (header or form field)"""
+    from functools import wraps
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+        if not key:
+            return f(*args, **kwargs)
+        if not valid_key(key):
+            return jsonify({'success': False, 'message': 'Idempotency-Key tidak valid'}), 400
+
+        user_id = session['user_id']
+        state, entry = idempotency.begin(user_id, key, request.endpoint)
+        g.idempotency_key = (user_id, key, request.endpoint)
+
+        if state == 'done':
+            return replay_outcome(user_id, key, entry)
+        if state == 'conflict':
+            return jsonify({'success': False, 'message': 'Idempotency-Key sudah dipakai untuk request lain'}), 422
+        if state == 'pending':
+            response = jsonify({
+                'success': False,
+                'pending': True,
+                'message': 'Absensi sebelumnya masih diproses, tunggu sebentar...'
+            })
+            response.status_code = 409
+            response.headers['Retry-After'] = '2'
+            return response
+
+        try:
+            response = app.make_response(f(*args, **kwargs))
+        except Exception:
+            idempotency.release(user_id, key)
+            raise
+
+        # Error server (500, 503 antrian penuh, 504 timeout) dan 429 boleh dicoba ulang dengan key
+        # yang sama; yang disimpan hanya hasil final (berhasil atau ditolak, mis. wajah tidak cocok)
+        if response.status_code >= 500 or response.status_code == 429 or not response.is_json:
+            idempotency.release(user_id, key)
+        else:
+            idempotency.complete(user_id, key, request.endpoint, response.status_code, response.get_json())
+        return response
+    return decorated_function
 
 @app.route('/absen_masuk', methods=['POST'])
 @login_required
+@idempotent
+@admission_controlled
 def absen_masuk():
     """Clock in endpoint with mandatory face verification"""
     try:
         latitude = float(request.form.get('latitude', 0))
         longitude = float(request.form.get('longitude', 0))
-        
-        conn = get_db_connection()
+
+        user_id = session['user_id']
         today = datetime.now().strftime("%Y-%m-%d")
         now = datetime.now().strftime("%H:%M:%S")
 
-        # ✅ CEK WAJIB: User harus sudah setup face recognition
-        face_enabled = conn.execute(
-            'SELECT COUNT(*) FROM face_data WHERE user_id = ? AND active = 1',
-            (session['user_id'],)
-        ).fetchone()[0] > 0
-        
-        if not face_enabled:
-            conn.close()
+        # ✅ CEK WAJIB: User harus sudah setup face recognition (dari face_cache)
+        if face_cache.get(user_id) is None:
             return jsonify({
-                'success': False, 
+                'success': False,
                 'message': 'Anda harus setup Face Recognition terlebih dahulu di menu Profil!',
                 'require_face_setup': True
             })
 
-        # Validasi lokasi
-        coordinates = conn.execute('SELECT * FROM coordinates WHERE active = 1').fetchall()
-        in_area = False
-        for coord in coordinates:
-            distance = haversine(latitude, longitude, coord['latitude'], coord['longitude'])
-            if distance <= coord['radius']:
-                in_area = True
-                break
-
-        if not in_area:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Anda berada di luar area absensi!'})
-
-        # Cek sudah absen masuk
-        existing = conn.execute(
-            'SELECT id FROM attendance WHERE user_id = ? AND date = ?',
-            (session['user_id'], today)
-        ).fetchone()
-        
-        if existing:
-            conn.close()
+        # Validasi lokasi (snapshot koordinat aktif di memori)
+        meta = request_meta()
+        site = locate_site(latitude, longitude)
+        if not site or not site['inside']:
+            result = out_of_area(site, 'Anda berada di luar area absensi!')
+            log_rejected(user_id, 'check_in', latitude, longitude, meta)(result['message'])
+            return jsonify(result)
+
+        # Cek cepat sudah absen masuk, yang menentukan tetap ON CONFLICT di record_check_in
+        state = attendance_state(user_id, today)
+        if state and state['attendance_id']:
             return jsonify({'success': False, 'message': 'Anda sudah absen hari ini!'})
 
         # ✅ WAJIB: Foto untuk face recognition
         if 'photo' not in request.files:
-            conn.close()
             return jsonify({
-                'success': False, 
+                'success': False,
                 'message': 'Foto wajib diperlukan untuk verifikasi identitas!'
             })
-        
+
         file = request.files['photo']
         if not file or not allowed_file(file.filename):
-            conn.close()
             return jsonify({
-                'success': False, 
+                'success': False,
                 'message': 'File foto tidak valid!'
             })
-        
-        # Save photo
-        filename = f"{session['user_id']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(photo_path)
-        
-        # ✅ Verifikasi wajah (WAJIB jika face recognition available)
-        if FACE_RECOGNITION_AVAILABLE:
-            face_verified, face_message = verify_face_for_attendance(photo_path, session['user_id'])
-            if not face_verified:
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
-                conn.close()
-                return jsonify({'success': False, 'message': f'{face_message}'})
-        else:
-            # Jika library tidak tersedia, tetap izinkan tapi log warning
-            face_message = "Face recognition library not available"
-        
-        conn.execute(
-            '''INSERT INTO attendance (user_id, date, time_in, latitude, longitude, photo_path)
-               VALUES (?, ?, ?, ?, ?, ?)''',
-            (session['user_id'], today, now, latitude, longitude, photo_path)
-        )
 
-        conn.execute(
-            '''INSERT INTO attendance_logs (user_id, action, latitude, longitude, success)
-               VALUES (?, ?, ?, ?, ?)''',
-            (session['user_id'], 'check_in', latitude, longitude, 1)
+        # Foto diverifikasi dari memori, baru disimpan ke disk kalau wajah cocok
+        filename = f"{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        photo_bytes = file.read()
+
+        # ✅ Verifikasi wajah (WAJIB jika face recognition available), lalu simpan absen
+        result, status = run_face_verification(
+            photo_bytes, photo_path, user_id,
+            lambda face_message: record_check_in(user_id, today, now, latitude, longitude, photo_path,
+                                                 face_message, meta),
+            on_rejected=log_rejected(user_id, 'check_in', latitude, longitude, meta)
         )
-
-        conn.commit()
-        conn.close()
-        
-        return jsonify({
-            'success': True, 
-            'message': f'Absen masuk berhasil! {face_message if FACE_RECOGNITION_AVAILABLE else ""}'
-        })
+        result['nearest_site'] = site
+        return jsonify(result), status
         
+    except (FaceServiceBusy, FaceServiceTimeout) as e:
+        return face_unavailable_response(e)
     except Exception as e:
-        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
     
     
 @app.route('/absen_keluar', methods=['POST'])
 @login_required
+@idempotent
+@admission_controlled
 def absen_keluar():
     """Clock out endpoint with mandatory face verification"""
     try:
         latitude = float(request.form.get('latitude', 0))
         longitude = float(request.form.get('longitude', 0))
 
-        conn = get_db_connection()
+        user_id = session['user_id']
         today = datetime.now().strftime("%Y-%m-%d")
         now = datetime.now().strftime("%H:%M:%S")
 
-        # ✅ CEK WAJIB: User harus sudah setup face recognition
-        face_enabled = conn.execute(
-            'SELECT COUNT(*) FROM face_data WHERE user_id = ? AND active = 1',
-            (session['user_id'],)
-        ).fetchone()[0] > 0
-        
-        if not face_enabled:
-            conn.close()
+        # ✅ CEK WAJIB: User harus sudah setup face recognition (dari face_cache)
+        if face_cache.get(user_id) is None:
             return jsonify({
-                'success': False, 
+                'success': False,
                 'message': 'Anda harus setup Face Recognition terlebih dahulu di menu Profil!',
                 'require_face_setup': True
             })
 
-        # Get user info
-        user = conn.execute(
-            'SELECT u.*, COALESCE(c.name, "Tidak ada kelas") as class_name FROM users u LEFT JOIN classes c ON u.class_id = c.id WHERE u.id = ?',
-            (session['user_id'],)
-        ).fetchone()
+        # User info + absen hari ini dalam satu query
+        user = attendance_state(user_id, today)
 
-        attendance = conn.execute(
-            'SELECT id, time_in, time_out FROM attendance WHERE user_id = ? AND date = ?',
-            (session['user_id'], today)
-        ).fetchone()
-
-        if not attendance:
-            conn.close()
+        if not user or not user['attendance_id']:
             return jsonify({'success': False, 'message': 'Anda belum absen masuk hari ini!'})
 
-        if attendance['time_out']:
-            conn.close()
+        if user['time_out']:
             return jsonify({'success': False, 'message': 'Anda sudah absen keluar hari ini!'})
 
-        # Validasi lokasi
-        coordinates = conn.execute('SELECT * FROM coordinates WHERE active = 1').fetchall()
-        in_area = False
-        for coord in coordinates:
-            distance = haversine(latitude, longitude, coord['latitude'], coord['longitude'])
-            if distance <= coord['radius']:
-                in_area = True
-                break
-                
-        if not in_area:
-            conn.close()
-            return jsonify({'success': False, 'message': 'Anda berada di luar area absensi!'})
+        # Validasi lokasi (snapshot koordinat aktif di memori)
+        meta = request_meta()
+        site = locate_site(latitude, longitude)
+        if not site or not site['inside']:
+            result = out_of_area(site, 'Anda berada di luar area absensi!')
+            log_rejected(user_id, 'check_out', latitude, longitude, meta)(result['message'])
+            return jsonify(result)
 
         # ✅ WAJIB: Foto untuk face recognition
         if 'photo' not in request.files:
-            conn.close()
             return jsonify({
-                'success': False, 
+                'success': False,
                 'message': 'Foto wajib diperlukan untuk verifikasi identitas!'
             })
-        
+
         file = request.files['photo']
         if not file or not allowed_file(file.filename):
-            conn.close()
             return jsonify({
-                'success': False, 
+                'success': False,
                 'message': 'File foto tidak valid!'
             })
-        
-        filename = f"{session['user_id']}_keluar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(photo_path)
-        
-        # ✅ Verifikasi wajah (WAJIB)
-        if FACE_RECOGNITION_AVAILABLE:
-            face_verified, face_message = verify_face_for_attendance(photo_path, session['user_id'])
-            if not face_verified:
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
-                conn.close()
-                return jsonify({'success': False, 'message': f'{face_message}'})
-        else:
-            face_message = "Face recognition library not available"
 
-        conn.execute(
-            'UPDATE attendance SET time_out = ?, latitude_out = ?, longitude_out = ?, photo_path_out = ? WHERE id = ?',
-            (now, latitude, longitude, photo_path, attendance['id'])
+        filename = f"{user_id}_keluar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        photo_bytes = file.read()
+
+        # ✅ Verifikasi wajah (WAJIB), lalu simpan absen keluar
+        result, status = run_face_verification(
+            photo_bytes, photo_path, user_id,
+            lambda face_message: record_check_out(user, today, now, latitude, longitude, photo_path,
+                                                  face_message, meta),
+            on_rejected=log_rejected(user_id, 'check_out', latitude, longitude, meta)
         )
+        result['nearest_site'] = site
+        return jsonify(result), status
 
-        conn.execute(
-            '''INSERT INTO attendance_logs (user_id, action, latitude, longitude, success)
-               VALUES (?, ?, ?, ?, ?)''',
-            (session['user_id'], 'check_out', latitude, longitude, 1)
-        )
+    except (FaceServiceBusy, FaceServiceTimeout) as e:
+        return face_unavailable_response(e)
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
+@app.route('/api/verify/status/<job_id>', methods=['GET'])
+@login_required
+def api_verify_status(job_id):
+    """Poll the result of an async face verification job"""
+    job = face_service.job_status(job_id)
+    if not job or job['owner'] != session['user_id']:
+        # Job milik worker lain: hasilnya tersimpan di idempotency_keys (request dengan key)
+        stored = idempotency.job_outcome(session['user_id'], job_id)
+        if stored is None:
+            return jsonify({'success': False, 'status': 'unknown', 'message': 'Job verifikasi tidak ditemukan'}), 404
+        status_code, result = stored
+        if status_code == 202:
+            return jsonify({'success': True, 'status': 'pending', 'pending': True})
+        return jsonify(result)
+    
+    if job['status'] == 'pending':
+        return jsonify({'success': True, 'status': 'pending', 'pending': True})
+    
+    return jsonify({**job['result'], 'status': job['status'], 'pending': False})
+
+# Offline mode: absensi.html menyimpan percobaan absen di IndexedDB lalu mengirim sekaligus
+OFFLINE_BATCH_MAX = 20
+# Antrian offline lebih lama dari ini ditolak (foto / lokasi sudah tidak bisa dipercaya)
+OFFLINE_MAX_AGE = timedelta(hours=48)
+# Toleransi jam HP yang sedikit lebih cepat dari server
+OFFLINE_CLOCK_SKEW = timedelta(minutes=5)
+OFFLINE_ACTIONS = ('check_in', 'check_out')
+# Riwayat pemberian key disimpan selama antrian offline masih bisa dikirim (+ key untuk besok)
+OFFLINE_KEY_RETENTION = OFFLINE_MAX_AGE + timedelta(days=1)
+
+# Setiap pemberian key dicatat per perangkat (session browser): key hanya sah untuk waktu absen
+# sejak key itu diberikan sampai perangkat yang sama online lagi dan mengambil key baru
+OFFLINE_KEY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS offline_key_issues (
+        user_id INTEGER NOT NULL,
+        device TEXT NOT NULL,
+        issued_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, device, issued_at)
+    )
+'''
+
+def ensure_offline_schema(conn):
+    """Create the offline_key_issues table on databases that predate it"""
+    conn.execute(OFFLINE_KEY_SCHEMA)
+    conn.commit()
+
+def offline_key(user_id, day, key_id):
+    """Per-user, per-day HMAC key the browser signs queued attendance attempts with
+
+    key_id ('<device>.<issued unix time>') is part of the key, so a signature also proves
+    which issue the item was signed with.
+    """
+    message = f'offline:{user_id}:{day}:{key_id}'.encode()
+    return hmac.new(app.config['SECRET_KEY'].encode(), message, hashlib.sha256).hexdigest()
+
+def offline_key_window(user_id, key_id):
+    """(issued, superseded) of a signing key: superseded is when the same device fetched a newer
+    key (it was online again), None while it has not"""
+    device, _, issued = key_id.partition('.')
+    if not device or not issued.isdigit():
+        raise ValueError('Key absen offline tidak valid')
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            'SELECT MIN(issued_at) FROM offline_key_issues WHERE user_id = ? AND device = ? AND issued_at > ?',
+            (user_id, device, int(issued))
+        ).fetchone()
+    finally:
+        conn.close()
+    return datetime.fromtimestamp(int(issued)), (datetime.fromtimestamp(row[0]) if row[0] is not None else None)
+
+def offline_signature(key, item, photo_bytes):
+    """HMAC over the raw fields the client sent, must match signItem() in absensi.html"""
+    payload = '|'.join([
+        item['action'], item['timestamp'], item['latitude'], item['longitude'],
+        hashlib.sha256(photo_bytes).hexdigest()
+    ])
+    return hmac.new(key.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+def offline_meta():
+    """request_meta() without a missing user agent showing up as 'None' in device_info"""
+    meta = request_meta()
+    meta['device_info'] = meta['device_info'] or ''
+    return meta
+
+def offline_coordinate(item, key):
+    """Latitude/longitude of a queued item for logging, None if it is not a number"""
+    try:
+        return float(item.get(key))
+    except (TypeError, ValueError):
+        return None
+
+def parse_offline_item(item, user_id, server_now):
+    """Validate one queued attempt, returns a dict for the batch or raises ValueError(message)"""
+    if not isinstance(item, dict) or not all(isinstance(item.get(k), str) for k in
+                                             ('action', 'timestamp', 'latitude', 'longitude', 'signature')):
+        raise ValueError('Data absen offline tidak lengkap')
+    if not isinstance(item.get('key_id'), str):
+        # Ditandatangani key lama yang tidak terikat waktu pemberian: tidak bisa dibatasi lagi
+        raise ValueError('Absen offline dari versi aplikasi lama, silakan absen ulang')
+    if item['action'] not in OFFLINE_ACTIONS:
+        raise ValueError('Jenis absen tidak dikenal')
+
+    try:
+        when = datetime.strptime(item['timestamp'], '%Y-%m-%d %H:%M:%S')
+        latitude, longitude = float(item['latitude']), float(item['longitude'])
+    except ValueError:
+        raise ValueError('Format waktu atau lokasi tidak valid')
+    if when > server_now + OFFLINE_CLOCK_SKEW:
+        raise ValueError('Waktu absen ada di masa depan, periksa jam HP Anda')
+    if when < server_now - OFFLINE_MAX_AGE:
+        raise ValueError('Absen offline sudah kadaluarsa')
+
+    file = request.files.get(f"photo_{item.get('id')}")
+    if not file or not allowed_file(file.filename):
+        raise ValueError('Foto wajib diperlukan untuk verifikasi identitas!')
+    photo_bytes = file.read()
+
+    # Key diturunkan dari tanggal absen, jadi item hanya sah untuk hari key itu diberikan
+    expected = offline_signature(offline_key(user_id, when.strftime('%Y-%m-%d'), item['key_id']), item, photo_bytes)
+    if not hmac.compare_digest(expected, item['signature']):
+        raise ValueError('Tanda tangan data absen tidak valid')
+    
+    # Jam absen harus jatuh saat perangkat memang offline: setelah key diambil dan sebelum
+    # perangkat itu online lagi (mengambil key baru)
+    issued, superseded = offline_key_window(user_id, item['key_id'])
+    if when < issued - OFFLINE_CLOCK_SKEW:
+        raise ValueError('Waktu absen lebih awal dari key offline perangkat ini')
+    if superseded is not None and when > superseded + OFFLINE_CLOCK_SKEW:
+        raise ValueError('Waktu absen setelah perangkat ini online lagi, absen langsung saat online')
+
+    site = locate_site(latitude, longitude)
+    if not site or not site['inside']:
+        raise ValueError(out_of_area(site, 'Lokasi di luar area absensi!')['message'])
+
+    return {
+        'id': item.get('id'),
+        'action': item['action'],
+        'when': when,
+        'latitude': latitude,
+        'longitude': longitude,
+        'photo_bytes': photo_bytes,
+    }
+
+def write_offline_batch(user_id, entries, results):
+    """Insert verified attempts (oldest first) and their daily_summary counts in one write transaction
+
+    A re-sent item whose time is already stored counts as success, so a flush that lost
+    its response can simply be repeated.
+    """
+    conn = get_db_connection()
+    saved = []
+    logs = []
+    sent = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for entry in sorted(entries, key=lambda e: e['when']):
+            day = entry['when'].strftime('%Y-%m-%d')
+            clock = entry['when'].strftime('%H:%M:%S')
+            check_in = entry['action'] == 'check_in'
+            filename = f"{user_id}_{'' if check_in else 'keluar_'}{entry['when'].strftime('%Y%m%d_%H%M%S')}.jpg"
+            photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            daily_summary.ensure_day(conn, day)
+
+            if check_in:
+                written = conn.execute(
+                    '''INSERT INTO attendance (user_id, date, time_in, time_in_sec, latitude, longitude, photo_path, notes)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(user_id, date) DO NOTHING
+                       RETURNING id''',
+                    (user_id, day, clock, seconds_of_day(clock), entry['latitude'], entry['longitude'], photo_path,
+                     f'offline masuk (dikirim {sent})')
+                ).fetchone()
+            else:
+                out_sec = seconds_of_day(clock)
+                written = conn.execute(
+                    '''UPDATE attendance SET time_out = ?, time_out_sec = ?, work_minutes = (? - time_in_sec) / 60,
+                              latitude_out = ?, longitude_out = ?, photo_path_out = ?,
+                              notes = COALESCE(notes || '; ', '') || ?
+                       WHERE user_id = ? AND date = ? AND time_out IS NULL AND time_in <= ?
+                       RETURNING id''',
+                    (clock, out_sec, out_sec, entry['latitude'], entry['longitude'], photo_path,
+                     f'offline keluar (dikirim {sent})', user_id, day, clock)
+                ).fetchone()
+
+            if written is None:
+                existing = conn.execute(
+                    'SELECT time_in, time_out FROM attendance WHERE user_id = ? AND date = ?', (user_id, day)
+                ).fetchone()
+                stored = existing and existing['time_in' if check_in else 'time_out']
+                if stored == clock:
+                    results[entry['index']] = {'success': True, 'message': 'Sudah tersimpan sebelumnya'}
+                elif check_in:
+                    results[entry['index']] = {'success': False, 'message': f'Sudah absen masuk tanggal {day}!'}
+                elif not existing:
+                    results[entry['index']] = {'success': False, 'message': f'Belum absen masuk tanggal {day}!'}
+                elif existing['time_out']:
+                    results[entry['index']] = {'success': False, 'message': f'Sudah absen keluar tanggal {day}!'}
+                else:
+                    results[entry['index']] = {'success': False, 'message': 'Waktu keluar lebih awal dari absen masuk'}
+                continue
+
+            if check_in:
+                daily_summary.check_in(conn, user_id, day)
+            else:
+                daily_summary.check_out(conn, user_id, day)
+            save_photo(entry['photo_bytes'], photo_path)
+            saved.append(photo_path)
+            logs.append(entry)
+            label = 'masuk' if check_in else 'keluar'
+            results[entry['index']] = {
+                'success': True,
+                'message': f"Absen {label} {day} {clock} tersimpan. {entry['face_message']}".strip()
+            }
         conn.commit()
+    except Exception:
+        conn.rollback()
+        for photo_path in saved:
+            remove_photo(photo_path)
+        raise
+    finally:
+        conn.close()
+
+    meta = offline_meta()
+    for entry in logs:
+        attendance_log.log(user_id, entry['action'], latitude=entry['latitude'], longitude=entry['longitude'],
+                           ip_address=meta['ip_address'],
+                           device_info=f"offline {entry['when'].strftime('%Y-%m-%d %H:%M:%S')} {meta['device_info']}".strip())
+
+@app.route('/api/offline/key', methods=['GET'])
+@login_required
+def api_offline_key():
+    """Signing keys for today and tomorrow, cached by the browser for offline attendance
+
+    Every call is recorded: it ends the validity of the keys this device fetched before.
+    """
+    user_id = session['user_id']
+    device = session.setdefault('offline_device', uuid.uuid4().hex[:16])
+    issued = int(time.time())
+    key_id = f'{device}.{issued}'
+    conn = get_db_connection()
+    try:
+        conn.execute('INSERT OR IGNORE INTO offline_key_issues (user_id, device, issued_at) VALUES (?, ?, ?)',
+                     (user_id, device, issued))
+        conn.execute('DELETE FROM offline_key_issues WHERE user_id = ? AND issued_at < ?',
+                     (user_id, issued - int(OFFLINE_KEY_RETENTION.total_seconds())))
+        conn.commit()
+    finally:
+        conn.close()
+    
+    today = datetime.now().date()
+    keys = {}
+    for offset in (0, 1):
+        day = (today + timedelta(days=offset)).strftime('%Y-%m-%d')
+        keys[day] = {'key': offline_key(user_id, day, key_id), 'key_id': key_id}
+    response = jsonify({'success': True, 'keys': keys})
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+@app.route('/api/attendance/batch', methods=['POST'])
+@login_required
+@admission_controlled
+def api_attendance_batch():
+    """Ingest queued offline attempts: verify signatures, batch face check, one transaction"""
+    user_id = session['user_id']
+    try:
+        items = json.loads(request.form.get('items', ''))
+    except ValueError:
+        items = None
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'message': 'Tidak ada data absen offline'}), 400
+    if len(items) > OFFLINE_BATCH_MAX:
+        return jsonify({'success': False, 'message': f'Maksimal {OFFLINE_BATCH_MAX} absen per kiriman'}), 400
+
+    # retry=False: item tidak akan pernah berhasil, client boleh membuangnya dari antrian
+    results = [{'success': False, 'message': '', 'retry': False} for _ in items]
+    stored_encoding = face_cache.get(user_id)
+    server_now = datetime.now()
+    entries = []
+    for index, item in enumerate(items):
+        try:
+            if stored_encoding is None:
+                raise ValueError('Anda harus setup Face Recognition terlebih dahulu di menu Profil!')
+            entry = parse_offline_item(item, user_id, server_now)
+        except ValueError as e:
+            results[index]['message'] = str(e)
+            continue
+        entry['index'] = index
+        entry['face_message'] = ''
+        entries.append(entry)
+
+    try:
+        # Semua foto satu batch dibagi ke worker pool sekaligus
+        if FACE_RECOGNITION_AVAILABLE and entries:
+            encoded = face_service.encode_many([entry['photo_bytes'] for entry in entries])
+            verified = []
+            for entry, face_encodings in zip(entries, encoded):
+                # Timeout / worker error bukan penolakan wajah: tidak dicatat, item tetap di antrian
+                if isinstance(face_encodings, FaceServiceTimeout):
+                    results[entry['index']].update(message=str(face_encodings), retry=True)
+                    continue
+                if isinstance(face_encodings, Exception):
+                    results[entry['index']].update(message=f'Error verifying face: {face_encodings}', retry=True)
+                    continue
+                face_verified, face_message = match_face(stored_encoding, face_encodings)
+                if not face_verified:
+                    results[entry['index']]['message'] = face_message
+                    continue
+                entry['face_message'] = face_message
+                verified.append(entry)
+            entries = verified
+
+        written = [None] * len(items)
+        if entries:
+            write_offline_batch(user_id, entries, written)
+    except FaceServiceBusy as e:
+        response = jsonify({'success': False, 'message': str(e)})
+        response.status_code = 503
+        response.headers['Retry-After'] = '5'
+        return response
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
+    for index, outcome in enumerate(written):
+        if outcome is not None:
+            results[index].update(outcome)
+    meta = offline_meta()
+    for item, result in zip(items, results):
+        result['id'] = item.get('id') if isinstance(item, dict) else None
+        result['action'] = item.get('action') if isinstance(item, dict) else None
+        # Percobaan offline yang ditolak (tanda tangan, lokasi, wajah) ikut dicatat, retry=True tidak
+        if not result['success'] and not result['retry'] and result['action'] in OFFLINE_ACTIONS:
+            attendance_log.log(user_id, result['action'], success=False,
+                               latitude=offline_coordinate(item, 'latitude'),
+                               longitude=offline_coordinate(item, 'longitude'),
+                               error_message=result['message'], ip_address=meta['ip_address'],
+                               device_info=f"offline {item.get('timestamp')} {meta['device_info']}".strip())
+
+    accepted = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': True,
+        'accepted': accepted,
+        'failed': len(results) - accepted,
+        'results': results
+    })
+
+@app.route('/kiosk/absen', methods=['POST'])
+@login_required
+@admission_controlled(per_user=False)
+def kiosk_absen():
+    """Shared-tablet attendance: identify the student from one photo (1:N), then clock in or out"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied. Admin only.'}), 403
+    
+    if not FACE_RECOGNITION_AVAILABLE:
+        return jsonify({'success': False, 'message': 'Face recognition not available'})
+    
+    try:
+        latitude = float(request.form.get('latitude', 0))
+        longitude = float(request.form.get('longitude', 0))
         
-        # Calculate duration
-        time_in = datetime.strptime(attendance['time_in'], '%H:%M:%S')
-        time_out = datetime.strptime(now, '%H:%M:%S')
-        duration_seconds = (time_out - time_in).total_seconds()
-        hours = int(duration_seconds // 3600)
-        minutes = int((duration_seconds % 3600) // 60)
-        duration_text = f"{hours} jam {minutes} menit"
+        # Validasi lokasi tablet kiosk
+        site = locate_site(latitude, longitude)
+        if not site or not site['inside']:
+            return jsonify(out_of_area(site, 'Kiosk berada di luar area absensi!'))
         
-        conn.close()
+        if 'photo' not in request.files:
+            return jsonify({'success': False, 'message': 'Foto wajib diperlukan untuk verifikasi identitas!'})
+        
+        file = request.files['photo']
+        if not file or not allowed_file(file.filename):
+            return jsonify({'success': False, 'message': 'File foto tidak valid!'})
+        
+        photo_bytes = file.read()
+        face_encodings = face_service.encode(photo_bytes)
+        
+        if not face_encodings:
+            return jsonify({'success': False, 'message': 'Wajah tidak terdeteksi.'})
+        
+        if len(face_encodings) > 1:
+            return jsonify({'success': False, 'message': 'Terdeteksi lebih dari satu wajah!'})
+        
+        # 1:N matching terhadap semua face_data aktif (satu operasi vektor)
+        match = face_cache.identify(face_encodings[0])
+        if match is None or match[1] >= FACE_MATCH_THRESHOLD:
+            return jsonify({'success': False, 'message': 'Wajah tidak dikenali.'})
+        
+        user_id, face_distance, runner_up = match
+        if runner_up - face_distance < KIOSK_MATCH_MARGIN:
+            return jsonify({
+                'success': False,
+                'message': 'Wajah mirip dengan lebih dari satu siswa, silakan absen melalui akun masing-masing.'
+            })
+        
+        face_message = f"Wajah terverifikasi! Akurasi: {(1 - face_distance) * 100:.1f}%"
+        
+        today = datetime.now().strftime("%Y-%m-%d")
+        now = datetime.now().strftime("%H:%M:%S")
 
-        return jsonify({
-            'success': True, 
-            'message': f'Absen keluar berhasil! {face_message if FACE_RECOGNITION_AVAILABLE else ""}',
+        user = attendance_state(user_id, today)
+
+        if not user or not user['active']:
+            return jsonify({'success': False, 'message': 'Akun tidak aktif!'})
+
+        attendance = user['attendance_id'] is not None
+        if attendance and user['time_out']:
+            return jsonify({
+                'success': False,
+                'message': f"{user['full_name']} sudah absen keluar hari ini!",
+                'user_name': user['full_name']
+            })
+        
+        # Belum absen -> absen masuk, sudah masuk -> absen keluar
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if attendance:
+            filename = f"{user_id}_keluar_{timestamp}.jpg"
+        else:
+            filename = f"{user_id}_{timestamp}.jpg"
+        photo_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        save_photo(photo_bytes, photo_path)
+        
+        if attendance:
+            result = record_check_out(user, today, now, latitude, longitude, photo_path, face_message, request_meta())
+        else:
+            result = record_check_in(user_id, today, now, latitude, longitude, photo_path, face_message, request_meta())
+        
+        result.update({
+            'action': 'check_out' if attendance else 'check_in',
+            'user_id': user_id,
             'user_name': user['full_name'],
             'class_name': user['class_name'],
-            'time_in': attendance['time_in'],
-            'time_out': now,
-            'duration': duration_text
+            'nearest_site': site
         })
-
+        return jsonify(result)
+    
+    except (FaceServiceBusy, FaceServiceTimeout) as e:
+        return face_unavailable_response(e)
     except Exception as e:
-        return jsonify({'success': False, 'message': f'Error: {str(e)}'})
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
     
 from datetime import datetime
 @app.route('/profil', methods=['GET', 'POST'])
@@ -491,67 +1148,112 @@ def profil():
     
 @app.route('/setup_face', methods=['POST'])
 @login_required
+@admission_controlled
 def setup_face():
-    """Setup face recognition for user"""
+    """Setup face recognition for user (1 sampai FACE_MAX_SAMPLES foto)"""
     if not FACE_RECOGNITION_AVAILABLE:
         return jsonify({'success': False, 'message': 'Face recognition not available'})
     
     if 'face_image' not in request.files:
         return jsonify({'success': False, 'message': 'No face image provided'})
     
-    face_file = request.files['face_image']
-    if face_file.filename == '':
+    face_files = [f for f in request.files.getlist('face_image') if f.filename != '']
+    if not face_files:
         return jsonify({'success': False, 'message': 'No file selected'})
     
-    if not allowed_file(face_file.filename):
+    if len(face_files) > FACE_MAX_SAMPLES:
+        return jsonify({'success': False, 'message': f'Maksimal {FACE_MAX_SAMPLES} foto wajah'})
+    
+    if not all(allowed_file(f.filename) for f in face_files):
         return jsonify({'success': False, 'message': 'Invalid file format'})
     
     try:
         conn = get_db_connection()
         user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
         
+        # Process with face_recognition (worker pool) dari memori, semua foto dibagi ke worker sekaligus
+        images = [face_file.read() for face_file in face_files]
+        samples = []
+        for index, face_encodings in enumerate(face_service.encode_many(images), start=1):
+            if isinstance(face_encodings, Exception):
+                conn.close()
+                raise face_encodings
+            label = f' (foto {index})' if len(images) > 1 else ''
+            
+            if len(face_encodings) != 1:
+                conn.close()
+                if not face_encodings:
+                    return jsonify({'success': False, 'message': f'Tidak ada wajah terdeteksi dalam gambar{label}'})
+                return jsonify({'success': False, 'message': f'Terdeteksi lebih dari satu wajah{label}. Gunakan foto dengan satu wajah saja'})
+            
+            samples.append(face_encodings[0])
+        
+        samples = np.vstack(samples)
+        
+        # Semua sampel harus wajah orang yang sama
+        if len(samples) > 1:
+            centroid = samples.mean(axis=0)
+            if np.linalg.norm(samples - centroid, axis=1).max() >= FACE_SAMPLE_CONSISTENCY:
+                conn.close()
+                return jsonify({'success': False, 'message': 'Foto-foto wajah tidak konsisten, pastikan semua foto adalah wajah Anda'})
+        
         # Create user-specific folder
         user_folder = os.path.join(app.config['FACES_FOLDER'], f"{user['full_name']}_{user['id']}")
         if not os.path.exists(user_folder):
             os.makedirs(user_folder)
         
-        # Save original image
-        filename = secure_filename(f"{user['id']}_face.jpg")
-        image_path = os.path.join(user_folder, filename)
-        face_file.save(image_path)
-        
-        # Process with face_recognition
-        image = face_recognition.load_image_file(image_path)
-        face_encodings = face_recognition.face_encodings(image)
-        
-        if not face_encodings:
-            os.remove(image_path)
-            conn.close()
-            return jsonify({'success': False, 'message': 'Tidak ada wajah terdeteksi dalam gambar'})
-        
-        if len(face_encodings) > 1:
-            os.remove(image_path)
-            conn.close()
-            return jsonify({'success': False, 'message': 'Terdeteksi lebih dari satu wajah. Gunakan foto dengan satu wajah saja'})
+        old_photos = conn.execute(
+            'SELECT photo_path FROM face_data WHERE user_id = ? AND active = 1', (session['user_id'],)
+        ).fetchall()
         
-        # Get the face encoding
-        face_encoding = face_encodings[0]
-        encoding_json = json.dumps(face_encoding.tolist())
+        # Foto baru ({id}_face.jpg, {id}_face_2.jpg, ...) ditulis ke .tmp dulu, baru menggantikan
+        # foto lama setelah commit: commit yang gagal tidak merusak sampel yang masih aktif
+        image_paths = [
+            os.path.join(user_folder, secure_filename(f"{user['id']}_face{'' if index == 1 else f'_{index}'}.jpg"))
+            for index in range(1, len(images) + 1)
+        ]
+        for image_bytes, image_path in zip(images, image_paths):
+            save_photo(image_bytes, image_path + '.tmp')
         
-        # Deactivate old face data
-        conn.execute('UPDATE face_data SET active = 0 WHERE user_id = ?', (session['user_id'],))
+        # K sampel disimpan sebagai satu array (K x 128) di satu baris face_data
+        encoding_blob = encode_encoding(samples if len(samples) > 1 else samples[0])
         
-        # Save new encoding to database
-        conn.execute('''
-            INSERT INTO face_data (user_id, face_encoding, photo_path, active)
-            VALUES (?, ?, ?, 1)
-        ''', (session['user_id'], encoding_json, image_path))
+        try:
+            # Deactivate old face data
+            conn.execute('UPDATE face_data SET active = 0 WHERE user_id = ?', (session['user_id'],))
+            
+            # Save new encoding to database
+            conn.execute('''
+                INSERT INTO face_data (user_id, face_encoding, photo_path, active)
+                VALUES (?, ?, ?, 1)
+            ''', (session['user_id'], encoding_blob, image_paths[0]))
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            for image_path in image_paths:
+                remove_photo(image_path + '.tmp')
+            raise
+        finally:
+            conn.close()
+        face_cache.invalidate(session['user_id'])
         
-        conn.commit()
-        conn.close()
+        for image_path in image_paths:
+            os.replace(image_path + '.tmp', image_path)
+        # Sampel tambahan enrollment lama dihapus, supaya reencode_faces.py tidak memakainya lagi
+        for photo_path in {row['photo_path'] for row in old_photos} | {image_paths[0]}:
+            for extra in extra_sample_photos(photo_path):
+                if extra not in image_paths:
+                    remove_photo(extra)
         
-        return jsonify({'success': True, 'message': 'Face recognition berhasil disetup!'})
+        return jsonify({
+            'success': True,
+            'message': 'Face recognition berhasil disetup!',
+            'samples': len(samples)
+        })
         
+    except (FaceServiceBusy, FaceServiceTimeout) as e:
+        return face_unavailable_response(e)
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
@@ -572,14 +1274,12 @@ def remove_face():
         conn.execute('UPDATE face_data SET active = 0 WHERE user_id = ?', (session['user_id'],))
         conn.commit()
         conn.close()
+        face_cache.invalidate(session['user_id'])
         
-        # Remove physical files
+        # Remove physical files (termasuk foto sampel tambahan {id}_face_*.jpg)
         for data in face_data:
-            if data['photo_path'] and os.path.exists(data['photo_path']):
-                try:
-                    os.remove(data['photo_path'])
-                except Exception:
-                    pass  # Continue even if file removal fails
+            for path in [data['photo_path']] + extra_sample_photos(data['photo_path']):
+                remove_photo(path)  # Continue even if file removal fails
         
         return jsonify({'success': True, 'message': 'Face recognition berhasil dihapus!'})
         
@@ -627,6 +1327,7 @@ def delete_coordinate():
             if deleted_rows > 0:
                 
                 conn.commit()
+                geofence.invalidate(coordinate_id)
                 print(f"💾 DEBUG: Successfully deleted {deleted_rows} row(s)")
                 
                 check = conn.execute('SELECT COUNT(*) as count FROM coordinates WHERE id = ?', (coordinate_id,)).fetchone()
@@ -670,6 +1371,65 @@ def delete_coordinate():
         return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
 
 
+def coordinate_dict(row):
+    """Coordinate row as JSON-friendly dict (polygon as [[lat, lng], ...])"""
+    polygon = row['polygon'] if row['shape'] == 'polygon' and row['polygon'] else None
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'latitude': row['latitude'],
+        'longitude': row['longitude'],
+        'radius': row['radius'],
+        'shape': row['shape'] or 'circle',
+        'polygon': decode_polygon(polygon).tolist() if polygon else None,
+        'active': row['active']
+    }
+
+def coordinate_zone(form):
+    """Shape columns for add/update_coordinate, raises ValueError with a user-facing message"""
+    shape = form.get('shape') or 'circle'
+    
+    if shape == 'polygon':
+        points = parse_polygon(form.get('polygon', ''))
+        zone = polygon_zone(points)
+        if zone['radius'] > POLYGON_MAX_RADIUS:
+            raise ValueError(f'Area poligon terlalu besar (maksimal {POLYGON_MAX_RADIUS} m dari titik tengah)')
+        zone.update(shape='polygon', polygon=encode_polygon(points))
+        return zone
+    
+    if shape != 'circle':
+        raise ValueError('Bentuk area tidak dikenal')
+    
+    try:
+        latitude = float(form.get('latitude'))
+        longitude = float(form.get('longitude'))
+        radius = int(form.get('radius', 100))
+    except (TypeError, ValueError):
+        raise ValueError('Format data tidak valid')
+    
+    # Validasi range
+    if latitude < -90 or latitude > 90:
+        raise ValueError('Latitude harus antara -90 dan 90')
+    if longitude < -180 or longitude > 180:
+        raise ValueError('Longitude harus antara -180 dan 180')
+    if radius < 10 or radius > 1000:
+        raise ValueError('Radius harus antara 10 dan 1000 meter')
+    
+    min_lat, max_lat, min_lon, max_lon = circle_bounds(latitude, longitude, radius)
+    return {
+        'shape': 'circle',
+        'polygon': None,
+        'latitude': latitude,
+        'longitude': longitude,
+        'radius': radius,
+        'min_lat': min_lat,
+        'max_lat': max_lat,
+        'min_lon': min_lon,
+        'max_lon': max_lon,
+    }
+
+ZONE_FIELDS = ('latitude', 'longitude', 'radius', 'shape', 'polygon', 'min_lat', 'max_lat', 'min_lon', 'max_lon')
+
 @app.route('/api/coordinates/list', methods=['GET'])
 @login_required
 def api_coordinates_list():
@@ -688,16 +1448,7 @@ def api_coordinates_list():
         ).fetchall()
         
         # Convert to list of dicts
-        coordinates_list = []
-        for coord in coordinates_raw:
-            coordinates_list.append({
-                'id': coord['id'],
-                'name': coord['name'],
-                'latitude': coord['latitude'],
-                'longitude': coord['longitude'],
-                'radius': coord['radius'],
-                'active': coord['active']
-            })
+        coordinates_list = [coordinate_dict(coord) for coord in coordinates_raw]
         
         conn.close()
         
@@ -733,17 +1484,7 @@ def set_coordinat():
         ).fetchall()
         
         # Convert Row objects to dict
-        coordinates = []
-        for row in coordinates_raw:
-            coord_dict = {
-                'id': row['id'],
-                'name': row['name'],
-                'latitude': row['latitude'],
-                'longitude': row['longitude'],
-                'radius': row['radius'],
-                'active': row['active']
-            }
-            coordinates.append(coord_dict)
+        coordinates = [coordinate_dict(row) for row in coordinates_raw]
             
         print(f"✅ Loaded {len(coordinates)} coordinates for page render")
         
@@ -784,28 +1525,18 @@ def add_coordinate():
     
     try:
         name = request.form.get('name', '').strip()
-        latitude = request.form.get('latitude')
-        longitude = request.form.get('longitude')
-        radius = request.form.get('radius', 100)
+        shape = request.form.get('shape') or 'circle'
         
         # Validasi input
-        if not name or not latitude or not longitude:
+        if not name:
+            return jsonify({'success': False, 'message': 'Data tidak lengkap'}), 400
+        if shape == 'circle' and (not request.form.get('latitude') or not request.form.get('longitude')):
             return jsonify({'success': False, 'message': 'Data tidak lengkap'}), 400
         
-        # Convert to proper types
-        latitude = float(latitude)
-        longitude = float(longitude)
-        radius = int(radius)
-        
-        # Validasi range
-        if latitude < -90 or latitude > 90:
-            return jsonify({'success': False, 'message': 'Latitude harus antara -90 dan 90'}), 400
-        
-        if longitude < -180 or longitude > 180:
-            return jsonify({'success': False, 'message': 'Longitude harus antara -180 dan 180'}), 400
-        
-        if radius < 10 or radius > 1000:
-            return jsonify({'success': False, 'message': 'Radius harus antara 10 dan 1000 meter'}), 400
+        try:
+            zone = coordinate_zone(request.form)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
         
         conn = get_db_connection()
         
@@ -823,15 +1554,17 @@ def add_coordinate():
         
         # Insert new coordinate
         cursor = conn.execute(
-            'INSERT INTO coordinates (name, latitude, longitude, radius, active) VALUES (?, ?, ?, ?, 1)',
-            (name, latitude, longitude, radius)
+            f'INSERT INTO coordinates (name, {", ".join(ZONE_FIELDS)}, active) '
+            f'VALUES (?, {", ".join("?" for _ in ZONE_FIELDS)}, 1)',
+            (name, *(zone[field] for field in ZONE_FIELDS))
         )
         
         new_id = cursor.lastrowid
         conn.commit()
         conn.close()
+        geofence.invalidate(new_id)
         
-        print(f"✅ Added new coordinate: {name} (ID: {new_id})")
+        print(f"✅ Added new coordinate: {name} (ID: {new_id}, {zone['shape']})")
         
         return jsonify({
             'success': True,
@@ -839,9 +1572,11 @@ def add_coordinate():
             'coordinate': {
                 'id': new_id,
                 'name': name,
-                'latitude': latitude,
-                'longitude': longitude,
-                'radius': radius
+                'latitude': zone['latitude'],
+                'longitude': zone['longitude'],
+                'radius': zone['radius'],
+                'shape': zone['shape'],
+                'polygon': decode_polygon(zone['polygon']).tolist() if zone['polygon'] else None
             }
         })
         
@@ -876,6 +1611,7 @@ def toggle_coordinate_status():
         conn.execute('UPDATE coordinates SET active = ? WHERE id = ?', (new_status, coordinate_id))
         conn.commit()
         conn.close()
+        geofence.invalidate(coordinate_id)
         
         status_text = 'diaktifkan' if new_status else 'dinonaktifkan'
         
@@ -898,13 +1634,15 @@ def update_coordinate():
     try:
         coordinate_id = request.form.get('id')
         name = request.form.get('name')
-        latitude = float(request.form.get('latitude'))
-        longitude = float(request.form.get('longitude'))
-        radius = int(request.form.get('radius', 100))
         
         if not all([coordinate_id, name]):
             return jsonify({'success': False, 'message': 'Data tidak lengkap'}), 400
         
+        try:
+            zone = coordinate_zone(request.form)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
         conn = get_db_connection()
         
         # Check if coordinate exists
@@ -915,14 +1653,15 @@ def update_coordinate():
         
         # Update coordinate
         conn.execute(
-            '''UPDATE coordinates 
-               SET name = ?, latitude = ?, longitude = ?, radius = ?
+            f'''UPDATE coordinates 
+               SET name = ?, {", ".join(f"{field} = ?" for field in ZONE_FIELDS)}
                WHERE id = ?''',
-            (name, latitude, longitude, radius, coordinate_id)
+            (name, *(zone[field] for field in ZONE_FIELDS), coordinate_id)
         )
         
         conn.commit()
         conn.close()
+        geofence.invalidate(coordinate_id)
         
         return jsonify({
             'success': True,
@@ -974,9 +1713,11 @@ def api_monthly_attendance():
         last_day = datetime(year, month, calendar.monthrange(year, month)[1]).strftime('%Y-%m-%d')
         
         conn = get_db_connection()
+        # Bulan yang sudah diarsipkan dibaca dari file arsipnya
+        attendance = archive.attendance_source(conn, first_day, last_day)
         
         # Get attendance data for the month
-        attendance_data = conn.execute('''
+        attendance_data = conn.execute(f'''
             SELECT 
                 date,
                 time_in,
@@ -989,12 +1730,8 @@ def api_monthly_attendance():
                     WHEN time_in IS NOT NULL AND time_out IS NULL THEN 'incomplete'
                     ELSE 'absent'
                 END as status,
-                CASE 
-                    WHEN time_in IS NOT NULL AND time_out IS NOT NULL THEN
-                        CAST((julianday(date || ' ' || time_out) - julianday(date || ' ' || time_in)) * 24 * 60 AS INTEGER)
-                    ELSE NULL
-                END as work_minutes
-            FROM attendance 
+                work_minutes
+            FROM {attendance} 
             WHERE user_id = ? AND date BETWEEN ? AND ?
             ORDER BY date DESC
         ''', (session['user_id'], first_day, last_day)).fetchall()
@@ -1075,13 +1812,13 @@ def api_users_list():
         conn = get_db_connection()
         
         # Get basic user information (tidak termasuk info sensitif)
-        users = conn.execute('''
+        users = conn.execute(f'''
             SELECT 
                 u.id, u.username, u.full_name, u.role, u.active,
                 COALESCE(c.name, '-') as class_name, 
                 u.created_at, u.updated_at,
                 CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as face_recognition,
-                a.last_attendance
+                a.last_date as last_attendance
             FROM users u
             LEFT JOIN classes c ON u.class_id = c.id
             LEFT JOIN (
@@ -1090,12 +1827,7 @@ def api_users_list():
                 WHERE active = 1 
                 GROUP BY user_id
             ) f ON u.id = f.user_id
-            LEFT JOIN (
-                SELECT user_id, MAX(date) as last_attendance
-                FROM attendance
-                WHERE time_in IS NOT NULL
-                GROUP BY user_id
-            ) a ON u.id = a.user_id
+            LEFT JOIN {archive.USER_TOTALS} a ON u.id = a.user_id
             ORDER BY u.full_name ASC
         ''').fetchall()
         
@@ -1126,12 +1858,8 @@ def api_users_list():
         # Face recognition enabled users
         face_enabled_users = len([u for u in users_list if u['face_recognition']])
         
-        # Today attendance count
-        today_attendance = conn.execute('''
-            SELECT COUNT(DISTINCT user_id) as count
-            FROM attendance 
-            WHERE date = ? AND time_in IS NOT NULL
-        ''', (today,)).fetchone()['count']
+        # Today attendance count (daily_summary)
+        today_attendance = daily_summary.totals(conn, today, today).get(today, {}).get('present', 0)
         
         stats = {
             'total_users': total_users,
@@ -1177,6 +1905,15 @@ def api_create_user():
                 'message': 'Password must be at least 6 characters long'
             }), 400
         
+        # Validasi sebelum BEGIN IMMEDIATE: input salah = 400, bukan 500 dengan write lock terpegang
+        try:
+            class_id = int(data['class_id'])
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid class_id'
+            }), 400
+        
         conn = get_db_connection()
         
         # Check if username already exists
@@ -1195,21 +1932,29 @@ def api_create_user():
         # Hash password
         hashed_password = generate_password_hash(data['password'])
         
-        # Insert new user
-        conn.execute('''
-            INSERT INTO users (username, full_name, class_id, password, role, active)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            data['username'],
-            data['full_name'],
-            int(data['class_id']),
-            hashed_password,
-            data.get('role', 'user'),
-            data.get('active', True)
-        ))
-        
-        conn.commit()
-        conn.close()
+        # Insert new user (+ total_active hari ini di daily_summary, satu transaksi)
+        today = datetime.now().strftime('%Y-%m-%d')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            daily_summary.ensure_day(conn, today)
+            cursor = conn.execute('''
+                INSERT INTO users (username, full_name, class_id, password, role, active)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                data['username'],
+                data['full_name'],
+                class_id,
+                hashed_password,
+                data.get('role', 'user'),
+                data.get('active', True)
+            ))
+            daily_summary.attach_user(conn, cursor.lastrowid, today)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
         
         return jsonify({
             'success': True,
@@ -1260,8 +2005,16 @@ def api_update_user(user_id):
         
         # Update class_id if provided
         if 'class_id' in data:
+            try:
+                class_id = int(data['class_id'])
+            except (TypeError, ValueError):
+                conn.close()
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid class_id'
+                }), 400
             update_fields.append('class_id = ?')
-            update_values.append(int(data['class_id']))
+            update_values.append(class_id)
         
         # Update role if provided
         if 'role' in data:
@@ -1291,12 +2044,20 @@ def api_update_user(user_id):
         # Add user_id for WHERE clause
         update_values.append(user_id)
         
-        # Execute update
+        # Execute update (kelas/role/status ikut memindahkan hitungan daily_summary)
+        today = datetime.now().strftime('%Y-%m-%d')
         query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = ?"
-        conn.execute(query, update_values)
-        
-        conn.commit()
-        conn.close()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            daily_summary.detach_user(conn, user_id, today)
+            conn.execute(query, update_values)
+            daily_summary.attach_user(conn, user_id, today)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
         
         return jsonify({
             'success': True,
@@ -1343,20 +2104,28 @@ def api_delete_user(user_id):
         ).fetchall()
         
         # Delete related data first (to maintain referential integrity)
-        # Delete attendance records
-        conn.execute('DELETE FROM attendance WHERE user_id = ?', (user_id,))
-        
-        # Delete attendance logs
-        conn.execute('DELETE FROM attendance_logs WHERE user_id = ?', (user_id,))
-        
-        # Delete face data
-        conn.execute('DELETE FROM face_data WHERE user_id = ?', (user_id,))
-        
-        # Delete user
-        conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
-        
-        conn.commit()
-        conn.close()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            daily_summary.detach_user(conn, user_id, datetime.now().strftime('%Y-%m-%d'))
+            
+            # Delete attendance records
+            conn.execute('DELETE FROM attendance WHERE user_id = ?', (user_id,))
+            
+            # Delete attendance logs
+            conn.execute('DELETE FROM attendance_logs WHERE user_id = ?', (user_id,))
+            
+            # Delete face data
+            conn.execute('DELETE FROM face_data WHERE user_id = ?', (user_id,))
+            
+            # Delete user
+            conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        face_cache.invalidate(user_id)
         
         # Clean up face recognition files
         for data in face_data:
@@ -1389,16 +2158,16 @@ def api_user_detail(user_id):
         conn = get_db_connection()
         
         # Get user with additional info
+        # Total & terakhir hadir termasuk bulan yang sudah diarsipkan (bulan ini selalu di tabel utama)
         user = conn.execute('''
             SELECT 
                 u.*,
                 CASE WHEN f.id IS NOT NULL THEN 1 ELSE 0 END as face_recognition,
-                COUNT(DISTINCT a.id) as total_attendance,
-                MAX(a.date) as last_attendance_date,
                 COUNT(DISTINCT CASE WHEN a.date >= date('now', 'start of month') THEN a.id END) as this_month_attendance
             FROM users u
             LEFT JOIN face_data f ON u.id = f.user_id AND f.active = 1
             LEFT JOIN attendance a ON u.id = a.user_id AND a.time_in IS NOT NULL
+                AND a.date >= date('now', 'start of month')
             WHERE u.id = ?
             GROUP BY u.id
         ''', (user_id,)).fetchone()
@@ -1411,17 +2180,27 @@ def api_user_detail(user_id):
             }), 404
         
         # Get recent attendance (last 10 records)
-        recent_attendance = conn.execute('''
+        recent_query = '''
             SELECT date, time_in, time_out
-            FROM attendance
+            FROM {attendance}
             WHERE user_id = ? AND time_in IS NOT NULL
             ORDER BY date DESC
             LIMIT 10
-        ''', (user_id,)).fetchall()
+        '''
+        recent_attendance = conn.execute(recent_query.format(attendance='attendance'), (user_id,)).fetchall()
+        if len(recent_attendance) < 10:
+            # Sisanya dari arsip, hanya file yang memuat bulan-bulan terakhirnya
+            start = archive.history_start(conn, user_id, 10 - len(recent_attendance))
+            if start:
+                attendance = archive.attendance_source(conn, start)
+                recent_attendance = conn.execute(recent_query.format(attendance=attendance), (user_id,)).fetchall()
+        _, total_attendance, last_attendance_date = archive.user_totals(conn, user_id)
         
         conn.close()
         
         user_dict = dict(user)
+        user_dict['total_attendance'] = total_attendance
+        user_dict['last_attendance_date'] = last_attendance_date
         user_dict['recent_attendance'] = [dict(row) for row in recent_attendance]
         
         return jsonify({
@@ -1435,6 +2214,89 @@ def api_user_detail(user_id):
             'message': f'Error getting user detail: {str(e)}'
         }), 500
 
+@app.route('/api/users/face-samples/<int:user_id>', methods=['POST'])
+@login_required
+def api_append_face_sample(user_id):
+    """Admin: add the photo of a successful check-in/out as an extra face sample"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied. Admin only.'}), 403
+    
+    if not FACE_RECOGNITION_AVAILABLE:
+        return jsonify({'success': False, 'message': 'Face recognition not available'})
+    
+    try:
+        data = request.get_json() or {}
+        attendance_id = data.get('attendance_id')
+        action = data.get('action', 'check_in')
+        if not attendance_id or action not in ('check_in', 'check_out'):
+            return jsonify({'success': False, 'message': 'attendance_id dan action (check_in/check_out) wajib diisi'}), 400
+        
+        conn = get_db_connection()
+        attendance = conn.execute(
+            'SELECT * FROM attendance WHERE id = ? AND user_id = ?',
+            (attendance_id, user_id)
+        ).fetchone()
+        face_row = conn.execute(
+            'SELECT id, face_encoding, photo_path FROM face_data WHERE user_id = ? AND active = 1 ORDER BY id DESC LIMIT 1',
+            (user_id,)
+        ).fetchone()
+        conn.close()
+        
+        if not attendance:
+            return jsonify({'success': False, 'message': 'Data absensi tidak ditemukan'}), 404
+        if not face_row:
+            return jsonify({'success': False, 'message': 'User belum setup face recognition'}), 400
+        
+        photo_path = attendance['photo_path_out'] if action == 'check_out' else attendance['photo_path']
+        if not photo_path or not os.path.exists(photo_path):
+            return jsonify({'success': False, 'message': 'Foto absensi tidak tersedia'}), 404
+        
+        face_encodings = face_service.encode(photo_path)
+        if len(face_encodings) != 1:
+            return jsonify({'success': False, 'message': 'Foto absensi harus berisi tepat satu wajah'})
+        
+        # Sampel baru hanya diterima kalau cocok dengan sampel yang sudah ada
+        samples = as_samples(decode_encoding(face_row['face_encoding']))
+        face_distance = sample_distance(samples, face_encodings[0], 'min')
+        if face_distance >= FACE_MATCH_THRESHOLD:
+            return jsonify({'success': False, 'message': 'Wajah pada foto absensi tidak cocok dengan data wajah user'})
+        
+        # Sampel pertama (enrollment) selalu dipertahankan, sampel tambahan tertua dibuang
+        samples = np.vstack([samples, np.asarray(face_encodings[0], dtype=samples.dtype)])
+        if len(samples) > FACE_MAX_SAMPLES:
+            samples = np.vstack([samples[:1], samples[len(samples) - FACE_MAX_SAMPLES + 1:]])
+        
+        # Salin foto ke folder wajah, foto di uploads/ dihapus cleanup setelah beberapa hari
+        if face_row['photo_path']:
+            base, ext = os.path.splitext(face_row['photo_path'])
+            try:
+                shutil.copyfile(photo_path, f"{base}_a{attendance_id}{ext}")
+            except OSError:
+                pass
+        
+        conn = get_db_connection()
+        conn.execute(
+            'UPDATE face_data SET face_encoding = ? WHERE id = ?',
+            (encode_encoding(samples), face_row['id'])
+        )
+        conn.commit()
+        conn.close()
+        face_cache.invalidate(user_id)
+        
+        return jsonify({
+            'success': True,
+            'message': f'Sampel wajah ditambahkan ({len(samples)}/{FACE_MAX_SAMPLES})',
+            'samples': len(samples),
+            'distance': round(face_distance, 4)
+        })
+    
+    except FaceServiceBusy as e:
+        return jsonify({'success': False, 'message': str(e)}), 503
+    except FaceServiceTimeout as e:
+        return jsonify({'success': False, 'message': str(e)}), 504
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error: {str(e)}'}), 500
+
 @app.route('/api/users/toggle-status/<int:user_id>', methods=['POST'])
 @login_required
 def api_toggle_user_status(user_id):
@@ -1464,13 +2326,21 @@ def api_toggle_user_status(user_id):
         
         # Toggle status
         new_status = not user['active']
-        conn.execute(
-            'UPDATE users SET active = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
-            (new_status, user_id)
-        )
-        
-        conn.commit()
-        conn.close()
+        today = datetime.now().strftime('%Y-%m-%d')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            daily_summary.detach_user(conn, user_id, today)
+            conn.execute(
+                'UPDATE users SET active = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+                (new_status, user_id)
+            )
+            daily_summary.attach_user(conn, user_id, today)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
         
         status_text = 'activated' if new_status else 'deactivated'
         
@@ -1505,6 +2375,14 @@ def api_bulk_delete_users():
                 'message': 'No users selected'
             }), 400
         
+        try:
+            user_ids = [int(user_id) for user_id in user_ids]
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid user_ids'
+            }), 400
+        
         # Prevent self-deletion
         if session.get('user_id') in user_ids:
             return jsonify({
@@ -1513,35 +2391,45 @@ def api_bulk_delete_users():
             }), 400
         
         conn = get_db_connection()
+        today = datetime.now().strftime('%Y-%m-%d')
+        conn.execute('BEGIN IMMEDIATE')
         
         deleted_count = 0
-        for user_id in user_ids:
-            # Get face data for cleanup
-            face_data = conn.execute(
-                'SELECT photo_path FROM face_data WHERE user_id = ?',
-                (user_id,)
-            ).fetchall()
-            
-            # Delete related data
-            conn.execute('DELETE FROM attendance WHERE user_id = ?', (user_id,))
-            conn.execute('DELETE FROM attendance_logs WHERE user_id = ?', (user_id,))
-            conn.execute('DELETE FROM face_data WHERE user_id = ?', (user_id,))
-            
-            # Delete user
-            result = conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
-            if result.rowcount > 0:
-                deleted_count += 1
+        photo_paths = []
+        try:
+            for user_id in user_ids:
+                # Get face data for cleanup
+                face_data = conn.execute(
+                    'SELECT photo_path FROM face_data WHERE user_id = ?',
+                    (user_id,)
+                ).fetchall()
                 
-                # Cleanup files
-                for data in face_data:
-                    if data['photo_path'] and os.path.exists(data['photo_path']):
-                        try:
-                            os.remove(data['photo_path'])
-                        except Exception:
-                            pass
+                # Delete related data
+                daily_summary.detach_user(conn, user_id, today)
+                conn.execute('DELETE FROM attendance WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM attendance_logs WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM face_data WHERE user_id = ?', (user_id,))
+                
+                # Delete user
+                result = conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+                if result.rowcount > 0:
+                    deleted_count += 1
+                    photo_paths.extend(data['photo_path'] for data in face_data)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        face_cache.invalidate_many(user_ids)
         
-        conn.commit()
-        conn.close()
+        # Cleanup files (setelah commit: rollback tidak boleh meninggalkan user tanpa foto)
+        for path in photo_paths:
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except Exception:
+                    pass
         
         return jsonify({
             'success': True,
@@ -1553,6 +2441,81 @@ def api_bulk_delete_users():
             'success': False,
             'message': f'Error deleting users: {str(e)}'
         }), 500
+
+@app.route('/api/users/import', methods=['POST'])
+@login_required
+def api_import_users():
+    """Bulk import students from a CSV/XLSX upload (admin only), see user_import.py"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied. Admin only.'}), 403
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'message': 'File CSV/XLSX wajib diunggah'}), 400
+    dry_run = request.form.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    
+    try:
+        records = read_import_file(upload.read(), upload.filename)
+    except ImportFileError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    # Hashing satu angkatan penuh makan waktu menitan: jalan di background, hasilnya di-poll
+    if not dry_run and len(records) > IMPORT_HTTP_MAX_ROWS:
+        try:
+            job_id = start_import_job(records)
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'message': f'Error importing users: {str(e)}'
+            }), 500
+        return jsonify({
+            'success': True,
+            'message': f'{len(records)} baris sedang diimpor, cek hasilnya di status_url',
+            'job_id': job_id,
+            'status_url': url_for('api_import_status', job_id=job_id),
+            'pending': True
+        }), 202
+    
+    conn = get_db_connection()
+    try:
+        report = import_users(conn, records, dry_run=dry_run)
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error importing users: {str(e)}'
+        }), 500
+    finally:
+        conn.close()
+    
+    if dry_run:
+        message = f"{report['valid']} dari {report['total']} baris valid"
+    else:
+        message = f"{report['imported']} user diimpor, {report['failed']} baris gagal"
+    return jsonify({'success': True, 'message': message, 'dry_run': dry_run, **report})
+
+@app.route('/api/users/import/<job_id>', methods=['GET'])
+@login_required
+def api_import_status(job_id):
+    """Poll a background user import started by /api/users/import (admin only)"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied. Admin only.'}), 403
+    
+    conn = get_db_connection()
+    try:
+        job = import_job(conn, job_id)
+    finally:
+        conn.close()
+    if job is None:
+        return jsonify({'success': False, 'status': 'unknown', 'message': 'Job import tidak ditemukan'}), 404
+    
+    if job['status'] == 'running':
+        return jsonify({'success': True, 'status': 'running', 'pending': True, 'total': job['total']})
+    if job['status'] == 'error':
+        return jsonify({'success': False, 'status': 'error', 'pending': False, **job['report']})
+    report = job['report']
+    message = f"{report['imported']} user diimpor, {report['failed']} baris gagal"
+    return jsonify({'success': True, 'status': 'done', 'pending': False, 'message': message,
+                    'dry_run': False, **report})
         
 # Tambahkan endpoint ini ke file app.py
 
@@ -1580,9 +2543,10 @@ def api_daily_attendance():
         date_str = selected_date.strftime('%Y-%m-%d')
         
         conn = get_db_connection()
+        attendance = archive.attendance_source(conn, date_str, date_str)
         
         # Get attendance data for the selected date with user information
-        attendance_data = conn.execute('''
+        attendance_data = conn.execute(f'''
             SELECT 
                 a.id,
                 a.user_id,
@@ -1600,12 +2564,8 @@ def api_daily_attendance():
                     WHEN a.time_in IS NOT NULL AND a.time_out IS NULL THEN 'incomplete'
                     ELSE 'absent'
                 END as status,
-                CASE 
-                    WHEN a.time_in IS NOT NULL AND a.time_out IS NOT NULL THEN
-                        CAST((julianday(a.date || ' ' || a.time_out) - julianday(a.date || ' ' || a.time_in)) * 24 * 60 AS INTEGER)
-                    ELSE NULL
-                END as work_minutes
-            FROM attendance a
+                a.work_minutes
+            FROM {attendance} a
             JOIN users u ON a.user_id = u.id
             LEFT JOIN classes c ON u.class_id = c.id
             WHERE a.date = ? AND a.time_in IS NOT NULL AND u.role != 'admin'
@@ -1630,18 +2590,22 @@ def api_daily_attendance():
                 'has_photo': bool(row['photo_path'])
             })
         
-        # Calculate daily statistics
-        total_present = len(attendance_list)
-        complete_attendance = len([a for a in attendance_list if a['status'] == 'complete'])
-        incomplete_attendance = len([a for a in attendance_list if a['status'] == 'incomplete'])
+        # Daily statistics dari rollup daily_summary (tanggal tanpa baris: belum ada yang absen)
+        summary = daily_summary.totals(conn, date_str, date_str).get(date_str)
+        if summary:
+            total_present = summary['present']
+            complete_attendance = summary['complete']
+            incomplete_attendance = summary['incomplete']
+            total_users = summary['total_active']
+        else:
+            total_present = complete_attendance = incomplete_attendance = 0
+            total_users = daily_summary.current_active(conn)
         
         # Calculate total work hours for the day
         total_work_minutes = sum([a['work_minutes'] for a in attendance_list if a['work_minutes']])
         total_work_hours = round(total_work_minutes / 60, 1) if total_work_minutes else 0
         avg_work_hours = round(total_work_hours / complete_attendance, 1) if complete_attendance > 0 else 0
         
-        # Get total registered users for attendance rate calculation
-        total_users = conn.execute('SELECT COUNT(*) as count FROM users WHERE active = 1').fetchone()['count']
         attendance_rate = round((total_present / total_users) * 100, 1) if total_users > 0 else 0
         
         daily_stats = {
@@ -1652,7 +2616,8 @@ def api_daily_attendance():
             'total_registered_users': total_users,
             'attendance_rate': attendance_rate,
             'total_work_hours': total_work_hours,
-            'avg_work_hours': avg_work_hours
+            'avg_work_hours': avg_work_hours,
+            'by_class': [dict(row) for row in daily_summary.by_class(conn, date_str)]
         }
         
         conn.close()
@@ -1698,33 +2663,31 @@ def api_weekly_attendance():
         
         conn = get_db_connection()
         
-        # Get attendance summary for each day of the week
+        # Satu query ke daily_summary untuk seluruh minggu
+        summaries = daily_summary.totals(conn, week_start.strftime('%Y-%m-%d'), week_end.strftime('%Y-%m-%d'))
+        active_now = None
+        
         weekly_data = []
         current_date = week_start
         
         while current_date <= week_end:
             date_str = current_date.strftime('%Y-%m-%d')
+            summary = summaries.get(date_str)
+            if summary is None:
+                # Hari tanpa absen sama sekali: pakai jumlah siswa aktif saat ini
+                if active_now is None:
+                    active_now = daily_summary.current_active(conn)
+                summary = {'present': 0, 'complete': 0, 'incomplete': 0, 'total_active': active_now}
             
-            # Get attendance count for this date
-            daily_count = conn.execute('''
-                SELECT 
-                    COUNT(*) as total_present,
-                    SUM(CASE WHEN time_out IS NOT NULL THEN 1 ELSE 0 END) as complete_count
-                FROM attendance 
-                WHERE date = ? AND time_in IS NOT NULL
-            ''', (date_str,)).fetchone()
-            
-            # Get total active users
-            total_users = conn.execute('SELECT COUNT(*) FROM users WHERE active = 1').fetchone()[0]
-            
-            attendance_rate = round((daily_count['total_present'] / total_users) * 100, 1) if total_users > 0 else 0
+            total_users = summary['total_active']
+            attendance_rate = round((summary['present'] / total_users) * 100, 1) if total_users > 0 else 0
             
             weekly_data.append({
                 'date': date_str,
                 'day_name': current_date.strftime('%A'),
-                'total_present': daily_count['total_present'],
-                'complete_count': daily_count['complete_count'],
-                'incomplete_count': daily_count['total_present'] - daily_count['complete_count'],
+                'total_present': summary['present'],
+                'complete_count': summary['complete'],
+                'incomplete_count': summary['incomplete'],
                 'total_users': total_users,
                 'attendance_rate': attendance_rate
             })
@@ -1815,10 +2778,14 @@ def register():
             hashed_password = generate_password_hash(password)
             
             # ✅ Insert dengan class_id
-            conn.execute('''
+            today = datetime.now().strftime('%Y-%m-%d')
+            conn.execute('BEGIN IMMEDIATE')
+            daily_summary.ensure_day(conn, today)
+            cursor = conn.execute('''
                 INSERT INTO users (username, full_name, class_id, password, role, active)
                 VALUES (?, ?, ?, ?, 'user', 1)
             ''', (username, full_name, int(class_id), hashed_password))
+            daily_summary.attach_user(conn, cursor.lastrowid, today)
             
             conn.commit()
             conn.close()
@@ -1920,6 +2887,8 @@ def api_set_face_reminder():
 @login_required
 def export_users_excel():
     """Export users data to Excel grouped by class"""
+    import pandas as pd  # lazy: hanya dibutuhkan untuk export
+    
     try:
         conn = get_db_connection()
         
@@ -1927,7 +2896,7 @@ def export_users_excel():
         classes = conn.execute('SELECT * FROM classes WHERE active = 1 ORDER BY name').fetchall()
         
         # Get users without class
-        users_no_class = conn.execute('''
+        users_no_class = conn.execute(f'''
             SELECT 
                 u.id as "ID",
                 u.username as "Username",
@@ -1936,8 +2905,8 @@ def export_users_excel():
                 CASE WHEN u.active = 1 THEN 'Aktif' ELSE 'Nonaktif' END as "Status",
                 CASE WHEN f.id IS NOT NULL THEN 'Ya' ELSE 'Tidak' END as "Face Recognition",
                 u.created_at as "Tanggal Daftar",
-                a.last_attendance as "Terakhir Hadir",
-                COUNT(att.id) as "Total Kehadiran"
+                a.last_date as "Terakhir Hadir",
+                COALESCE(a.present, 0) as "Total Kehadiran"
             FROM users u
             LEFT JOIN (
                 SELECT user_id, MAX(id) as id 
@@ -1945,20 +2914,12 @@ def export_users_excel():
                 WHERE active = 1 
                 GROUP BY user_id
             ) f ON u.id = f.user_id
-            LEFT JOIN (
-                SELECT user_id, MAX(date) as last_attendance
-                FROM attendance
-                WHERE time_in IS NOT NULL
-                GROUP BY user_id
-            ) a ON u.id = a.user_id
-            LEFT JOIN attendance att ON u.id = att.user_id AND att.time_in IS NOT NULL
+            LEFT JOIN {archive.USER_TOTALS} a ON u.id = a.user_id
             WHERE u.role != 'admin' AND (u.class_id IS NULL OR u.class_id = 0)
             GROUP BY u.id
             ORDER BY u.full_name ASC
         ''').fetchall()
         
-        conn.close()
-        
         # Create Excel file with multiple sheets
         output = BytesIO()
         
@@ -1969,9 +2930,7 @@ def export_users_excel():
             
             # Process each class
             for cls in classes:
-                conn = get_db_connection()
-                
-                users_in_class = conn.execute('''
+                users_in_class = conn.execute(f'''
                     SELECT 
                         u.id as "ID",
                         u.username as "Username",
@@ -1980,8 +2939,8 @@ def export_users_excel():
                         CASE WHEN u.active = 1 THEN 'Aktif' ELSE 'Nonaktif' END as "Status",
                         CASE WHEN f.id IS NOT NULL THEN 'Ya' ELSE 'Tidak' END as "Face Recognition",
                         u.created_at as "Tanggal Daftar",
-                        a.last_attendance as "Terakhir Hadir",
-                        COUNT(att.id) as "Total Kehadiran"
+                        a.last_date as "Terakhir Hadir",
+                        COALESCE(a.present, 0) as "Total Kehadiran"
                     FROM users u
                     LEFT JOIN (
                         SELECT user_id, MAX(id) as id 
@@ -1989,20 +2948,12 @@ def export_users_excel():
                         WHERE active = 1 
                         GROUP BY user_id
                     ) f ON u.id = f.user_id
-                    LEFT JOIN (
-                        SELECT user_id, MAX(date) as last_attendance
-                        FROM attendance
-                        WHERE time_in IS NOT NULL
-                        GROUP BY user_id
-                    ) a ON u.id = a.user_id
-                    LEFT JOIN attendance att ON u.id = att.user_id AND att.time_in IS NOT NULL
+                    LEFT JOIN {archive.USER_TOTALS} a ON u.id = a.user_id
                     WHERE u.role != 'admin' AND u.class_id = ?
                     GROUP BY u.id
                     ORDER BY u.full_name ASC
                 ''', (cls['id'],)).fetchall()
                 
-                conn.close()
-                
                 if len(users_in_class) > 0:
                     # Convert to DataFrame
                     class_data = [dict(user) for user in users_in_class]
@@ -2046,6 +2997,8 @@ def export_users_excel():
                         'Face Recognition': face_count
                     })
             
+            conn.close()
+            
             # Add users without class if any
             if len(users_no_class) > 0:
                 no_class_data = [dict(user) for user in users_no_class]
@@ -2145,6 +3098,8 @@ def export_users_excel():
 @login_required
 def export_daily_attendance_excel():
     """Export daily attendance to Excel - separate sheet per class"""
+    import pandas as pd  # lazy: hanya dibutuhkan untuk export
+    
     try:
         date_param = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
         
@@ -2157,6 +3112,7 @@ def export_daily_attendance_excel():
             }), 400
         
         conn = get_db_connection()
+        attendance = archive.attendance_source(conn, date_param, date_param)
         
         # Get all classes
         classes = conn.execute('SELECT * FROM classes WHERE active = 1 ORDER BY name').fetchall()
@@ -2170,7 +3126,7 @@ def export_daily_attendance_excel():
             # Process each class
             for cls in classes:
                 # Get attendance for this class
-                class_attendance = conn.execute('''
+                class_attendance = conn.execute(f'''
                     SELECT 
                         u.full_name as "Nama Lengkap",
                         a.date as "Tanggal",
@@ -2183,14 +3139,11 @@ def export_daily_attendance_excel():
                         END as "Status",
                         CASE 
                             WHEN a.time_in IS NOT NULL AND a.time_out IS NOT NULL THEN
-                                PRINTF('%.1f', 
-                                    CAST((julianday(a.date || ' ' || a.time_out) - 
-                                          julianday(a.date || ' ' || a.time_in)) * 24 AS REAL)
-                                ) || ' jam'
+                                PRINTF('%.1f', a.work_minutes / 60.0) || ' jam'
                             ELSE '-'
                         END as "Durasi"
                     FROM users u
-                    LEFT JOIN attendance a ON u.id = a.user_id AND a.date = ?
+                    LEFT JOIN {attendance} a ON u.id = a.user_id AND a.date = ?
                     WHERE u.active = 1 AND u.role != 'admin' AND u.class_id = ?
                     ORDER BY 
                         CASE WHEN a.time_in IS NOT NULL THEN 0 ELSE 1 END,
@@ -2241,7 +3194,7 @@ def export_daily_attendance_excel():
                     })
             
             # Process students without class
-            no_class_attendance = conn.execute('''
+            no_class_attendance = conn.execute(f'''
                 SELECT 
                     u.full_name as "Nama Lengkap",
                     a.date as "Tanggal",
@@ -2254,14 +3207,11 @@ def export_daily_attendance_excel():
                     END as "Status",
                     CASE 
                         WHEN a.time_in IS NOT NULL AND a.time_out IS NOT NULL THEN
-                            PRINTF('%.1f', 
-                                CAST((julianday(a.date || ' ' || a.time_out) - 
-                                      julianday(a.date || ' ' || a.time_in)) * 24 AS REAL)
-                            ) || ' jam'
+                            PRINTF('%.1f', a.work_minutes / 60.0) || ' jam'
                         ELSE '-'
                     END as "Durasi"
                 FROM users u
-                LEFT JOIN attendance a ON u.id = a.user_id AND a.date = ?
+                LEFT JOIN {attendance} a ON u.id = a.user_id AND a.date = ?
                 WHERE u.active = 1 AND u.role != 'admin' AND (u.class_id IS NULL OR u.class_id = 0)
                 ORDER BY 
                     CASE WHEN a.time_in IS NOT NULL THEN 0 ELSE 1 END,
@@ -2369,6 +3319,8 @@ def export_daily_attendance_excel():
 @login_required
 def export_monthly_attendance_excel():
     """Export monthly attendance report to Excel - separate sheet per class"""
+    import pandas as pd  # lazy: hanya dibutuhkan untuk export
+    
     try:
         # Get month and year parameters
         month = request.args.get('month', datetime.now().month, type=int)
@@ -2387,6 +3339,7 @@ def export_monthly_attendance_excel():
         last_day = datetime(year, month, calendar.monthrange(year, month)[1]).strftime('%Y-%m-%d')
         
         conn = get_db_connection()
+        attendance = archive.attendance_source(conn, first_day, last_day)
         
         # Get all classes
         classes = conn.execute('SELECT * FROM classes WHERE active = 1 ORDER BY name').fetchall()
@@ -2402,23 +3355,18 @@ def export_monthly_attendance_excel():
             # Process each class
             for cls in classes:
                 # ✅ PERBAIKAN: Tambahkan filter konsisten
-                class_data = conn.execute('''
+                class_data = conn.execute(f'''
                     SELECT 
                         u.full_name as "Nama Lengkap",
                         u.username as "Username",
                         COUNT(CASE WHEN a.time_in IS NOT NULL THEN 1 END) as "Hari Hadir",
                         COUNT(CASE WHEN a.time_in IS NOT NULL AND a.time_out IS NOT NULL THEN 1 END) as "Hadir Lengkap",
                         COUNT(CASE WHEN a.time_in IS NOT NULL AND a.time_out IS NULL THEN 1 END) as "Belum Keluar",
-                        COALESCE(SUM(
-                            CASE WHEN a.time_in IS NOT NULL AND a.time_out IS NOT NULL THEN
-                                CAST((julianday(a.date || ' ' || a.time_out) - 
-                                      julianday(a.date || ' ' || a.time_in)) * 24 AS INTEGER)
-                            ELSE 0 END
-                        ), 0) as total_minutes,
+                        COALESCE(SUM(a.work_minutes), 0) as total_minutes,
                         MIN(a.date) as "Pertama Hadir",
                         MAX(a.date) as "Terakhir Hadir"
                     FROM users u
-                    LEFT JOIN attendance a ON u.id = a.user_id 
+                    LEFT JOIN {attendance} a ON u.id = a.user_id 
                         AND a.date BETWEEN ? AND ?
                         AND a.time_in IS NOT NULL
                     WHERE u.active = 1 
@@ -2486,23 +3434,18 @@ def export_monthly_attendance_excel():
                     })
             
             # Process students without class
-            no_class_data = conn.execute('''
+            no_class_data = conn.execute(f'''
                 SELECT 
                     u.full_name as "Nama Lengkap",
                     u.username as "Username",
                     COUNT(CASE WHEN a.time_in IS NOT NULL THEN 1 END) as "Hari Hadir",
                     COUNT(CASE WHEN a.time_in IS NOT NULL AND a.time_out IS NOT NULL THEN 1 END) as "Hadir Lengkap",
                     COUNT(CASE WHEN a.time_in IS NOT NULL AND a.time_out IS NULL THEN 1 END) as "Belum Keluar",
-                    COALESCE(SUM(
-                        CASE WHEN a.time_in IS NOT NULL AND a.time_out IS NOT NULL THEN
-                            CAST((julianday(a.date || ' ' || a.time_out) - 
-                                  julianday(a.date || ' ' || a.time_in)) * 24 AS INTEGER)
-                        ELSE 0 END
-                    ), 0) as total_minutes,
+                    COALESCE(SUM(a.work_minutes), 0) as total_minutes,
                     MIN(a.date) as "Pertama Hadir",
                     MAX(a.date) as "Terakhir Hadir"
                 FROM users u
-                LEFT JOIN attendance a ON u.id = a.user_id 
+                LEFT JOIN {attendance} a ON u.id = a.user_id 
                     AND a.date BETWEEN ? AND ?
                     AND a.time_in IS NOT NULL
                 WHERE u.active = 1 
@@ -2564,6 +3507,9 @@ def export_monthly_attendance_excel():
                     'Rata-rata Kehadiran (%)': avg_kehadiran
                 })
             
+            # Rekap per hari langsung dari rollup daily_summary
+            daily_totals = daily_summary.totals(conn, first_day, last_day)
+            
             conn.close()
             
             # Create SUMMARY sheet (first sheet)
@@ -2627,6 +3573,22 @@ def export_monthly_attendance_excel():
                             pass
                     adjusted_width = min(max_length + 2, 20)
                     worksheet.column_dimensions[column_letter].width = adjusted_width
+            
+            # Create HARIAN sheet (rekap per tanggal)
+            if daily_totals:
+                df_daily = pd.DataFrame([{
+                    'Tanggal': day,
+                    'Hadir': row['present'],
+                    'Hadir Lengkap': row['complete'],
+                    'Belum Keluar': row['incomplete'],
+                    'Siswa Aktif': row['total_active'],
+                    'Kehadiran (%)': round(row['present'] / row['total_active'] * 100, 1) if row['total_active'] else 0
+                } for day, row in sorted(daily_totals.items())])
+                df_daily.to_excel(writer, sheet_name='Harian', index=False)
+                
+                worksheet = writer.sheets['Harian']
+                for column in worksheet.columns:
+                    worksheet.column_dimensions[column[0].column_letter].width = 15
         
         output.seek(0)
         
@@ -2720,6 +3682,44 @@ def api_cleanup_stats():
         }), 500
         
         
+@app.route('/api/face-cache/stats', methods=['GET'])
+@login_required
+def api_face_cache_stats():
+    """Face encoding cache hit/miss counters (admin only)"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    return jsonify({
+        'success': True,
+        'stats': face_cache.stats()
+    })
+
+@app.route('/api/attendance-log/stats', methods=['GET'])
+@login_required
+def api_attendance_log_stats():
+    """Write-behind attendance_logs buffer counters (admin only)"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    return jsonify({
+        'success': True,
+        'stats': attendance_log.stats()
+    })
+
+@app.route('/api/admission/stats', methods=['GET'])
+@login_required
+def api_admission_stats():
+    """Face request concurrency, queue depth and rejection counters (admin only)"""
+    if session.get('username') != 'admin':
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    return jsonify({
+        'success': True,
+        'stats': admission.stats(),
+        'face_service': face_service.stats()
+    })
+
+
 # Tambahkan endpoint ini ke app.py Anda (letakkan di bagian API routes)
 
 @app.route('/api/classes/list', methods=['GET'])
@@ -2781,14 +3781,9 @@ def index():
         (session['user_id'], today)
     ).fetchone()
     
-    # Get attendance statistics
-    stats = conn.execute(
-        '''SELECT 
-           COUNT(*) as total_days,
-           SUM(CASE WHEN time_in IS NOT NULL THEN 1 ELSE 0 END) as present_days
-           FROM attendance WHERE user_id = ?''',
-        (session['user_id'],)
-    ).fetchone()
+    # Get attendance statistics (termasuk bulan yang sudah diarsipkan)
+    total_days, present_days, _ = archive.user_totals(conn, session['user_id'])
+    stats = {'total_days': total_days, 'present_days': present_days}
     
     # Check if user has face recognition enabled
     face_enabled = conn.execute(
@@ -2810,13 +3805,101 @@ def index():
                          face_recognition_available=FACE_RECOGNITION_AVAILABLE)
 
 
-if __name__ == '__main__':
-    import os
+_app_initialized = False
+
+def init_app():
+    """Database pool, schema upgrades, folders and routes (cheap, idempotent)
+    
+    Runs when app.py is imported, so `gunicorn app:app` and `flask run` get a working app
+    without calling create_app().
+    """
+    global _app_initialized
+    if _app_initialized:
+        return app
+    
+    # Pooled SQLite connections (WAL, busy_timeout, dll) - lihat db.py
+    init_db_pool(app)
+    
+    # Kolom poligon/bounding box untuk database lama
+    conn = get_connection()
+    added = ensure_schema(conn)
+    ensure_idempotency_schema(conn)
+    ensure_log_schema(conn)
+    backfilled = daily_summary.ensure_schema(conn)
+    converted = ensure_work_time_schema(conn)
+    archive.ensure_schema(conn)
+    ensure_offline_schema(conn)
+    ensure_import_schema(conn)
+    ensure_cache_version_schema(conn)
+    conn.close()
+    if added:
+        print(f"✓ coordinates table upgraded: {', '.join(added)}")
+    if backfilled:
+        print(f"✓ daily_summary created, backfilled {backfilled} day(s)")
+    if converted:
+        print(f"✓ attendance time columns added, backfilled {converted} row(s)")
     
-    # Create directories if they don't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     os.makedirs(app.config['FACES_FOLDER'], exist_ok=True)
     
+    if FACE_RECOGNITION_AVAILABLE:
+        init_web_registration(app)
+    _app_initialized = True
+    return app
+
+def check_face_libraries():
+    """Disable face recognition if cv2/face_recognition are installed but cannot be imported"""
+    global FACE_RECOGNITION_AVAILABLE
+    error = face_service.check()
+    if error is not None:
+        FACE_RECOGNITION_AVAILABLE = False
+        print(f"⚠ Face recognition disabled, the face workers cannot load it: {error}")
+    return error is None
+
+def create_app(preload=None, warm_up=None):
+    """Application factory: start background services, optionally loading face data before the first request
+
+    preload  start the face worker pool now and load the dlib models in every worker
+    warm_up  load every active face encoding into face_cache now
+    Both default to FACE_PRELOAD / FACE_WARM_UP; without them everything loads on first use
+    and the face libraries are checked in the background.
+    """
+    if preload is None:
+        preload = FACE_PRELOAD
+    if warm_up is None:
+        warm_up = FACE_WARM_UP or preload
+    
+    init_app()
+    
+    # Log absensi write-behind (replay spool sisa crash sebelumnya)
+    attendance_log.start()
+    
+    if FACE_RECOGNITION_AVAILABLE:
+        if preload or warm_up:
+            if check_face_libraries():
+                if warm_up:
+                    print(f"✓ Face cache warmed up: {face_cache.warm_up()} encodings")
+                if preload:
+                    face_service.start(preload=True)
+        else:
+            # find_spec hanya tahu paket terpasang; import sebenarnya dicek di worker tanpa menahan startup
+            threading.Thread(target=check_face_libraries, name='face-check', daemon=True).start()
+    
+    return app
+
+init_app()
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Run the attendance web app')
+    parser.add_argument('--preload', action='store_true',
+                        help='start face workers and load models at startup (slower start, fast first check-in)')
+    parser.add_argument('--warm-up', action='store_true', help='load all face encodings into memory at startup')
+    parser.add_argument('--asgi', action='store_true',
+                        help='serve through asgi.py with uvicorn (slow uploads do not hold a thread)')
+    args = parser.parse_args()
+    
     # Auto cleanup old attendance photos (7 days retention)
     print("🧹 Running photo cleanup...")
     deleted = cleanup_old_attendance_photos(days_to_keep=7)
@@ -2825,16 +3908,32 @@ if __name__ == '__main__':
     else:
         print("✅ No old photos to delete")
     
-    # Initialize web registration
+    # app.run(debug=True) memakai reloader Werkzeug: proses induk hanya mengawasi file dan
+    # menjalankan ulang skrip ini sebagai proses anak (WERKZEUG_RUN_MAIN=true) yang melayani
+    # request. Worker wajah, cache dan log writer cukup dijalankan di proses anak.
+    reloader_parent = not args.asgi and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+    start_app = lambda: create_app(preload=args.preload or None, warm_up=args.warm_up or None)
+    if not reloader_parent and not args.asgi:
+        start_app()
     if FACE_RECOGNITION_AVAILABLE:
-        init_web_registration(app)
         print("✓ Face recognition enabled")
     else:
         print("⚠ Face recognition disabled - install required packages")
     
     use_ssl = os.path.exists('cert.pem') and os.path.exists('key.pem')
     
-    if use_ssl:
+    if args.asgi:
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit("ASGI mode needs uvicorn: pip install uvicorn")
+        from asgi import create_asgi_app
+        print(f"✓ Running ASGI mode ({'HTTPS' if use_ssl else 'HTTP'}) on port 5000")
+        # Objek app modul ini (__main__), bukan 'asgi:application' yang mengimpor app.py sekali lagi
+        uvicorn.run(create_asgi_app(app, on_startup=start_app), host='0.0.0.0', port=5000,
+                    ssl_certfile='cert.pem' if use_ssl else None,
+                    ssl_keyfile='key.pem' if use_ssl else None)
+    elif use_ssl:
         import ssl
         context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
         context.load_cert_chain('cert.pem', 'key.pem')
@@ -0,0 +1,409 @@
+"""
+Arsip absensi: memindahkan bulan yang sudah tutup dari tabel attendance ke file SQLite terpisah
+Keeps the hot database (and its indexes, VACUUM time and page cache footprint) limited to
+recent months; reports ATTACH only the archive files their date range needs
+
+Satu file per semester (archive/attendance_2025_1.db = Jan-Jun, _2 = Jul-Des), so a
+multi-year range stays well under SQLite's ATTACH limit. The attendance_archive table in
+the hot database records which months live in which file (path relative to the folder of
+the hot database, so the two can be moved together). A month is copied first, then
+row counts and a SHA-256 over the copied rows are compared inside the write transaction
+that deletes them from the hot table and registers the month, so readers never see a
+month twice or not at all. The same transaction stores per-student totals of the month in
+attendance_archive_users, so all-time figures (total kehadiran, terakhir hadir) never need
+to open the archive files.
+
+Archived months are read-only history: class changes and user deletes no longer move
+their daily_summary counts, and rows of a deleted user stay in the archive (joins on
+users skip them).
+
+Penggunaan:
+    python archive.py                     # arsipkan semua bulan yang sudah tutup
+    python archive.py --month 2025-03     # satu bulan
+    python archive.py --list              # bulan yang sudah diarsipkan
+    python archive.py --verify            # cocokkan ulang jumlah baris & checksum tiap arsip
+    python archive.py --vacuum            # VACUUM database utama setelah mengarsipkan
+
+Konfigurasi lewat environment variable:
+    ARCHIVE_DIR           folder file arsip (default: archive, relatif ke folder database)
+    ARCHIVE_MIN_AGE_DAYS  bulan baru boleh diarsipkan N hari setelah berakhir (default 7,
+                          lebih lama dari batas absen offline)
+"""
+
+import calendar
+import hashlib
+import itertools
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+ARCHIVE_MIN_AGE_DAYS = int(os.environ.get('ARCHIVE_MIN_AGE_DAYS', 7))
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS attendance_archive (
+        month TEXT PRIMARY KEY,
+        path TEXT NOT NULL,
+        rows INTEGER NOT NULL,
+        checksum TEXT NOT NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS attendance_archive_users (
+        month TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        days INTEGER NOT NULL,
+        present INTEGER NOT NULL,
+        last_date DATE,
+        PRIMARY KEY (user_id, month)
+    );
+'''
+
+# Total per user sepanjang waktu: tabel utama + ringkasan bulan yang sudah diarsipkan
+USER_TOTALS = '''(
+    SELECT user_id, SUM(days) AS days, SUM(present) AS present, MAX(last_date) AS last_date
+    FROM (
+        SELECT user_id, COUNT(*) AS days, SUM(time_in IS NOT NULL) AS present,
+               MAX(CASE WHEN time_in IS NOT NULL THEN date END) AS last_date
+        FROM main.attendance GROUP BY user_id
+        UNION ALL
+        SELECT user_id, days, present, last_date FROM main.attendance_archive_users
+    )
+    GROUP BY user_id
+)'''
+
+# Nama alias ATTACH unik per pemakaian (koneksi dipakai ulang lewat pool)
+_aliases = itertools.count()
+
+
+class ArchiveError(Exception):
+    """Raised when a month cannot be archived or an archive does not match its registry"""
+
+
+def ensure_schema(conn):
+    """Create the attendance_archive registry on databases that predate it"""
+    conn.executescript(SCHEMA)
+    conn.commit()
+
+
+def month_range(month):
+    """'YYYY-MM' -> ('YYYY-MM-01', 'YYYY-MM-<last day>')"""
+    year, number = (int(part) for part in month.split('-'))
+    return f'{year:04d}-{number:02d}-01', f'{year:04d}-{number:02d}-{calendar.monthrange(year, number)[1]:02d}'
+
+
+def archive_path(month, archive_dir=None):
+    """Archive file of a month, relative to the database folder unless archive_dir is absolute"""
+    year, number = (int(part) for part in month.split('-'))
+    return os.path.join(archive_dir or ARCHIVE_DIR, f'attendance_{year}_{1 if number <= 6 else 2}.db')
+
+
+def _database_dir(conn):
+    """Folder of the main database file (working directory for an in-memory database)"""
+    for row in conn.execute('PRAGMA database_list'):
+        if row[1] == 'main' and row[2]:
+            return os.path.dirname(row[2])
+    return os.getcwd()
+
+
+def resolve_path(conn, path):
+    """Absolute path of a registry entry (relative entries are relative to the database folder)"""
+    return os.path.normpath(os.path.join(_database_dir(conn), path))
+
+
+def _attach_existing(conn, path, alias):
+    """ATTACH an archive that must already exist (SQLite would silently create an empty file)"""
+    if not os.path.exists(path):
+        raise ArchiveError(f'File arsip {path} tidak ditemukan, jalankan python archive.py --verify')
+    conn.execute('ATTACH DATABASE ? AS ' + alias, (path,))
+
+
+def _columns(conn, schema='main'):
+    return [(row[1], row[2]) for row in conn.execute(f'PRAGMA {schema}.table_info(attendance)')]
+
+
+def _checksum(conn, schema, columns, where, params):
+    """(rows, sha256) over the selected attendance rows in id order
+
+    NULL columns are left out, so a column added to the hot table later (NULL in old
+    archive rows) does not change the checksum of months archived before it existed.
+    """
+    digest = hashlib.sha256()
+    rows = 0
+    for row in conn.execute(f"SELECT {', '.join(columns)} FROM {schema}.attendance WHERE {where} ORDER BY id", params):
+        digest.update(repr(sorted((name, value) for name, value in zip(columns, row) if value is not None)).encode())
+        rows += 1
+    return rows, digest.hexdigest()
+
+
+def _prepare_archive(conn, alias, columns):
+    """Create (or widen) the attendance table of an attached archive file"""
+    existing = {name for name, _ in _columns(conn, alias)}
+    if not existing:
+        # Tanpa foreign key: tabel users ada di database utama
+        definitions = ', '.join(
+            'id INTEGER PRIMARY KEY' if name == 'id' else f'{name} {kind}'.strip() for name, kind in columns
+        )
+        conn.execute(f'CREATE TABLE {alias}.attendance ({definitions})')
+        conn.execute(f'CREATE INDEX {alias}.idx_attendance_user_date ON attendance(user_id, date)')
+        conn.execute(f'CREATE INDEX {alias}.idx_attendance_date ON attendance(date)')
+    else:
+        for name, kind in columns:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE {alias}.attendance ADD COLUMN {name} {kind}')
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {alias}.archive_meta (
+        month TEXT PRIMARY KEY, rows INTEGER NOT NULL, checksum TEXT NOT NULL, archived_at TIMESTAMP
+    )''')
+
+
+def last_closed_month(today=None):
+    """Latest 'YYYY-MM' that ended at least ARCHIVE_MIN_AGE_DAYS ago"""
+    cutoff = (today or date.today()) - timedelta(days=ARCHIVE_MIN_AGE_DAYS)
+    if cutoff.day == calendar.monthrange(cutoff.year, cutoff.month)[1]:
+        return cutoff.strftime('%Y-%m')
+    return (cutoff.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+
+
+def closed_months(conn, today=None):
+    """Closed months that still have rows in the hot attendance table"""
+    rows = conn.execute(
+        "SELECT DISTINCT substr(date, 1, 7) AS month FROM attendance WHERE substr(date, 1, 7) <= ? ORDER BY month",
+        (last_closed_month(today),)
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def archive_month(conn, month, archive_dir=None, today=None):
+    """Move one closed month from the hot attendance table into its archive file
+
+    Returns the number of rows moved (0 if the hot table has none for that month).
+    Safe to re-run after a crash or when late rows arrived for an archived month.
+    """
+    first, last = month_range(month)
+    if month > last_closed_month(today):
+        raise ArchiveError(f'Bulan {month} belum tutup (minimal {ARCHIVE_MIN_AGE_DAYS} hari setelah akhir bulan)')
+
+    columns = _columns(conn)
+    names = [name for name, _ in columns]
+    path = resolve_path(conn, archive_path(month, archive_dir))
+    stored = os.path.relpath(path, _database_dir(conn))
+    # File semester yang hilang tidak dibuat ulang kosong selama registry masih menunjuk ke sana
+    if not os.path.exists(path):
+        registered = [
+            row['month'] for row in conn.execute('SELECT month, path FROM attendance_archive ORDER BY month')
+            if resolve_path(conn, row['path']) == path
+        ]
+        if registered:
+            raise ArchiveError(f"File arsip {path} tidak ditemukan, padahal berisi bulan {', '.join(registered)}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    alias = f'archive_{next(_aliases)}'
+    in_month = 'date BETWEEN ? AND ?'
+    moving = 'id IN (SELECT id FROM main.attendance WHERE date BETWEEN ? AND ?)'
+
+    conn.execute('ATTACH DATABASE ? AS ' + alias, (path,))
+    try:
+        # 1. Salin ke file arsip (database utama hanya dibaca)
+        conn.execute('BEGIN')
+        try:
+            _prepare_archive(conn, alias, columns)
+            conn.execute(f'DELETE FROM {alias}.attendance WHERE {moving}', (first, last))
+            copied = conn.execute(
+                f"INSERT INTO {alias}.attendance ({', '.join(names)}) "
+                f"SELECT {', '.join(names)} FROM main.attendance WHERE {in_month}",
+                (first, last)
+            ).rowcount
+            if copied:
+                total, digest = _checksum(conn, alias, names, in_month, (first, last))
+                conn.execute(
+                    f'''INSERT INTO {alias}.archive_meta (month, rows, checksum, archived_at)
+                        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                        ON CONFLICT(month) DO UPDATE SET rows = excluded.rows, checksum = excluded.checksum,
+                                                         archived_at = excluded.archived_at''',
+                    (month, total, digest)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        if not copied:
+            return 0
+
+        # 2. Verifikasi lalu hapus dari tabel utama dalam satu transaksi tulis
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            hot = _checksum(conn, 'main', names, in_month, (first, last))
+            archived = _checksum(conn, alias, names, moving, (first, last))
+            if hot != archived:
+                raise ArchiveError(
+                    f'Verifikasi arsip {month} gagal: {hot[0]} baris utama vs {archived[0]} baris arsip (checksum berbeda)'
+                )
+            total, digest = _checksum(conn, alias, names, in_month, (first, last))
+            conn.execute('DELETE FROM attendance_archive_users WHERE month = ?', (month,))
+            conn.execute(
+                f'''INSERT INTO attendance_archive_users (month, user_id, days, present, last_date)
+                    SELECT ?, user_id, COUNT(*), SUM(time_in IS NOT NULL), MAX(CASE WHEN time_in IS NOT NULL THEN date END)
+                    FROM {alias}.attendance WHERE {in_month}
+                    GROUP BY user_id''',
+                (month, first, last)
+            )
+            conn.execute(f'DELETE FROM main.attendance WHERE {in_month}', (first, last))
+            conn.execute(
+                '''INSERT INTO attendance_archive (month, path, rows, checksum, archived_at)
+                   VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                   ON CONFLICT(month) DO UPDATE SET path = excluded.path, rows = excluded.rows,
+                                                    checksum = excluded.checksum, archived_at = excluded.archived_at''',
+                (month, stored, total, digest)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return hot[0]
+    finally:
+        conn.execute(f'DETACH DATABASE {alias}')
+
+
+def archived_paths(conn, start=None, end=None):
+    """Archive files (absolute paths) holding any month of start..end (YYYY-MM-DD, None = open ended)"""
+    rows = conn.execute(
+        '''SELECT DISTINCT path FROM attendance_archive
+           WHERE (? IS NULL OR month >= substr(?, 1, 7)) AND (? IS NULL OR month <= substr(?, 1, 7))
+           ORDER BY path''',
+        (start, start, end, end)
+    ).fetchall()
+    return sorted({resolve_path(conn, row[0]) for row in rows})
+
+
+def attendance_source(conn, start=None, end=None):
+    """FROM-able attendance source for start..end: the hot table plus the archives it needs
+
+    Returns 'attendance' when no archived month is involved, otherwise a UNION ALL subquery
+    over main and the archive files, which stay attached until the connection goes back to
+    the pool (db.ConnectionPool.release detaches them). Call it outside a write transaction:
+    SQLite cannot ATTACH inside one.
+    """
+    paths = archived_paths(conn, start, end)
+    if not paths:
+        return 'attendance'
+
+    attached = conn.attached
+    missing = [path for path in paths if path not in attached]
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else 10
+    if len(attached) + len(missing) > limit:
+        raise ArchiveError(f'Rentang tanggal membutuhkan {len(paths)} file arsip (maksimal {limit})')
+    for path in missing:
+        # Alias tetap per file: teks query sama setiap request, cache prepared statement tetap kena
+        alias = 'archive_' + os.path.splitext(os.path.basename(path))[0].replace('attendance_', '')
+        _attach_existing(conn, path, alias)
+        attached[path] = alias
+
+    names = [name for name, _ in _columns(conn)]
+    selects = [f"SELECT {', '.join(names)} FROM main.attendance"]
+    for path in paths:
+        alias = attached[path]
+        present = {name for name, _ in _columns(conn, alias)}
+        # Kolom yang ditambahkan setelah bulan itu diarsipkan dibaca sebagai NULL
+        selects.append('SELECT ' + ', '.join(name if name in present else f'NULL AS {name}' for name in names)
+                       + f' FROM {alias}.attendance')
+    return '(' + ' UNION ALL '.join(selects) + ')'
+
+
+def user_totals(conn, user_id):
+    """All-time (days, present, last_date) of one user, archived months included"""
+    row = conn.execute(f'SELECT days, present, last_date FROM {USER_TOTALS} WHERE user_id = ?', (user_id,)).fetchone()
+    return (row['days'], row['present'], row['last_date']) if row else (0, 0, None)
+
+
+def history_start(conn, user_id, needed):
+    """First date from which the archives hold the user's latest `needed` present days
+
+    None if the user has nothing archived. Used to fetch "recent attendance" lists that
+    reach back past the hot table without attaching every archive.
+    """
+    found = 0
+    start = None
+    for row in conn.execute(
+        'SELECT month, present FROM attendance_archive_users WHERE user_id = ? AND present > 0 ORDER BY month DESC',
+        (user_id,)
+    ):
+        start = month_range(row['month'])[0]
+        found += row['present']
+        if found >= needed:
+            break
+    return start
+
+
+def verify(conn):
+    """Recount and re-hash every registered month, returns a list of problems (empty = ok)"""
+    problems = []
+    for entry in conn.execute('SELECT month, path, rows, checksum FROM attendance_archive ORDER BY month').fetchall():
+        month, path = entry['month'], resolve_path(conn, entry['path'])
+        first, last = month_range(month)
+        if not os.path.exists(path):
+            problems.append(f'{month}: file {path} tidak ditemukan')
+            continue
+        alias = f'archive_{next(_aliases)}'
+        conn.execute('ATTACH DATABASE ? AS ' + alias, (path,))
+        try:
+            names = [name for name, _ in _columns(conn, alias)]
+            found = _checksum(conn, alias, names, 'date BETWEEN ? AND ?', (first, last))
+        finally:
+            conn.execute(f'DETACH DATABASE {alias}')
+        if found != (entry['rows'], entry['checksum']):
+            problems.append(f"{month}: {found[0]} baris di arsip, registry mencatat {entry['rows']} (checksum "
+                            f"{'sama' if found[1] == entry['checksum'] else 'berbeda'})")
+        summarized = conn.execute(
+            'SELECT COALESCE(SUM(days), 0) FROM attendance_archive_users WHERE month = ?', (month,)
+        ).fetchone()[0]
+        if summarized != entry['rows']:
+            problems.append(f"{month}: ringkasan per siswa mencatat {summarized} baris, registry {entry['rows']}")
+    return problems
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Archive closed months of attendance into per-semester SQLite files')
+    parser.add_argument('--month', help='YYYY-MM (default: every closed month)')
+    parser.add_argument('--list', action='store_true', help='show archived months')
+    parser.add_argument('--verify', action='store_true', help='check every archive against the registry')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM the main database afterwards')
+    parser.add_argument('--db', default='database.db')
+    args = parser.parse_args()
+
+    if args.month:
+        try:
+            datetime.strptime(args.month, '%Y-%m')
+        except ValueError:
+            parser.error(f'invalid month {args.month!r}, use YYYY-MM')
+
+    conn = get_connection(args.db)
+    try:
+        ensure_schema(conn)
+        if args.list:
+            for row in conn.execute('SELECT month, rows, path, archived_at FROM attendance_archive ORDER BY month'):
+                print(f"{row['month']}  {row['rows']:>8} rows  {row['path']}  ({row['archived_at']})")
+        elif args.verify:
+            problems = verify(conn)
+            for problem in problems:
+                print(f"❌ {problem}")
+            if problems:
+                raise SystemExit(1)
+            print("✅ All archives match their registry")
+        else:
+            months = [args.month] if args.month else closed_months(conn)
+            for month in months:
+                try:
+                    moved = archive_month(conn, month)
+                except ArchiveError as e:
+                    print(f"⚠ {e}")
+                    continue
+                print(f"✓ {month}: {moved} rows archived to {resolve_path(conn, archive_path(month))}")
+            if not months:
+                print("Tidak ada bulan yang perlu diarsipkan")
+            if args.vacuum:
+                conn.execute('VACUUM')
+                print("✓ Main database vacuumed")
+    finally:
+        conn.close()
@@ -0,0 +1,193 @@
+"""
+ASGI entry point untuk sistem absensi
+Receives request bodies on the event loop, so a slow mobile upload costs a coroutine
+instead of a thread; Flask only runs (in a thread pool) once the whole body is in memory
+
+Jalankan dengan:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+atau: python app.py --asgi
+
+DB access and face verification dispatch run in the executor threads, CPU-heavy dlib
+work stays in the face worker processes (lihat face_service.py).
+
+Konfigurasi lewat environment variable:
+    ASGI_THREADS  jumlah thread untuk menjalankan Flask (default 32)
+"""
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 32))
+
+
+def build_environ(scope, body):
+    """WSGI environ for a buffered ASGI HTTP request"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = f'HTTP_{name}'
+        if key in environ:
+            value = f"{environ[key]}{'; ' if name == 'COOKIE' else ','}{value}"
+        environ[key] = value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ):
+    """Call the WSGI app in an executor thread, returns (status, headers, body)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = headers
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response['status'], response['headers'], body
+
+
+class AsgiAdapter:
+    """Serve a WSGI app over ASGI with the request body received asynchronously"""
+
+    def __init__(self, wsgi_app, max_body, threads=ASGI_THREADS, on_startup=None, on_shutdown=None):
+        self.wsgi_app = wsgi_app
+        self.max_body = max_body
+        self.on_startup = on_startup
+        self.on_shutdown = on_shutdown
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-flask')
+        self._started = False
+        self._start_lock = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def startup(self):
+        """Run on_startup once, from lifespan or (servers without lifespan) the first request"""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if not self._started:
+                if self.on_startup:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, self.on_startup)
+                self._started = True
+
+    async def lifespan(self, receive, send):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.on_shutdown:
+                    await loop.run_in_executor(self.executor, self.on_shutdown)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        if not self._started:
+            await self.startup()
+
+        # Terima seluruh body dulu (upload lambat tidak memakai thread)
+        chunks = []
+        received = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunk = message.get('body', b'')
+            received += len(chunk)
+            if self.max_body and received > self.max_body:
+                await self.send_response(send, 413, [('Content-Type', 'text/plain')], b'Request Entity Too Large')
+                return
+            chunks.append(chunk)
+            more_body = message.get('more_body', False)
+
+        environ = build_environ(scope, b''.join(chunks))
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(self.executor, run_wsgi, self.wsgi_app, environ)
+        await self.send_response(send, status, headers, body)
+
+    async def send_response(self, send, status, headers, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def _startup():
+    from app import create_app
+    create_app()
+
+
+def _shutdown():
+    from face_service import face_service
+    face_service.shutdown()
+    face_service.shutdown_finalizer()
+
+
+def create_asgi_app(flask_app=None, on_startup=None):
+    """ASGI application wrapping the Flask app (create_app() runs at lifespan startup)
+
+    `python app.py --asgi` passes its own app and startup hook, so app.py is not imported
+    a second time under the name 'app'.
+    """
+    if flask_app is None:
+        from app import app as flask_app
+    return AsgiAdapter(flask_app, flask_app.config['MAX_CONTENT_LENGTH'],
+                       on_startup=on_startup or _startup, on_shutdown=_shutdown)
+
+
+def __getattr__(name):
+    # `application` dibuat saat pertama diminta (uvicorn asgi:application), supaya
+    # `python app.py --asgi` bisa memakai modul ini tanpa mengimpor app.py lagi
+    if name == 'application':
+        globals()['application'] = create_asgi_app()
+        return globals()['application']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,294 @@
+"""
+Write-behind buffer untuk tabel attendance_logs
+Takes log inserts out of the check-in/check-out transaction: events are buffered in memory
+and written with one executemany per batch, by a background thread
+
+Every event is first appended to a small spool file (one JSON line) so a crash before the
+flush loses nothing: spool files left behind are replayed by the next start(). Each event
+carries an event_id with a unique index, so replaying an already flushed spool is harmless.
+A spool file is owned through the flock its writer holds until the file is removed (not
+through the PID in its name: PIDs are reused, in Docker every container is PID 1), so any
+unlocked spool file is a leftover and gets replayed.
+
+Konfigurasi lewat environment variable:
+    LOG_BATCH_SIZE      flush kalau buffer sudah sebanyak ini (default 100)
+    LOG_FLUSH_INTERVAL  flush paling lambat setiap N detik (default 1)
+    LOG_SPOOL_DIR       folder spool file (default: log_spool)
+    LOG_SPOOL_FSYNC     1 = fsync setiap event (tahan mati listrik, lebih lambat)
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+from db import get_connection
+
+try:
+    import fcntl
+except ImportError:  # Windows: tidak ada flock
+    fcntl = None
+
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 100))
+LOG_FLUSH_INTERVAL = float(os.environ.get('LOG_FLUSH_INTERVAL', 1))
+LOG_SPOOL_DIR = os.environ.get('LOG_SPOOL_DIR', 'log_spool')
+LOG_SPOOL_FSYNC = os.environ.get('LOG_SPOOL_FSYNC', '0') == '1'
+
+COLUMNS = ('event_id', 'user_id', 'action', 'timestamp', 'latitude', 'longitude',
+           'device_info', 'ip_address', 'success', 'error_message')
+
+# Event untuk user yang sudah dihapus dilewati (foreign key), duplikat replay diabaikan
+INSERT_SQL = f'''
+    INSERT OR IGNORE INTO attendance_logs ({', '.join(COLUMNS)})
+    SELECT {', '.join('?' * len(COLUMNS))}
+    WHERE EXISTS (SELECT 1 FROM users WHERE id = ?)
+'''
+
+
+def ensure_schema(conn):
+    """Add attendance_logs.event_id (replay-safe spool) on databases that predate it"""
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(attendance_logs)')}
+    added = 'event_id' not in columns
+    if added:
+        conn.execute('ALTER TABLE attendance_logs ADD COLUMN event_id TEXT')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_event ON attendance_logs(event_id)')
+    conn.commit()
+    return added
+
+
+class AttendanceLogWriter:
+    def __init__(self, db_path='database.db', spool_dir=LOG_SPOOL_DIR,
+                 batch_size=LOG_BATCH_SIZE, interval=LOG_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._buffer = []
+        self._retry = []
+        self._sealed = []
+        self._spool = None
+        self._spool_path = None
+        self._seq = 0
+        # Nama spool unik per writer, PID saja bisa dipakai ulang oleh proses berikutnya
+        self._token = uuid.uuid4().hex[:8]
+        self._atexit = False
+        self.logged = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.recovered = 0
+
+    def start(self):
+        """Replay spool files left by a crashed process, then start the flush thread"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            # Path absolut: proses boleh chdir setelah start
+            self.spool_dir = os.path.abspath(self.spool_dir)
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self._open_spool()
+            self._thread = threading.Thread(target=self._run, name='attendance-log-writer', daemon=True)
+            self._thread.start()
+        try:
+            recovered = self._recover()
+        except Exception as e:
+            recovered = 0
+            print(f"⚠ Attendance log spool replay failed, files kept for next start: {e}")
+        if recovered:
+            self.recovered += recovered
+            print(f"✓ Attendance log spool replayed: {recovered} events")
+        if not self._atexit:
+            atexit.register(self.stop)
+            self._atexit = True
+
+    def stop(self):
+        """Flush what is left and stop the thread (also runs at interpreter exit)"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=10)
+        self.flush()
+        with self._lock:
+            if self._spool is not None:
+                empty = self._spool.tell() == 0
+                self._spool.close()
+                if empty:
+                    try:
+                        os.remove(self._spool_path)
+                    except OSError:
+                        pass
+                self._spool = None
+            self._thread = None
+        self._stop.clear()
+
+    def log(self, user_id, action, success=True, latitude=None, longitude=None,
+            error_message=None, ip_address=None, device_info=None):
+        """Queue one attendance_logs row (timestamp = now, UTC like CURRENT_TIMESTAMP)"""
+        if self._thread is None:
+            self.start()
+        event = {
+            'event_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'action': action,
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+            'latitude': latitude,
+            'longitude': longitude,
+            'device_info': device_info,
+            'ip_address': ip_address,
+            'success': 1 if success else 0,
+            'error_message': error_message,
+        }
+        with self._lock:
+            self._spool.write(json.dumps(event) + '\n')
+            self._spool.flush()
+            if LOG_SPOOL_FSYNC:
+                os.fsync(self._spool.fileno())
+            self._buffer.append(event)
+            self.logged += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """Write everything buffered so far in one transaction, returns the number of events"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer and not self._retry:
+                    return 0
+                batch = self._retry + self._buffer
+                self._buffer = []
+                self._retry = []
+                # Spool yang isinya ikut batch ini ditutup, event baru masuk spool baru
+                if self._spool is not None and self._spool.tell() > 0:
+                    # Rename tidak melepas flock: file sealed tetap terkunci sampai dihapus
+                    try:
+                        os.replace(self._spool_path, f'{self._spool_path}.sealed')
+                        self._sealed.append((f'{self._spool_path}.sealed', self._spool))
+                    except OSError as e:
+                        self._spool.close()
+                        print(f"⚠ attendance_logs spool could not be sealed: {e}")
+                    self._open_spool()
+                sealed = list(self._sealed)
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                with self._lock:
+                    self._retry = batch + self._retry
+                    self.failures += 1
+                print(f"⚠ attendance_logs flush failed ({len(batch)} events kept): {e}")
+                return 0
+
+            with self._lock:
+                self._sealed = [item for item in self._sealed if item not in sealed]
+                self.flushed += len(batch)
+                self.batches += 1
+            for path, f in sealed:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                f.close()
+            return len(batch)
+
+    def _write(self, events):
+        conn = get_connection(self.db_path)
+        try:
+            conn.executemany(INSERT_SQL, [
+                tuple(event[column] for column in COLUMNS) + (event['user_id'],) for event in events
+            ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _open_spool(self):
+        self._seq += 1
+        self._spool_path = os.path.join(self.spool_dir, f'{os.getpid()}.{self._token}.{self._seq}.spool')
+        self._spool = open(self._spool_path, 'a', encoding='utf-8')
+        if fcntl is not None:
+            # Tanda spool ini milik proses yang masih hidup (dilepas otomatis kalau proses mati)
+            fcntl.flock(self._spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _claim(self, path):
+        """Open a leftover spool file with its lock held, None if a live writer still owns it"""
+        if os.path.basename(path).startswith(f'{os.getpid()}.{self._token}.'):
+            return None
+        if fcntl is None:
+            # Tanpa flock hanya nama file yang bisa dicek
+            if os.path.basename(path).startswith(f'{os.getpid()}.'):
+                return None
+            return open(path, encoding='utf-8')
+        try:
+            f = open(path, encoding='utf-8')
+        except FileNotFoundError:
+            return None  # sudah di-replay/di-flush proses lain
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        if not os.path.exists(path):
+            f.close()  # dihapus pemiliknya tepat sebelum kita mengunci
+            return None
+        return f
+
+    def _recover(self):
+        recovered = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, '*.spool*'))):
+            f = self._claim(path)
+            if f is None:
+                continue
+            with f:
+                events = []
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # Baris terakhir terpotong saat crash
+                        continue
+                if events:
+                    self._write(events)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            recovered += len(events)
+        return recovered
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠ attendance_logs writer error: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'buffered': len(self._buffer) + len(self._retry),
+                'logged': self.logged,
+                'flushed': self.flushed,
+                'batches': self.batches,
+                'failures': self.failures,
+                'recovered': self.recovered,
+                'batch_size': self.batch_size,
+                'interval': self.interval,
+            }
+
+
+# Process-wide instance dipakai app.py
+attendance_log = AttendanceLogWriter()
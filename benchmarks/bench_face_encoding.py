@@ -0,0 +1,86 @@
+"""
+Benchmark: legacy JSON face_encoding vs binary BLOB (face_codec.py)
+
+Builds two throwaway databases with the same synthetic encodings and compares
+decode time per row and database file size.
+
+Usage: python benchmarks/bench_face_encoding.py [--users 5000] [--repeat 3]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from face_codec import decode_encoding, encode_encoding
+
+
+def build_db(path, encodings, encoder):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE face_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            face_encoding BLOB NOT NULL,
+            active INTEGER DEFAULT 1
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO face_data (user_id, face_encoding) VALUES (?, ?)',
+        [(i, encoder(e)) for i, e in enumerate(encodings)]
+    )
+    conn.commit()
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def time_decode(path, repeat):
+    conn = sqlite3.connect(path)
+    rows = conn.execute('SELECT face_encoding FROM face_data WHERE active = 1').fetchall()
+    conn.close()
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for (raw,) in rows:
+            decode_encoding(raw)
+        best = min(best, time.perf_counter() - start)
+    return best / len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    encodings = rng.normal(0, 0.1, size=(args.users, 128))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_db = os.path.join(tmp, 'json.db')
+        blob_db = os.path.join(tmp, 'blob.db')
+
+        json_size = build_db(json_db, encodings, lambda e: json.dumps(e.tolist()))
+        blob_size = build_db(blob_db, encodings, encode_encoding)
+
+        json_decode = time_decode(json_db, args.repeat)
+        blob_decode = time_decode(blob_db, args.repeat)
+
+    print(f"Users: {args.users}")
+    print(f"{'format':<8} {'db size (KB)':>14} {'bytes/user':>12} {'decode (us/row)':>17}")
+    print(f"{'json':<8} {json_size / 1024:>14.1f} {json_size / args.users:>12.0f} {json_decode * 1e6:>17.2f}")
+    print(f"{'blob':<8} {blob_size / 1024:>14.1f} {blob_size / args.users:>12.0f} {blob_decode * 1e6:>17.2f}")
+    print(f"Size: {json_size / blob_size:.1f}x smaller, decode: {json_decode / blob_decode:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: full-resolution load_image_file vs reduced-scale face_pipeline
+
+Runs every configuration over the enrollment photos in faces/ and the check-in
+photos in uploads/, reporting latency and match accuracy at the app threshold.
+
+Usage: python benchmarks/bench_face_pipeline.py [--megapixels 12] [--threshold 0.4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.face_dataset import load_enrollments, load_probes, percentile, upscale_copies
+from face_pipeline import encode_faces
+
+# (label, max_edge, detect_scale); max_edge None = baseline face_recognition.load_image_file
+CONFIGS = [
+    ('baseline (full res)', None, None),
+    ('max_edge=0 detect/1', 0, 1),
+    ('max_edge=1024 detect/2', 1024, 2),
+    ('max_edge=640 detect/1', 640, 1),
+    ('max_edge=640 detect/2', 640, 2),
+    ('max_edge=480 detect/2', 480, 2),
+    ('max_edge=320 detect/1', 320, 1),
+]
+
+
+def baseline_encode(path):
+    import face_recognition
+    image = face_recognition.load_image_file(path)
+    return face_recognition.face_encodings(image)
+
+
+def run_config(max_edge, detect_scale, items):
+    """Encode every item, returns ({path: encoding or None}, [latency seconds])"""
+    encodings = {}
+    latencies = []
+    for item in items:
+        path = item[1]
+        start = time.perf_counter()
+        if max_edge is None:
+            found = baseline_encode(path)
+        else:
+            found = encode_faces(path, max_edge=max_edge, detect_scale=detect_scale)
+        latencies.append(time.perf_counter() - start)
+        encodings[path] = found[0] if len(found) == 1 else None
+    return encodings, latencies
+
+
+def accuracy(encodings, enrollments, probes, threshold):
+    genuine_ok = genuine_total = impostor_ok = impostor_total = 0
+    for user_id, probe_path, _ in probes:
+        probe = encodings.get(probe_path)
+        for enrolled_id, enroll_path in enrollments:
+            enrolled = encodings.get(enroll_path)
+            if probe is None or enrolled is None:
+                distance = None
+            else:
+                distance = float(np.linalg.norm(enrolled - probe))
+            accepted = distance is not None and distance < threshold
+            if enrolled_id == user_id:
+                genuine_total += 1
+                genuine_ok += accepted
+            else:
+                impostor_total += 1
+                impostor_ok += not accepted
+    return genuine_ok, genuine_total, impostor_ok, impostor_total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--megapixels', type=float, default=0,
+                        help='upscale photos to N megapixels first to simulate phone cameras')
+    parser.add_argument('--threshold', type=float, default=0.4)
+    args = parser.parse_args()
+
+    enrollments = load_enrollments()
+    probes = load_probes()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.megapixels:
+            enrollments = upscale_copies(enrollments, os.path.join(tmp, 'faces'), args.megapixels)
+            probes = upscale_copies(probes, os.path.join(tmp, 'uploads'), args.megapixels)
+
+        items = enrollments + probes
+        print(f"{len(enrollments)} enrollment photo(s), {len(probes)} check-in photo(s), threshold {args.threshold}")
+        print(f"{'config':<24} {'mean ms':>8} {'p95 ms':>8} {'faces':>7} {'genuine acc':>12} {'impostor rej':>13}")
+
+        for label, max_edge, detect_scale in CONFIGS:
+            encodings, latencies = run_config(max_edge, detect_scale, items)
+            found = sum(1 for e in encodings.values() if e is not None)
+            g_ok, g_total, i_ok, i_total = accuracy(encodings, enrollments, probes, args.threshold)
+            print(
+                f"{label:<24} {np.mean(latencies) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+                f"{found:>3}/{len(items):<3} {g_ok:>5}/{g_total:<6} {i_ok:>6}/{i_total:<6}"
+            )
+
+
+if __name__ == '__main__':
+    main()
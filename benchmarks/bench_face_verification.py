@@ -0,0 +1,192 @@
+"""
+Benchmark: face verification cost and accuracy, as JSON
+
+Pairs the enrollment photos in faces/ with the check-in (<id>_...jpg) and
+check-out (<id>_keluar_...jpg) photos in uploads/ and reports:
+    - p50/p95/p99 latency per stage (decode, detect, encode, match, total)
+    - genuine/impostor distance histograms
+    - FAR/FRR at several thresholds
+
+Usage: python benchmarks/bench_face_verification.py [--repeat 3] [--thresholds 0.3 0.35 0.4 0.45 0.5 0.6]
+                                                    [--bins 0.05] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import face_pipeline
+from benchmarks.face_dataset import ROOT, load_enrollments, load_probes, percentile
+from face_cache import sample_distance
+from face_pipeline import encode_faces
+
+STAGES = ('decode', 'detect', 'encode', 'match', 'total')
+DEFAULT_THRESHOLDS = [0.3, 0.35, 0.4, 0.45, 0.5, 0.6]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latency_summary(values):
+    """Milliseconds, rounded for readable diffs between releases"""
+    return {
+        'count': len(values),
+        'mean_ms': round(float(np.mean(values)) * 1000, 3) if values else None,
+        'p50_ms': round(percentile(values, 50) * 1000, 3) if values else None,
+        'p95_ms': round(percentile(values, 95) * 1000, 3) if values else None,
+        'p99_ms': round(percentile(values, 99) * 1000, 3) if values else None,
+    }
+
+
+def encode_all(paths, repeat, stage_times):
+    """Encode every photo `repeat` times, keeping the encodings of the first pass"""
+    encodings = {}
+    for run in range(repeat):
+        for path in paths:
+            timings = {}
+            found = encode_faces(path, timings=timings)
+            for stage in ('decode', 'detect', 'encode'):
+                stage_times[stage].append(timings[stage])
+            if run == 0:
+                encodings[path] = found[0] if len(found) == 1 else None
+    return encodings
+
+
+def pair_distances(enrollments, probes, encodings, stage_times):
+    """Distance of every probe to every enrollment, split into genuine and impostor"""
+    genuine, impostor = [], []
+    for user_id, probe_path, _ in probes:
+        probe = encodings.get(probe_path)
+        if probe is None:
+            continue
+        for enrolled_id, enroll_path in enrollments:
+            enrolled = encodings.get(enroll_path)
+            if enrolled is None:
+                continue
+            start = time.perf_counter()
+            distance = sample_distance(enrolled, probe)
+            stage_times['match'].append(time.perf_counter() - start)
+            (genuine if enrolled_id == user_id else impostor).append(distance)
+    return genuine, impostor
+
+
+def histogram(values, bin_width, upper):
+    edges = np.arange(0.0, upper + bin_width, bin_width)
+    counts, edges = np.histogram(values, bins=edges)
+    return {
+        'bin_edges': [round(float(e), 4) for e in edges],
+        'counts': [int(c) for c in counts],
+    }
+
+
+def error_rates(genuine, impostor, thresholds):
+    """FAR = impostor pairs accepted, FRR = genuine pairs rejected (distance < threshold = accept)"""
+    genuine = np.asarray(genuine)
+    impostor = np.asarray(impostor)
+    rates = []
+    for threshold in thresholds:
+        rates.append({
+            'threshold': threshold,
+            'far': round(float((impostor < threshold).mean()), 4) if len(impostor) else None,
+            'frr': round(float((genuine >= threshold).mean()), 4) if len(genuine) else None,
+            'false_accepts': int((impostor < threshold).sum()),
+            'false_rejects': int((genuine >= threshold).sum()),
+        })
+    return rates
+
+
+def distance_summary(values):
+    if not values:
+        return None
+    return {
+        'count': len(values),
+        'min': round(float(np.min(values)), 4),
+        'mean': round(float(np.mean(values)), 4),
+        'max': round(float(np.max(values)), 4),
+    }
+
+
+def run(repeat=3, thresholds=None, bin_width=0.05):
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    enrollments = load_enrollments()
+    probes = load_probes()
+
+    stage_times = {stage: [] for stage in STAGES}
+    paths = [path for _, path in enrollments] + [path for _, path, _ in probes]
+    encodings = encode_all(paths, repeat, stage_times)
+    stage_times['total'] = [
+        d + t + e for d, t, e in zip(stage_times['decode'], stage_times['detect'], stage_times['encode'])
+    ]
+
+    genuine, impostor = pair_distances(enrollments, probes, encodings, stage_times)
+    upper = max([0.8] + genuine + impostor)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'repeat': repeat,
+            'pipeline': {
+                'max_edge': face_pipeline.FACE_MAX_EDGE,
+                'detect_scale': face_pipeline.FACE_DETECT_SCALE,
+                'upsample': face_pipeline.FACE_UPSAMPLE,
+            },
+        },
+        'dataset': {
+            'enrollments': len(enrollments),
+            'probes': len(probes),
+            'check_in_probes': sum(1 for p in probes if p[2] == 'check_in'),
+            'check_out_probes': sum(1 for p in probes if p[2] == 'check_out'),
+            'no_single_face': sorted(
+                os.path.relpath(path, ROOT) for path, encoding in encodings.items() if encoding is None
+            ),
+        },
+        'latency': {stage: latency_summary(stage_times[stage]) for stage in STAGES},
+        'distances': {
+            'genuine': distance_summary(genuine),
+            'impostor': distance_summary(impostor),
+        },
+        'histogram': {
+            'genuine': histogram(genuine, bin_width, upper),
+            'impostor': histogram(impostor, bin_width, upper),
+        },
+        'error_rates': error_rates(genuine, impostor, thresholds),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=3, help='encode every photo N times for latency percentiles')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=DEFAULT_THRESHOLDS)
+    parser.add_argument('--bins', type=float, default=0.05, help='histogram bin width')
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.thresholds, args.bins)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"✓ Results written to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
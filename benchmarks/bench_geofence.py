@@ -0,0 +1,151 @@
+"""
+Benchmark: geofence check at district scale
+
+Compares, for 10 / 1k / 50k synthetic sites:
+    loop     the old per-row Python haversine loop over every active coordinate
+    vector   one vectorized haversine over all sites (SiteSnapshot)
+    grid     the grid index (SiteIndex), exact test only for nearby sites
+plus the cost of a full index build vs one incremental site update.
+
+Usage: python benchmarks/bench_geofence.py [--sizes 10 1000 50000] [--probes 2000]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.face_dataset import percentile
+from geofence import SiteIndex, SiteSnapshot
+
+# Kira-kira satu kabupaten/kota besar (Bekasi) sampai satu provinsi untuk 50k site
+REGION = (-6.9, -6.1, 106.4, 107.8)
+
+# (sites, probe) yang pernah beda antara grid dan vector: posisi di dalam A dekat tepi
+# radiusnya, di cell yang tidak tertutup bbox A; B (di luar) ada di cell itu
+EDGE_CASES = [
+    ([{'id': 1, 'name': 'A', 'latitude': 0.011012, 'longitude': 0.005, 'radius': 1000},
+      {'id': 2, 'name': 'B', 'latitude': 0.0305, 'longitude': 0.005, 'radius': 100}],
+     (0.020002, 0.005)),
+]
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Copy of the original app.haversine, used by the loop baseline"""
+    R = 6371000
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1-a)))
+
+
+def loop_in_area(rows, latitude, longitude):
+    for row in rows:
+        if haversine(latitude, longitude, row['latitude'], row['longitude']) <= row['radius']:
+            return True
+    return False
+
+
+def synthetic_sites(n, rng):
+    lat_lo, lat_hi, lon_lo, lon_hi = REGION
+    lats = rng.uniform(lat_lo, lat_hi, n)
+    lons = rng.uniform(lon_lo, lon_hi, n)
+    radii = rng.integers(50, 500, n)
+    return [
+        {'id': i + 1, 'name': f'Site {i + 1}', 'latitude': float(lat), 'longitude': float(lon), 'radius': int(r)}
+        for i, (lat, lon, r) in enumerate(zip(lats, lons, radii))
+    ]
+
+
+def synthetic_probes(rows, n, rng):
+    """Half near a random site (mostly inside), half anywhere in the region"""
+    lat_lo, lat_hi, lon_lo, lon_hi = REGION
+    probes = []
+    for k in range(n):
+        if k % 2 == 0:
+            row = rows[rng.integers(0, len(rows))]
+            jitter = row['radius'] / 111320 * 0.7
+            probes.append((row['latitude'] + rng.uniform(-jitter, jitter), row['longitude'] + rng.uniform(-jitter, jitter)))
+        else:
+            probes.append((rng.uniform(lat_lo, lat_hi), rng.uniform(lon_lo, lon_hi)))
+    return probes
+
+
+def timed(fn, probes):
+    latencies = []
+    results = []
+    for latitude, longitude in probes:
+        start = time.perf_counter()
+        results.append(fn(latitude, longitude))
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def check_edge_cases():
+    """Grid and vector must agree on EDGE_CASES, returns the number of mismatches"""
+    mismatches = 0
+    for rows, (latitude, longitude) in EDGE_CASES:
+        expected = SiteSnapshot(rows).locate(latitude, longitude)
+        got = SiteIndex(rows).locate(latitude, longitude)
+        if (got['inside'], got['site_id'], got['distance']) != (expected['inside'], expected['site_id'], expected['distance']):
+            mismatches += 1
+            print(f"❌ ({latitude}, {longitude}): grid {got} != vector {expected}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 50000])
+    parser.add_argument('--probes', type=int, default=2000)
+    parser.add_argument('--loop-probes', type=int, default=200, help='probes for the slow loop baseline')
+    args = parser.parse_args()
+
+    print(f"{len(EDGE_CASES) - check_edge_cases()}/{len(EDGE_CASES)} edge cases match")
+    rng = np.random.default_rng(9)
+    print(f"{'sites':>7} {'method':<7} {'p50 us':>9} {'p99 us':>9}   notes")
+
+    for size in args.sizes:
+        rows = synthetic_sites(size, rng)
+        probes = synthetic_probes(rows, args.probes, rng)
+
+        loop_lat, loop_res = timed(lambda la, lo: loop_in_area(rows, la, lo), probes[:args.loop_probes])
+        snapshot = SiteSnapshot(rows)
+        vec_lat, vec_res = timed(snapshot.locate, probes)
+
+        start = time.perf_counter()
+        index = SiteIndex(rows)
+        build = time.perf_counter() - start
+        grid_lat, grid_res = timed(index.locate, probes)
+
+        # Update satu site (geser + ubah radius) vs build ulang semua
+        moved = dict(rows[0], latitude=rows[0]['latitude'] + 0.001, radius=300)
+        start = time.perf_counter()
+        index.add(moved)
+        update = time.perf_counter() - start
+        index.add(rows[0])
+
+        inside_mismatch = sum(v['inside'] != g['inside'] for v, g in zip(vec_res, grid_res))
+        loop_mismatch = sum(l != v['inside'] for l, v in zip(loop_res, vec_res))
+        nearest_mismatch = sum(
+            v['site_id'] != g['site_id'] and abs(v['distance'] - g['distance']) > 0.5
+            for v, g in zip(vec_res, grid_res)
+        )
+        inside = sum(v['inside'] for v in vec_res)
+
+        print(f"{size:>7} {'loop':<7} {percentile(loop_lat, 50) * 1e6:>9.1f} {percentile(loop_lat, 99) * 1e6:>9.1f}"
+              f"   {loop_mismatch} inside mismatches vs vector")
+        print(f"{size:>7} {'vector':<7} {percentile(vec_lat, 50) * 1e6:>9.1f} {percentile(vec_lat, 99) * 1e6:>9.1f}"
+              f"   {inside}/{len(probes)} probes inside")
+        print(f"{size:>7} {'grid':<7} {percentile(grid_lat, 50) * 1e6:>9.1f} {percentile(grid_lat, 99) * 1e6:>9.1f}"
+              f"   {len(index.cells)} cells, build {build * 1000:.1f} ms, update {update * 1e6:.0f} us, "
+              f"{inside_mismatch} inside / {nearest_mismatch} nearest mismatches")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: kiosk 1:N identification over the preloaded encoding matrix
+
+Times EncodingMatrix.nearest (one vectorized distance computation) against a
+per-user Python loop, for several enrolled-user counts. Target: < 50 ms at 10k users.
+
+Usage: python benchmarks/bench_kiosk_match.py [--sizes 1000 10000 50000] [--probes 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.face_dataset import percentile
+from face_cache import EncodingMatrix
+
+TARGET_MS = 50
+
+
+def synthetic_encodings(n, rng):
+    return rng.normal(0, 0.1, size=(n, 128)).astype(np.float32)
+
+
+def time_vectorized(matrix, probes):
+    latencies = []
+    for probe in probes:
+        start = time.perf_counter()
+        matrix.nearest(probe)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def time_loop(encodings, probes):
+    """Baseline: satu np.linalg.norm per user seperti verifikasi 1:1 yang diulang
+
+    Returns (latencies, index of the nearest encoding per probe).
+    """
+    latencies = []
+    nearest = []
+    for probe in probes:
+        start = time.perf_counter()
+        best = min(range(len(encodings)), key=lambda i: np.linalg.norm(encodings[i] - probe))
+        latencies.append(time.perf_counter() - start)
+        nearest.append(best)
+    return latencies, nearest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--probes', type=int, default=200)
+    parser.add_argument('--loop-probes', type=int, default=5, help='probes for the slow per-user loop baseline')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    print(f"{'users':>8} {'build ms':>9} {'p50 ms':>8} {'p99 ms':>8} {'loop p50 ms':>12}  target")
+
+    ok = True
+    for size in args.sizes:
+        encodings = synthetic_encodings(size, rng)
+        user_ids = np.arange(1, size + 1)
+
+        start = time.perf_counter()
+        matrix = EncodingMatrix(user_ids, encodings)
+        build = time.perf_counter() - start
+
+        # Probe = encoding yang terdaftar + noise kecil, seperti foto absen asli
+        picks = rng.integers(0, size, args.probes)
+        probes = encodings[picks] + rng.normal(0, 0.02, size=(args.probes, 128)).astype(np.float32)
+
+        latencies = time_vectorized(matrix, probes)
+        loop, loop_nearest = time_loop(encodings, probes[:args.loop_probes])
+
+        p99 = percentile(latencies, 99) * 1000
+        passed = p99 < TARGET_MS or size > 10000
+        ok = ok and passed
+        verdict = ('PASS' if p99 < TARGET_MS else 'FAIL') if size <= 10000 else '-'
+        print(
+            f"{size:>8} {build * 1000:>9.1f} {percentile(latencies, 50) * 1000:>8.2f} {p99:>8.2f} "
+            f"{percentile(loop, 50) * 1000:>12.1f}  {verdict}"
+        )
+
+        correct = sum(matrix.nearest(p)[0] == user_ids[i] for p, i in zip(probes[:50], picks[:50]))
+        if correct != min(50, args.probes):
+            print(f"   ⚠️ only {correct}/50 probes matched their own user")
+        # Loop dan matrix harus memilih user yang sama
+        differ = sum(matrix.nearest(p)[0] != user_ids[i] for p, i in zip(probes, loop_nearest))
+        if differ:
+            print(f"   ⚠️ {differ}/{len(loop_nearest)} loop probes picked a different user than the matrix")
+            ok = False
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,288 @@
+"""
+Benchmark: WSGI vs ASGI (asgi.py under uvicorn) serving with slow mobile uploads
+
+Runs on a copy of database.db in a temp directory. Every slow client uploads a photo to
+/absen_masuk as a trickle (--upload-seconds for the whole body), the way a phone on weak
+3G does. Meanwhile a probe requests /api/office-coordinates every 100 ms. Reported per mode:
+completed uploads, server time after the last byte, probe latency, and the peak thread
+count and memory (RSS) of the server process.
+
+Modes:
+    wsgi       app.run(threaded=True) - one new thread per connection (how app.py runs)
+    wsgi-pool  WSGI server with a fixed pool of --threads threads (like gunicorn gthread)
+    asgi       asgi.py under uvicorn, Flask in ASGI_THREADS=--threads executor threads
+
+The synthetic students have no face data, so /absen_masuk parses the upload and answers
+without face work: the benchmark measures the serving mode, not dlib. Admission control
+is opened up for the run (ADMISSION_LIMIT/ADMISSION_QUEUE) for the same reason.
+
+Needs uvicorn for the asgi mode (pip install uvicorn).
+
+Usage: python benchmarks/bench_serving_modes.py [--clients 300] [--upload-seconds 5] [--photo-kb 150]
+                                                [--threads 32] [--modes wsgi wsgi-pool asgi] [--json]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ['wsgi', 'wsgi-pool', 'asgi']
+HOST = '127.0.0.1'
+
+# WSGI server yang memproses koneksi di thread pool berukuran tetap
+POOL_SERVER = r'''
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+import app
+
+class PoolServer(BaseWSGIServer):
+    request_queue_size = 1024
+
+    def process_request(self, request, client_address):
+        pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+pool = ThreadPoolExecutor(max_workers=int(sys.argv[2]))
+PoolServer('127.0.0.1', int(sys.argv[1]), app.create_app()).serve_forever()
+'''
+
+SERVERS = {
+    'wsgi': [sys.executable, '-c',
+             "import app; app.create_app(); app.app.run(host='127.0.0.1', port={port}, threaded=True)"],
+    'wsgi-pool': [sys.executable, '-c', POOL_SERVER, '{port}', '{threads}'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi:application',
+             '--host', '127.0.0.1', '--port', '{port}', '--log-level', 'warning'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def process_stats(pid):
+    """(threads, rss MB) of a running process"""
+    threads, rss = 0, 0.0
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return threads, rss
+
+
+def create_students(count):
+    """Synthetic students without face data, returns signed session cookies"""
+    import db
+    import app as app_module
+
+    conn = db.get_connection('database.db')
+    tag = int(time.time())
+    ids = []
+    for i in range(count):
+        cursor = conn.execute(
+            'INSERT INTO users (username, password, full_name, role, active) VALUES (?, ?, ?, ?, 1)',
+            (f'serving_{tag}_{i}', 'x', f'Serving Student {i}', 'user')
+        )
+        ids.append(cursor.lastrowid)
+    conn.commit()
+    conn.close()
+
+    serializer = app_module.app.session_interface.get_signing_serializer(app_module.app)
+    return [serializer.dumps({'user_id': user_id, 'username': f'serving_{tag}_{i}'}) for i, user_id in enumerate(ids)]
+
+
+def multipart_body(photo_kb):
+    boundary = 'benchboundary7MA4YWxkTrZu0gW'
+    photo = os.urandom(photo_kb * 1024)
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="latitude"\r\n\r\n-6.2\r\n'.encode(),
+        f'--{boundary}\r\nContent-Disposition: form-data; name="longitude"\r\n\r\n106.8\r\n'.encode(),
+        (f'--{boundary}\r\nContent-Disposition: form-data; name="photo"; filename="absen.jpg"\r\n'
+         f'Content-Type: image/jpeg\r\n\r\n').encode() + photo + b'\r\n',
+        f'--{boundary}--\r\n'.encode(),
+    ]
+    return f'multipart/form-data; boundary={boundary}', b''.join(parts)
+
+
+async def read_status(reader):
+    """Status code of a Connection: close response (reads it to the end)"""
+    data = await reader.read()
+    return int(data.split(b' ', 2)[1]) if data.startswith(b'HTTP/') else 0
+
+
+async def slow_upload(port, cookie, content_type, body, upload_seconds, chunks=20):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    head = (f'POST /absen_masuk HTTP/1.1\r\nHost: {HOST}:{port}\r\n'
+            f'Cookie: session={cookie}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode()
+    writer.write(head)
+    step = -(-len(body) // chunks)
+    for start in range(0, len(body), step):
+        await asyncio.sleep(upload_seconds / chunks)
+        writer.write(body[start:start + step])
+        await writer.drain()
+    sent = time.perf_counter()
+    status = await read_status(reader)
+    writer.close()
+    return status, time.perf_counter() - sent
+
+
+async def probe(port, cookie, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection(HOST, port)
+            writer.write((f'GET /api/office-coordinates HTTP/1.1\r\nHost: {HOST}:{port}\r\n'
+                          f'Cookie: session={cookie}\r\nConnection: close\r\n\r\n').encode())
+            await writer.drain()
+            if await read_status(reader) == 200:
+                latencies.append(time.perf_counter() - start)
+            writer.close()
+        except OSError:
+            pass
+        await asyncio.sleep(0.1)
+
+
+async def sample_process(pid, stop, samples):
+    while not stop.is_set():
+        samples.append(process_stats(pid))
+        await asyncio.sleep(0.1)
+
+
+async def run_load(port, pid, cookies, args):
+    content_type, body = multipart_body(args.photo_kb)
+    stop = asyncio.Event()
+    latencies, samples = [], []
+    background = [
+        asyncio.create_task(probe(port, cookies[0], stop, latencies)),
+        asyncio.create_task(sample_process(pid, stop, samples)),
+    ]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(slow_upload(port, cookie, content_type, body, args.upload_seconds) for cookie in cookies[1:]),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await asyncio.gather(*background)
+
+    completed = [r for r in results if not isinstance(r, BaseException) and r[0] == 200]
+    after_upload = sorted(r[1] for r in completed)
+    latencies.sort()
+
+    def pct(values, q):
+        return round(values[min(int(len(values) * q), len(values) - 1)] * 1000, 1) if values else None
+
+    return {
+        'clients': len(cookies) - 1,
+        'completed': len(completed),
+        'failed': len(results) - len(completed),
+        'elapsed_s': round(elapsed, 2),
+        'after_upload_p50_ms': pct(after_upload, 0.5),
+        'after_upload_p95_ms': pct(after_upload, 0.95),
+        'probe_requests': len(latencies),
+        'probe_p50_ms': pct(latencies, 0.5),
+        'probe_p95_ms': pct(latencies, 0.95),
+        'peak_threads': max((threads for threads, _ in samples), default=0),
+        'peak_rss_mb': round(max((rss for _, rss in samples), default=0), 1),
+    }
+
+
+def start_server(mode, port, threads, workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT, FACE_WORKERS='0', ASGI_THREADS=str(threads),
+               ADMISSION_LIMIT='100000', ADMISSION_QUEUE='100000')
+    command = [part.replace('{port}', str(port)).replace('{threads}', str(threads)) for part in SERVERS[mode]]
+    server = subprocess.Popen(command, cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'{mode} server exited with code {server.returncode}')
+        try:
+            with socket.create_connection((HOST, port), timeout=0.5):
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=300)
+    parser.add_argument('--upload-seconds', type=float, default=5.0, help='time each client takes to upload')
+    parser.add_argument('--photo-kb', type=int, default=150)
+    parser.add_argument('--threads', type=int, default=32, help='wsgi-pool threads and ASGI_THREADS')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args()
+
+    if 'asgi' in args.modes and importlib.util.find_spec('uvicorn') is None:
+        parser.error('asgi mode needs uvicorn: pip install uvicorn')
+
+    workdir = tempfile.mkdtemp(prefix='bench_serving_')
+    shutil.copy(os.path.join(ROOT, 'database.db'), os.path.join(workdir, 'database.db'))
+    os.chdir(workdir)
+    cookies = create_students(args.clients + 1)
+
+    results = {}
+    try:
+        for mode in args.modes:
+            port = free_port()
+            server = start_server(mode, port, args.threads, workdir)
+            idle_threads, idle_rss = process_stats(server.pid)
+            try:
+                if not args.json:
+                    print(f"🔄 {mode}: {args.clients} clients uploading {args.photo_kb} KB over {args.upload_seconds}s")
+                results[mode] = asyncio.run(run_load(port, server.pid, cookies, args))
+                results[mode].update(idle_threads=idle_threads, idle_rss_mb=round(idle_rss, 1))
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print()
+    print(f"{'mode':<10} {'done':>6} {'fail':>5} {'total s':>8} {'after p50':>10} {'after p95':>10} "
+          f"{'probe p50':>10} {'probe p95':>10} {'threads':>8} {'rss MB':>7}")
+    for mode, r in results.items():
+        print(f"{mode:<10} {r['completed']:>6} {r['failed']:>5} {r['elapsed_s']:>8} "
+              f"{r['after_upload_p50_ms']!s:>10} {r['after_upload_p95_ms']!s:>10} "
+              f"{r['probe_p50_ms']!s:>10} {r['probe_p95_ms']!s:>10} "
+              f"{r['peak_threads']:>8} {r['peak_rss_mb']:>7}")
+    print("(after = server time from the last uploaded byte to the response, in ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: app startup time and memory per preload mode
+
+Every mode runs in a fresh interpreter and reports import time, create_app() time,
+the first /login request, the first face encode and the resident memory (RSS) of
+the web process and its face workers.
+
+Modes:
+    eager    import pandas, cv2 and face_recognition up front (how app.py used to start)
+    lazy     create_app() - everything loads on first use
+    warm-up  create_app(warm_up=True)
+    preload  create_app(preload=True) - face worker pool started, models loaded
+
+Usage: python benchmarks/bench_startup.py [--modes lazy preload] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ['eager', 'lazy', 'warm-up', 'preload']
+
+# Dijalankan di interpreter baru untuk setiap mode
+PROBE = r'''
+import json, os, sys, time
+
+def rss_mb(pid='self'):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+mode = sys.argv[1]
+start = time.perf_counter()
+if mode == 'eager':
+    import pandas, cv2, face_recognition
+import app as app_module
+imported = time.perf_counter()
+
+app = app_module.create_app(preload=(mode == 'preload'), warm_up=(mode in ('warm-up', 'preload')))
+created = time.perf_counter()
+
+client = app.test_client()
+client.get('/login')
+first_request = time.perf_counter()
+rss_web = rss_mb()
+
+from face_service import face_service
+photo = sys.argv[2]
+face_start = time.perf_counter()
+if photo:
+    face_service.encode(photo)
+first_face = time.perf_counter() - face_start if photo else None
+
+import multiprocessing
+workers = [rss_mb(p.pid) for p in multiprocessing.active_children()]
+heavy = [m for m in ('pandas', 'cv2', 'face_recognition', 'dlib') if m in sys.modules]
+
+print(json.dumps({
+    'mode': mode,
+    'import_s': round(imported - start, 3),
+    'create_app_s': round(created - imported, 3),
+    'first_request_s': round(first_request - created, 3),
+    'ready_s': round(first_request - start, 3),
+    'first_face_encode_s': round(first_face, 3) if first_face is not None else None,
+    'rss_web_mb': round(rss_web, 1) if rss_web else None,
+    'rss_workers_mb': round(sum(w for w in workers if w), 1) if workers else 0,
+    'workers': len(workers),
+    'heavy_modules_in_web_process': heavy,
+}))
+face_service.shutdown()
+'''
+
+
+def find_photo():
+    uploads = os.path.join(ROOT, 'uploads')
+    if os.path.isdir(uploads):
+        for name in sorted(os.listdir(uploads)):
+            if name.endswith('.jpg'):
+                return os.path.join(uploads, name)
+    return ''
+
+
+def run_mode(mode, photo):
+    output = subprocess.check_output(
+        [sys.executable, '-c', PROBE, mode, photo], cwd=ROOT, stderr=subprocess.DEVNULL
+    )
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--json', action='store_true', help='print JSON instead of a table')
+    args = parser.parse_args()
+
+    photo = find_photo()
+    results = [run_mode(mode, photo) for mode in args.modes]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'mode':<8} {'import s':>9} {'ready s':>8} {'1st face s':>11} {'web MB':>7} {'workers MB':>11}  heavy modules")
+    for r in results:
+        first_face = f"{r['first_face_encode_s']:.2f}" if r['first_face_encode_s'] is not None else '-'
+        print(
+            f"{r['mode']:<8} {r['import_s']:>9.2f} {r['ready_s']:>8.2f} {first_face:>11} "
+            f"{r['rss_web_mb'] or 0:>7.1f} {r['rss_workers_mb']:>11.1f}  {', '.join(r['heavy_modules_in_web_process']) or '-'}"
+        )
+
+
+if __name__ == '__main__':
+    main()
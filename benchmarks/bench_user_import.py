@@ -0,0 +1,142 @@
+"""
+Benchmark: bulk student import (user_import.py) vs creating students one at a time
+
+Runs on a copy of database.db in a temp directory. Builds a CSV of --rows synthetic
+students (default 10,000, ~5% with a deliberate error), then times each import phase:
+
+    read      parse the CSV
+    validate  bulk checks against existing usernames, emails and classes
+    hash      generate_password_hash for every valid row, --workers processes
+    insert    one BEGIN IMMEDIATE + executemany + daily_summary update
+
+and compares it with the per-student path of api_create_user (generate_password_hash,
+username lookup, own transaction with the daily_summary update, commit), measured on
+--sample rows and extrapolated to --rows. Checks that every valid row was imported,
+that every bad row was reported and that daily_summary still matches a rebuild.
+
+Usage: python benchmarks/bench_user_import.py [--rows 10000] [--workers N] [--sample 100]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.security import generate_password_hash
+
+import daily_summary
+import db
+import user_import
+
+
+def build_csv(rows, classes, tag):
+    """CSV text with every 20th row broken in a different way, returns (text, expected errors)"""
+    lines = ['username,full_name,password,kelas,email']
+    bad = 0
+    for i in range(rows):
+        username, password, kelas = f'imp{tag}_{i}', f'pass{i:06d}', classes[i % len(classes)]
+        if i % 20 == 19:
+            bad += 1
+            kind = i // 20 % 3
+            if kind == 0:
+                password = '123'
+            elif kind == 1:
+                kelas = 'Kelas Tidak Ada'
+            else:
+                username = f'imp{tag}_{i - 1}'  # duplikat baris sebelumnya
+        lines.append(f'{username},Siswa Import {i},{password},{kelas},{username}@sekolah.sch.id')
+    return '\n'.join(lines) + '\n', bad
+
+
+def one_by_one(conn, rows, classes, tag):
+    """The api_create_user path for each row, returns seconds per student"""
+    start = time.perf_counter()
+    for i in range(rows):
+        username = f'single{tag}_{i}'
+        hashed = generate_password_hash(f'pass{i:06d}')
+        conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
+        today = datetime.now().strftime('%Y-%m-%d')
+        conn.execute('BEGIN IMMEDIATE')
+        daily_summary.ensure_day(conn, today)
+        cursor = conn.execute(
+            'INSERT INTO users (username, full_name, class_id, password, role, active) VALUES (?, ?, ?, ?, ?, ?)',
+            (username, f'Single {i}', classes[i % len(classes)], hashed, 'user', True)
+        )
+        daily_summary.attach_user(conn, cursor.lastrowid, today)
+        conn.commit()
+    return (time.perf_counter() - start) / rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=user_import.IMPORT_HASH_WORKERS)
+    parser.add_argument('--sample', type=int, default=100, help='rows timed on the one-at-a-time path')
+    args = parser.parse_args()
+    user_import.IMPORT_MAX_ROWS = max(user_import.IMPORT_MAX_ROWS, args.rows)
+
+    workdir = tempfile.mkdtemp(prefix='bench_user_import_')
+    shutil.copy(os.path.join(ROOT, 'database.db'), os.path.join(workdir, 'database.db'))
+    os.chdir(workdir)
+    try:
+        conn = db.get_connection('database.db')
+        daily_summary.ensure_schema(conn)
+        classes = conn.execute('SELECT id, name FROM classes WHERE active = 1 ORDER BY id').fetchall()
+        tag = int(time.time())
+        text, bad = build_csv(args.rows, [row['name'] for row in classes], tag)
+        print(f"🔄 Importing {args.rows:,} rows ({bad} invalid) with {args.workers} hashing process(es)")
+
+        timings = {}
+        start = time.perf_counter()
+        records = user_import.read_file(text.encode(), 'siswa.csv')
+        timings['read'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        valid, errors = user_import.validate(conn, records)
+        timings['validate'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hashes = user_import.hash_passwords([row['password'] for row in valid], args.workers)
+        timings['hash'] = time.perf_counter() - start
+
+        # Fase insert persis seperti import_users(), dengan hash yang sudah jadi
+        original = user_import.hash_passwords
+        user_import.hash_passwords = lambda passwords, workers: hashes
+        try:
+            start = time.perf_counter()
+            report = user_import.import_users(conn, records, workers=args.workers)
+            timings['insert'] = time.perf_counter() - start - timings['validate']
+        finally:
+            user_import.hash_passwords = original
+
+        today = datetime.now().strftime('%Y-%m-%d')
+        incremental = [tuple(row) for row in conn.execute('SELECT * FROM daily_summary WHERE date = ? ORDER BY class_id', (today,))]
+        conn.execute('BEGIN IMMEDIATE')
+        daily_summary.rebuild(conn, today, today)
+        rebuilt = [tuple(row) for row in conn.execute('SELECT * FROM daily_summary WHERE date = ? ORDER BY class_id', (today,))]
+        conn.rollback()
+
+        per_student = one_by_one(conn, args.sample, [row['id'] for row in classes], tag)
+        conn.close()
+    finally:
+        os.chdir(ROOT)
+        db.close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    total = sum(timings.values())
+    for name, seconds in timings.items():
+        print(f"   {name:<9} {seconds:>8.2f}s")
+    print(f"   {'total':<9} {total:>8.2f}s  ({args.rows / total:,.0f} rows/s)")
+    print(f"   one at a time: {per_student * 1000:.1f} ms/student -> ~{per_student * args.rows:,.0f}s for {args.rows:,} rows")
+    print(f"   imported {report['imported']:,} (expected {args.rows - bad:,}), reported {report['failed']} "
+          f"(expected {bad}), daily_summary matches rebuild: {incremental == rebuilt}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark: work duration aggregation with julianday() string math vs stored work_minutes
+
+Runs on a copy of database.db in a temp directory, filled with --users x --days synthetic
+attendance rows (default 2000 x 500 = 1M) written the old way (TEXT time_in/time_out only).
+Then it times:
+
+    before   SUM(CAST((julianday(date || ' ' || time_out) - julianday(date || ' ' || time_in)) * 24 * 60 AS INTEGER))
+    migrate  work_time.ensure_schema/backfill (add columns, fill time_*_sec and work_minutes)
+    after    SUM(work_minutes)
+
+for a one-month per-student aggregation (like the monthly export) and a whole-table
+aggregation. Both are checked against minutes computed in Python while filling: the
+julianday() version loses a minute on rows whose duration is a whole number of minutes
+(floating point, e.g. 07:54:07 -> 14:30:07 gives 395 instead of 396).
+
+Usage: python benchmarks/bench_work_minutes.py [--users 2000] [--days 500] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+import work_time
+
+JULIANDAY_MINUTES = '''CASE WHEN time_in IS NOT NULL AND time_out IS NOT NULL THEN
+    CAST((julianday(date || ' ' || time_out) - julianday(date || ' ' || time_in)) * 24 * 60 AS INTEGER) END'''
+
+QUERIES = {
+    'month': '''SELECT user_id, COUNT(*), SUM({minutes}) FROM attendance
+                WHERE date BETWEEN ? AND ? AND time_in IS NOT NULL GROUP BY user_id ORDER BY user_id''',
+    'all rows': '''SELECT user_id, COUNT(*), SUM({minutes}) FROM attendance
+                   WHERE time_in IS NOT NULL GROUP BY user_id ORDER BY user_id''',
+}
+
+
+def clock(seconds):
+    return f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}'
+
+
+def fill(conn, users, days, start, month):
+    """Synthetic students and attendance rows with TEXT times only, like the old write path
+
+    Returns the expected per-user (rows, minutes) for the month and for all rows.
+    """
+    tag = int(time.time())
+    conn.execute('BEGIN IMMEDIATE')
+    user_ids = [
+        conn.execute('INSERT INTO users (username, password, full_name, role, active) VALUES (?, ?, ?, ?, 1)',
+                     (f'work_{tag}_{i}', 'x', f'Work Student {i}', 'user')).lastrowid
+        for i in range(users)
+    ]
+    rng = random.Random(42)
+    expected = {'month': {}, 'all rows': {}}
+
+    def count(name, user_id, minutes):
+        rows, total = expected[name].get(user_id, (0, None))
+        if minutes is not None:
+            total = (total or 0) + minutes
+        expected[name][user_id] = (rows + 1, total)
+
+    def rows():
+        for offset in range(days):
+            day = (start + timedelta(days=offset)).isoformat()
+            for user_id in user_ids:
+                time_in = rng.randint(6 * 3600 + 1800, 8 * 3600)
+                # ~5% belum absen keluar
+                time_out = rng.randint(14 * 3600, 16 * 3600 + 1800) if rng.random() > 0.05 else None
+                minutes = (time_out - time_in) // 60 if time_out else None
+                count('all rows', user_id, minutes)
+                if month[0] <= day <= month[1]:
+                    count('month', user_id, minutes)
+                yield user_id, day, clock(time_in), clock(time_out) if time_out else None
+
+    conn.executemany('INSERT INTO attendance (user_id, date, time_in, time_out) VALUES (?, ?, ?, ?)', rows())
+    conn.commit()
+    return {name: sorted((user_id,) + value for user_id, value in totals.items())
+            for name, totals in expected.items()}
+
+
+def timed(conn, sql, params, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(sql, params).fetchall()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), [tuple(row) for row in result]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_work_minutes_')
+    shutil.copy(os.path.join(ROOT, 'database.db'), os.path.join(workdir, 'database.db'))
+    os.chdir(workdir)
+    try:
+        conn = db.get_connection('database.db')
+        # Simulasi database lama: kolom integer belum ada (atau kosong)
+        conn.execute('DELETE FROM attendance')
+        conn.commit()
+        start = date(2024, 1, 1)
+        month = (start.replace(month=3).isoformat(), start.replace(month=3, day=31).isoformat())
+        print(f"🔄 Filling {args.users} users x {args.days} days = {args.users * args.days:,} attendance rows")
+        expected = fill(conn, args.users, args.days, start, month)
+
+        results = {}
+        for name, sql in QUERIES.items():
+            params = month if name == 'month' else ()
+            results[name] = {'before': timed(conn, sql.format(minutes=JULIANDAY_MINUTES), params, args.repeat)}
+
+        migrate_start = time.perf_counter()
+        converted = work_time.ensure_schema(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        converted += work_time.backfill(conn)
+        conn.commit()
+        migrate_seconds = time.perf_counter() - migrate_start
+
+        for name, sql in QUERIES.items():
+            params = month if name == 'month' else ()
+            results[name]['after'] = timed(conn, sql.format(minutes='work_minutes'), params, args.repeat)
+        wrong_rows = conn.execute(
+            f'SELECT COUNT(*) FROM attendance WHERE ({JULIANDAY_MINUTES}) != work_minutes'
+        ).fetchone()[0]
+        conn.close()
+    finally:
+        os.chdir(ROOT)
+        db.close_all_pools()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"   migration: {converted:,} rows backfilled in {migrate_seconds:.2f}s")
+    print(f"   rows where julianday() minutes != work_minutes: {wrong_rows:,}")
+    print()
+    print(f"{'query':<10} {'rows out':>9} {'julianday ms':>13} {'work_minutes ms':>16} {'speedup':>8} "
+          f"{'julianday ok':>13} {'work_minutes ok':>16}")
+    for name, result in results.items():
+        before_time, before_rows = result['before']
+        after_time, after_rows = result['after']
+        print(f"{name:<10} {len(after_rows):>9} {before_time * 1000:>13.1f} {after_time * 1000:>16.1f} "
+              f"{before_time / after_time:>7.1f}x {str(before_rows == expected[name]):>13} "
+              f"{str(after_rows == expected[name]):>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Helper dataset untuk benchmark wajah
+Pairs enrollment photos in faces/<name>_<id>/<id>_face.jpg with check-in photos in uploads/
+"""
+
+import glob
+import os
+import re
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_ENROLL_DIR = re.compile(r'^.+_(\d+)$')
+_PROBE_FILE = re.compile(r'^(\d+)_(keluar_)?\d{8}_\d{6}\.jpg$')
+
+
+def load_enrollments(faces_dir=None):
+    """List of (user_id, path) for every enrollment photo"""
+    faces_dir = faces_dir or os.path.join(ROOT, 'faces')
+    enrollments = []
+    for folder in sorted(glob.glob(os.path.join(faces_dir, '*'))):
+        match = _ENROLL_DIR.match(os.path.basename(folder))
+        if not match:
+            continue
+        user_id = int(match.group(1))
+        path = os.path.join(folder, f"{user_id}_face.jpg")
+        if os.path.exists(path):
+            enrollments.append((user_id, path))
+    return enrollments
+
+
+def load_probes(uploads_dir=None):
+    """List of (user_id, path, action) for every check-in / check-out photo"""
+    uploads_dir = uploads_dir or os.path.join(ROOT, 'uploads')
+    probes = []
+    for path in sorted(glob.glob(os.path.join(uploads_dir, '*.jpg'))):
+        match = _PROBE_FILE.match(os.path.basename(path))
+        if match:
+            action = 'check_out' if match.group(2) else 'check_in'
+            probes.append((int(match.group(1)), path, action))
+    return probes
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile (tanpa numpy supaya bisa dipakai di mana saja)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def upscale_copies(items, target_dir, megapixels):
+    """Write upscaled JPEG copies (to simulate phone cameras), returns items with new paths"""
+    from PIL import Image
+
+    os.makedirs(target_dir, exist_ok=True)
+    result = []
+    for item in items:
+        path = item[1]
+        img = Image.open(path).convert('RGB')
+        ratio = (megapixels * 1e6 / (img.width * img.height)) ** 0.5
+        if ratio > 1:
+            img = img.resize((int(img.width * ratio), int(img.height * ratio)), Image.BICUBIC)
+        new_path = os.path.join(target_dir, f"{len(result)}_{os.path.basename(path)}")
+        img.save(new_path, quality=90)
+        result.append((item[0], new_path) + tuple(item[2:]))
+    return result
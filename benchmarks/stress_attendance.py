@@ -0,0 +1,191 @@
+"""
+Stress test: concurrent check-in/check-out taps against the attendance write path
+
+Runs on a copy of database.db in a temp directory. Every synthetic student taps
+"absen masuk" and then "absen keluar" from several threads at the same moment, the
+way a double tap or a flaky network retry hits the server. Afterwards it checks
+that every student has exactly one attendance row, one check-in log and one
+check-out log, that the daily_summary rollup matches the attendance rows, and that
+no call raised (e.g. UNIQUE constraint failed).
+
+Also reports the SQL statements one check-in and one check-out issue after face
+verification (attendance_state read + the write transaction; the log row is written
+later in a batch by attendance_log.py).
+
+Usage: python benchmarks/stress_attendance.py [--users 200] [--taps 4] [--workers 32]
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db
+
+_trace = threading.local()
+
+
+def count_statements(statement):
+    if getattr(_trace, 'statements', None) is not None:
+        _trace.statements.append(statement.split(None, 1)[0].upper())
+
+
+def traced_connect(original):
+    def connect(self):
+        conn = original(self)
+        conn.set_trace_callback(count_statements)
+        return conn
+    return connect
+
+
+def create_students(conn, count):
+    """Synthetic students, never used outside the temp copy"""
+    tag = int(time.time())
+    ids = []
+    for i in range(count):
+        cursor = conn.execute(
+            'INSERT INTO users (username, password, full_name, role, active) VALUES (?, ?, ?, ?, 1)',
+            (f'stress_{tag}_{i}', 'x', f'Stress Student {i}', 'user')
+        )
+        ids.append(cursor.lastrowid)
+    conn.commit()
+    return ids
+
+
+def tap(app_module, action, user_id, today, barrier):
+    """One request's database work after the face matched"""
+    barrier.wait()
+    now = time.strftime('%H:%M:%S')
+    if action == 'check_in':
+        return app_module.record_check_in(user_id, today, now, -6.2, 106.8, None, '')
+    user = app_module.attendance_state(user_id, today)
+    return app_module.record_check_out(user, today, now, -6.2, 106.8, None, '')
+
+
+def storm(app_module, action, user_ids, today, taps, workers):
+    """Every user taps `taps` times at once; returns (successes per user, errors, seconds)"""
+    successes = Counter()
+    errors = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch_start in range(0, len(user_ids), max(workers // taps, 1)):
+            batch = user_ids[batch_start:batch_start + max(workers // taps, 1)]
+            jobs = [(user_id, barrier) for user_id in batch for barrier in [threading.Barrier(taps)] * taps]
+            random.shuffle(jobs)
+            futures = [(user_id, executor.submit(tap, app_module, action, user_id, today, barrier))
+                       for user_id, barrier in jobs]
+            for user_id, future in futures:
+                try:
+                    if future.result()['success']:
+                        successes[user_id] += 1
+                except Exception as e:
+                    errors.append(f'{action} user {user_id}: {e}')
+    return successes, errors, time.perf_counter() - start
+
+
+def statements_for(fn):
+    _trace.statements = []
+    try:
+        fn()
+        return list(_trace.statements)
+    finally:
+        _trace.statements = None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--taps', type=int, default=4, help='simultaneous taps per user and action')
+    parser.add_argument('--workers', type=int, default=32)
+    args = parser.parse_args()
+    if args.taps > args.workers:
+        parser.error('--taps must not exceed --workers')
+
+    workdir = tempfile.mkdtemp(prefix='stress_attendance_')
+    shutil.copy(os.path.join(ROOT, 'database.db'), os.path.join(workdir, 'database.db'))
+    os.chdir(workdir)
+
+    db.ConnectionPool._connect = traced_connect(db.ConnectionPool._connect)
+    import app as app_module
+    app_module.create_app()
+
+    conn = db.get_connection()
+    user_ids = create_students(conn, args.users + 1)
+    conn.close()
+    probe_user, user_ids = user_ids[0], user_ids[1:]
+    today = time.strftime('%Y-%m-%d')
+
+    print(f"🔄 {len(user_ids)} users x {args.taps} simultaneous taps, {args.workers} threads ({workdir})")
+    errors = []
+    for action in ('check_in', 'check_out'):
+        successes, action_errors, elapsed = storm(app_module, action, user_ids, today, args.taps, args.workers)
+        errors += action_errors
+        wrong = sum(1 for user_id in user_ids if successes[user_id] != 1)
+        print(f"   {action:<9} {len(user_ids) * args.taps} taps in {elapsed:.2f}s, "
+              f"{sum(successes.values())} accepted, {wrong} users not accepted exactly once")
+
+    # Log ditulis write-behind (attendance_log.py), tulis sisanya dulu sebelum dihitung
+    app_module.attendance_log.flush()
+    conn = db.get_connection()
+    placeholders = ','.join('?' * len(user_ids))
+    duplicates = conn.execute(
+        f'''SELECT COUNT(*) FROM (SELECT user_id FROM attendance WHERE user_id IN ({placeholders})
+            GROUP BY user_id, date HAVING COUNT(*) > 1)''', user_ids
+    ).fetchone()[0]
+    missing_out = conn.execute(
+        f'SELECT COUNT(*) FROM attendance WHERE user_id IN ({placeholders}) AND time_out IS NULL', user_ids
+    ).fetchone()[0]
+    # Rollup daily_summary harus sama dengan hitungan langsung dari attendance
+    summary = conn.execute(
+        'SELECT SUM(present), SUM(complete), SUM(incomplete) FROM daily_summary WHERE date = ?', (today,)
+    ).fetchone()
+    raw = conn.execute(
+        '''SELECT COUNT(*), SUM(a.time_out IS NOT NULL), SUM(a.time_out IS NULL) FROM attendance a
+           JOIN users u ON u.id = a.user_id WHERE a.date = ? AND a.time_in IS NOT NULL AND u.role != 'admin' ''',
+        (today,)
+    ).fetchone()
+    summary_ok = tuple(summary) == tuple(raw)
+    log_counts = conn.execute(
+        f'''SELECT action, COUNT(*) AS total, COUNT(DISTINCT user_id) AS users FROM attendance_logs
+            WHERE user_id IN ({placeholders}) GROUP BY action''', user_ids
+    ).fetchall()
+    conn.close()
+
+    print(f"   duplicate attendance rows: {duplicates}, rows without check-out: {missing_out}")
+    for row in log_counts:
+        print(f"   {row['action']:<9} logs: {row['total']} for {row['users']} users")
+    print(f"   daily_summary present/complete/incomplete: {tuple(summary)}, "
+          f"from attendance: {tuple(raw)} {'✓' if summary_ok else '✗'}")
+    print(f"   errors: {len(errors)}")
+    for message in errors[:5]:
+        print(f"      {message}")
+
+    # Statement count untuk satu request (setelah verifikasi wajah)
+    check_in = statements_for(lambda: (
+        app_module.attendance_state(probe_user, today),
+        app_module.record_check_in(probe_user, today, '07:00:00', -6.2, 106.8, None, '')
+    ))
+    check_out = statements_for(lambda: app_module.record_check_out(
+        app_module.attendance_state(probe_user, today), today, '15:00:00', -6.2, 106.8, None, ''
+    ))
+    for action, statements in (('check_in', check_in), ('check_out', check_out)):
+        print(f"   {action:<9} statements per request: {len(statements)} ({' '.join(statements)})")
+
+    app_module.attendance_log.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+    ok = not errors and not duplicates and not missing_out and summary_ok and all(row['total'] == len(user_ids) for row in log_counts)
+    print("✅ No duplicates, one row and one log per tap winner" if ok else "❌ Stress test found problems")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Versi cache bersama antar worker process
+In-process caches (face_cache, geofence) are invalidated by the worker that changed the data;
+other gunicorn workers only learn about it through a counter in the cache_versions table.
+invalidate() bumps the counter, lookups re-read it at most every CACHE_VERSION_INTERVAL
+seconds and drop the whole local cache when another process bumped it.
+
+Konfigurasi lewat environment variable:
+    CACHE_VERSION_INTERVAL  cek versi paling sering setiap N detik (default 1, 0 = setiap lookup)
+"""
+
+import os
+import threading
+import time
+
+from db import get_connection
+
+CACHE_VERSION_INTERVAL = float(os.environ.get('CACHE_VERSION_INTERVAL', 1))
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS cache_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+
+def ensure_schema(conn):
+    """Create the cache_versions table on databases that predate it"""
+    conn.execute(SCHEMA)
+    conn.commit()
+
+
+class CacheVersion:
+    def __init__(self, name, db_path='database.db', interval=None):
+        self.name = name
+        self.db_path = db_path
+        self.interval = CACHE_VERSION_INTERVAL if interval is None else interval
+        self._seen = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.changes = 0
+
+    def _read(self):
+        conn = get_connection(self.db_path)
+        try:
+            row = conn.execute('SELECT version FROM cache_versions WHERE name = ?', (self.name,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+    def changed(self):
+        """True once after another process bumped the version (throttled to one read per interval)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._seen is not None and now - self._checked < self.interval:
+                return False
+            self._checked = now
+        try:
+            version = self._read()
+        except Exception as e:
+            # Database lama tanpa tabel / terkunci: cache lokal tetap dipakai
+            print(f"⚠ cache version check failed ({self.name}): {e}")
+            return False
+        with self._lock:
+            self.checks += 1
+            seen, self._seen = self._seen, version
+            if seen is None or seen == version:
+                return False
+            self.changes += 1
+            return True
+
+    def bump(self):
+        """Tell the other processes their copy is stale (call after the change was committed)"""
+        conn = get_connection(self.db_path)
+        try:
+            version = conn.execute(
+                '''INSERT INTO cache_versions (name, version) VALUES (?, 1)
+                   ON CONFLICT(name) DO UPDATE SET version = version + 1
+                   RETURNING version''',
+                (self.name,)
+            ).fetchone()[0]
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠ cache version bump failed ({self.name}), other workers stay stale: {e}")
+            return
+        finally:
+            conn.close()
+        with self._lock:
+            # Bump proses lain di antaranya tetap terdeteksi di changed() berikutnya
+            if self._seen is not None and version == self._seen + 1:
+                self._seen = version
+
+    def stats(self):
+        with self._lock:
+            return {'version': self._seen, 'checks': self.checks, 'changes': self.changes}
@@ -1,5 +1,9 @@
+import glob
+import os
 import sqlite3
 
+from archive import ARCHIVE_DIR
+
 DB_NAME = "database.db"  # ganti sesuai nama database kamu
 
 def clear_data_and_reset():
@@ -8,6 +12,9 @@ def clear_data_and_reset():
 
     # daftar tabel (urutkan manual biar aman kalau ada relasi)
     tables = [
+        "attendance_archive_users",
+        "attendance_archive",
+        "daily_summary",
         "attendance_logs",
         "attendance",
         "classes",
@@ -34,6 +41,11 @@ def clear_data_and_reset():
 
     conn.commit()
     conn.close()
+
+    # file arsip bulanan ikut dihapus, id absensi mulai lagi dari 1
+    for path in glob.glob(os.path.join(ARCHIVE_DIR, "attendance_*.db")):
+        os.remove(path)
+        print(f"✅ Removed archive {path}")
     print("\n🎉 Done! Database cleared successfully.")
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+"""
+Rollup harian absensi: tabel daily_summary (per tanggal, per kelas)
+Keeps present / complete / incomplete / total_active counts current inside the same write
+transaction as check-in, check-out and user changes, so reports read a handful of small
+rows instead of re-scanning attendance and users on every call
+
+class_id 0 = siswa tanpa kelas, akun admin tidak dihitung. present/complete/incomplete
+follow the student's current class (a class change moves their counts, like a rebuild
+would). total_active is the number of active students on that date: a day's rows are
+seeded from users the first time the day is written, user changes only adjust today.
+
+Hitung ulang dari data mentah (mis. setelah import atau edit manual database.db):
+    python daily_summary.py                              # semua tanggal di attendance
+    python daily_summary.py --from 2025-01-01 --to 2025-06-30
+Rebuilt dates take total_active from the current users table (riwayat aktivasi tidak disimpan).
+"""
+
+from datetime import datetime
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS daily_summary (
+        date DATE NOT NULL,
+        class_id INTEGER NOT NULL DEFAULT 0,
+        present INTEGER NOT NULL DEFAULT 0,
+        complete INTEGER NOT NULL DEFAULT 0,
+        incomplete INTEGER NOT NULL DEFAULT 0,
+        total_active INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (date, class_id)
+    )
+'''
+
+UPSERT_SET = '''
+    ON CONFLICT(date, class_id) DO UPDATE SET
+        present = present + excluded.present,
+        complete = complete + excluded.complete,
+        incomplete = incomplete + excluded.incomplete,
+        total_active = total_active + excluded.total_active
+'''
+
+# Satu baris per (tanggal, kelas): setiap kelas yang punya siswa aktif, plus kelas yang ada absennya
+REBUILD_SQL = '''
+    WITH RECURSIVE days(date) AS (
+        SELECT ? UNION ALL SELECT date(date, '+1 day') FROM days WHERE date < ?
+    ),
+    active AS (
+        SELECT COALESCE(class_id, 0) AS class_id, COUNT(*) AS total
+        FROM users WHERE active = 1 AND role != 'admin'
+        GROUP BY COALESCE(class_id, 0)
+    ),
+    counts AS (
+        SELECT a.date, COALESCE(u.class_id, 0) AS class_id,
+               COUNT(*) AS present, SUM(a.time_out IS NOT NULL) AS complete
+        FROM {attendance} a JOIN users u ON u.id = a.user_id
+        WHERE a.date BETWEEN ? AND ? AND a.time_in IS NOT NULL AND u.role != 'admin'
+        GROUP BY a.date, COALESCE(u.class_id, 0)
+    ),
+    slots AS (
+        SELECT days.date, active.class_id FROM days CROSS JOIN active
+        UNION SELECT date, class_id FROM counts
+    )
+    INSERT INTO daily_summary (date, class_id, present, complete, incomplete, total_active)
+    SELECT s.date, s.class_id, COALESCE(c.present, 0), COALESCE(c.complete, 0),
+           COALESCE(c.present - c.complete, 0), COALESCE(t.total, 0)
+    FROM slots s
+    LEFT JOIN counts c ON c.date = s.date AND c.class_id = s.class_id
+    LEFT JOIN active t ON t.class_id = s.class_id
+'''
+
+# Tambah hitungan satu siswa (kelas diambil dari users, admin otomatis terlewati)
+ADJUST_SQL = f'''
+    INSERT INTO daily_summary (date, class_id, present, complete, incomplete, total_active)
+    SELECT ?, COALESCE(class_id, 0), ?, ?, ?, 0
+    FROM users WHERE id = ? AND role != 'admin'
+    {UPSERT_SET}
+'''
+
+# Kontribusi absen seorang user (semua tanggal yang sudah punya baris), dikali sign
+SHIFT_ATTENDANCE_SQL = f'''
+    INSERT INTO daily_summary (date, class_id, present, complete, incomplete, total_active)
+    SELECT a.date, COALESCE(u.class_id, 0), ?1, ?1 * (a.time_out IS NOT NULL), ?1 * (a.time_out IS NULL), 0
+    FROM attendance a JOIN users u ON u.id = a.user_id
+    WHERE a.user_id = ?2 AND a.time_in IS NOT NULL AND u.role != 'admin'
+        AND EXISTS (SELECT 1 FROM daily_summary s WHERE s.date = a.date)
+    {UPSERT_SET}
+'''
+
+SHIFT_ACTIVE_SQL = f'''
+    INSERT INTO daily_summary (date, class_id, present, complete, incomplete, total_active)
+    SELECT ?1, COALESCE(class_id, 0), 0, 0, 0, ?2
+    FROM users WHERE id = ?3 AND active = 1 AND role != 'admin'
+    {UPSERT_SET}
+'''
+
+
+def ensure_schema(conn):
+    """Create daily_summary; on a database that predates it, backfill every attendance date
+
+    Returns the number of days backfilled (0 if the table already existed).
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_summary'"
+        ).fetchone()
+        days = 0
+        if not exists:
+            conn.execute(SCHEMA)
+            days = rebuild(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return days
+
+
+def rebuild(conn, start=None, end=None, source='attendance'):
+    """Recompute the rows for start..end (default: first..last attendance date) from raw data
+
+    Runs inside the caller's transaction, returns the number of days rebuilt. For archived
+    dates pass source=archive.attendance_source(...), attached before the transaction.
+    """
+    if start is None or end is None:
+        first, last = conn.execute(f'SELECT MIN(date), MAX(date) FROM {source}').fetchone()
+        start, end = start or first, end or last
+        if start is None or end is None:
+            return 0
+    if start > end:
+        raise ValueError('Tanggal awal harus sebelum tanggal akhir')
+    conn.execute('DELETE FROM daily_summary WHERE date BETWEEN ? AND ?', (start, end))
+    conn.execute(REBUILD_SQL.format(attendance=source), (start, end, start, end))
+    return (datetime.strptime(end, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days + 1
+
+
+def ensure_day(conn, day):
+    """Seed a date's rows from raw data if it has none yet; call before writing that date"""
+    if conn.execute('SELECT 1 FROM daily_summary WHERE date = ? LIMIT 1', (day,)).fetchone() is None:
+        rebuild(conn, day, day)
+
+
+def check_in(conn, user_id, day):
+    """Count a check-in that was just written in this transaction (ensure_day first)"""
+    conn.execute(ADJUST_SQL, (day, 1, 0, 1, user_id))
+
+
+def check_out(conn, user_id, day):
+    """Count a check-out that was just written in this transaction"""
+    conn.execute(ADJUST_SQL, (day, 0, 1, -1, user_id))
+
+
+def detach_user(conn, user_id, today):
+    """Take a user's counts out before changing (class, role, active) or deleting them
+
+    Pair with attach_user() after the change, in the same transaction.
+    """
+    ensure_day(conn, today)
+    conn.execute(SHIFT_ATTENDANCE_SQL, (-1, user_id))
+    conn.execute(SHIFT_ACTIVE_SQL, (today, -1, user_id))
+
+
+def attach_user(conn, user_id, today):
+    """Add a user's counts back according to their current row (no-op once deleted)
+
+    For a new user call ensure_day() before the INSERT, then attach_user().
+    """
+    conn.execute(SHIFT_ATTENDANCE_SQL, (1, user_id))
+    conn.execute(SHIFT_ACTIVE_SQL, (today, 1, user_id))
+
+
+def add_active(conn, day, counts):
+    """Add {class_id: n} newly inserted active students to a date's total_active (ensure_day first)
+
+    Bulk counterpart of attach_user() for users that have no attendance yet.
+    """
+    conn.executemany(
+        f'''INSERT INTO daily_summary (date, class_id, present, complete, incomplete, total_active)
+            VALUES (?, ?, 0, 0, 0, ?)
+            {UPSERT_SET}''',
+        [(day, class_id or 0, count) for class_id, count in counts.items() if count]
+    )
+
+
+def totals(conn, start, end):
+    """{date: {present, complete, incomplete, total_active}} summed over classes"""
+    rows = conn.execute(
+        '''SELECT date, SUM(present) AS present, SUM(complete) AS complete,
+                  SUM(incomplete) AS incomplete, SUM(total_active) AS total_active
+           FROM daily_summary WHERE date BETWEEN ? AND ?
+           GROUP BY date''',
+        (start, end)
+    ).fetchall()
+    return {row['date']: dict(row) for row in rows}
+
+
+def by_class(conn, day):
+    """Per-class rows of one date with the class name"""
+    return conn.execute(
+        '''SELECT s.class_id, COALESCE(c.name, 'Tanpa Kelas') AS class_name,
+                  s.present, s.complete, s.incomplete, s.total_active
+           FROM daily_summary s
+           LEFT JOIN classes c ON c.id = s.class_id
+           WHERE s.date = ?
+           ORDER BY class_name''',
+        (day,)
+    ).fetchall()
+
+
+def current_active(conn):
+    """Active students right now: total_active for dates that have no rows"""
+    return conn.execute(
+        "SELECT COUNT(*) FROM users WHERE active = 1 AND role != 'admin'"
+    ).fetchone()[0]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import archive
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Rebuild daily_summary from attendance and users')
+    parser.add_argument('--from', dest='start', help='YYYY-MM-DD (default: first attendance date)')
+    parser.add_argument('--to', dest='end', help='YYYY-MM-DD (default: last attendance date)')
+    parser.add_argument('--db', default='database.db')
+    args = parser.parse_args()
+
+    for value in (args.start, args.end):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                parser.error(f'invalid date {value!r}, use YYYY-MM-DD')
+
+    conn = get_connection(args.db)
+    try:
+        ensure_schema(conn)
+        archive.ensure_schema(conn)
+        # Tanggal yang sudah diarsipkan dihitung dari file arsipnya
+        source = archive.attendance_source(conn, args.start, args.end)
+        conn.execute('BEGIN IMMEDIATE')
+        days = rebuild(conn, args.start, args.end, source)
+        conn.commit()
+    except (ValueError, archive.ArchiveError) as e:
+        conn.rollback()
+        parser.error(str(e))
+    finally:
+        conn.close()
+    print(f"✅ daily_summary rebuilt: {days} day(s)")
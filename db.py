@@ -0,0 +1,182 @@
+"""
+Database connection manager untuk sistem absensi
+Hands out reusable, pre-configured SQLite connections instead of opening a new one per call
+"""
+
+import atexit
+import queue
+import sqlite3
+import threading
+
+DB_PATH = 'database.db'
+
+# Dipasang sekali saat koneksi dibuat, bukan setiap request
+PRAGMAS = (
+    ('journal_mode', 'WAL'),        # reader tidak memblokir writer saat jam absen pagi
+    ('synchronous', 'NORMAL'),      # aman dengan WAL, jauh lebih sedikit fsync
+    ('busy_timeout', 5000),         # tunggu lock 5 detik sebelum "database is locked"
+    ('cache_size', -16000),         # 16 MB page cache per koneksi
+    ('mmap_size', 134217728),       # 128 MB memory-mapped I/O
+    ('foreign_keys', 'ON'),
+)
+
+# Ukuran cache prepared statement per koneksi (sqlite3 default: 128)
+STATEMENT_CACHE_SIZE = 256
+
+# Jumlah koneksi idle maksimal yang disimpan per database
+POOL_SIZE = 16
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool"""
+
+    pool = None
+    # {path: alias} file arsip yang di-ATTACH untuk laporan (archive.attendance_source)
+    attached = None
+
+    def close(self):
+        """Return connection to the pool (uncommitted work is rolled back)"""
+        if self.pool is None:
+            return super().close()
+        self.pool.release(self)
+
+    def _really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.created = 0
+        self.reused = 0
+
+    def _connect(self):
+        """Open and configure a new connection"""
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=PooledConnection,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.attached = {}
+        for name, value in PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _checked_out(self):
+        if not hasattr(self._local, 'connections'):
+            self._local.connections = []
+        return self._local.connections
+
+    def acquire(self):
+        """Get a connection for the current thread"""
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.reused += 1
+        except queue.Empty:
+            conn = self._connect()
+        self._checked_out().append(conn)
+        return conn
+
+    def release(self, conn):
+        """Give a connection back; closes it for real if the pool is full or shut down"""
+        checked_out = self._checked_out()
+        if conn in checked_out:
+            checked_out.remove(conn)
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            # Koneksi kembali ke pool tanpa arsip terpasang
+            while conn.attached:
+                _, alias = conn.attached.popitem()
+                conn.execute(f'DETACH DATABASE {alias}')
+        except sqlite3.Error:
+            conn._really_close()
+            return
+
+        if self._closed:
+            conn._really_close()
+            return
+
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn._really_close()
+
+    def release_thread(self):
+        """Return every connection the current thread forgot to close"""
+        for conn in list(self._checked_out()):
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection and stop pooling"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn._really_close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self):
+        return {
+            'db_path': self.db_path,
+            'idle': self._idle.qsize(),
+            'created': self.created,
+            'reused': self.reused,
+        }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path=DB_PATH):
+    """Get (or create) the pool for a database file"""
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                pool = ConnectionPool(db_path)
+                _pools[db_path] = pool
+    return pool
+
+
+def get_connection(db_path=DB_PATH):
+    """Get a pooled database connection (call close() to hand it back)"""
+    return get_pool(db_path).acquire()
+
+
+def release_thread_connections(exception=None):
+    """Flask teardown hook: reclaim connections left open by the finished request"""
+    for pool in list(_pools.values()):
+        pool.release_thread()
+
+
+def close_all_pools():
+    """Tear down every pool, used on app shutdown"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def init_app(app):
+    """Register pool teardown with a Flask app"""
+    app.teardown_appcontext(release_thread_connections)
+    atexit.register(close_all_pools)
@@ -0,0 +1,227 @@
+"""
+In-memory cache untuk face encoding aktif
+Keeps decoded encodings per user so check-in/check-out skip the face_data query and JSON parsing
+
+invalidate() also bumps the 'face_data' cache version, so the other worker processes drop
+their copy within CACHE_VERSION_INTERVAL (see cache_version.py).
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from cache_version import CacheVersion
+from db import get_connection
+from face_codec import decode_encoding
+
+# Penanda user tanpa face data aktif (supaya tidak query ulang setiap request)
+_NO_FACE = object()
+
+MATCH_STRATEGIES = ('min', 'centroid')
+
+# Dipakai bersama app.py, register_web.py dan reencode_faces.py
+# Threshold for face matching (lower = more strict)
+FACE_MATCH_THRESHOLD = 0.4
+# Multi-sample enrollment: maksimal sampel wajah per user
+FACE_MAX_SAMPLES = int(os.environ.get('FACE_MAX_SAMPLES', 5))
+# Cara membandingkan sampel: 'min' = sampel terdekat, 'centroid' = rata-rata semua sampel
+FACE_MATCH_STRATEGY = os.environ.get('FACE_MATCH_STRATEGY', 'min')
+if FACE_MATCH_STRATEGY not in MATCH_STRATEGIES:
+    FACE_MATCH_STRATEGY = 'min'
+
+
+def as_samples(encoding):
+    """View a stored encoding as a (K x 128) sample matrix (legacy 1-D rows are K=1)"""
+    return np.atleast_2d(encoding)
+
+
+def sample_distance(samples, probe, strategy='min'):
+    """Distance from a probe to a user's enrolled samples, all K at once
+
+    'min' takes the closest sample (best-of-K), 'centroid' compares against the mean sample.
+    """
+    samples = as_samples(samples)
+    probe = np.asarray(probe, dtype=samples.dtype)
+    if strategy == 'centroid':
+        return float(np.linalg.norm(samples.mean(axis=0) - probe))
+    if strategy != 'min':
+        raise ValueError(f"Unknown match strategy: {strategy}")
+    return float(np.linalg.norm(samples - probe, axis=1).min())
+
+
+class EncodingMatrix:
+    """All active samples stacked into one (rows x 128) matrix for 1:N identification
+
+    A user with K enrolled samples owns K rows, so nearest() is best-of-K per user.
+    """
+
+    def __init__(self, user_ids, encodings):
+        samples = [as_samples(encoding) for encoding in encodings]
+        self.user_ids = np.repeat(
+            np.asarray(user_ids, dtype=np.int64),
+            [len(sample) for sample in samples]
+        ) if samples else np.empty(0, dtype=np.int64)
+        if samples:
+            self.matrix = np.ascontiguousarray(np.vstack(samples), dtype=np.float32)
+        else:
+            self.matrix = np.empty((0, 128), dtype=np.float32)
+        # |m|^2 dihitung sekali, jarak per request cukup satu matrix-vector product
+        self.sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def distances(self, encoding):
+        """Euclidean distance from one encoding to every row"""
+        probe = np.asarray(encoding, dtype=np.float32)
+        sq = self.sq_norms - 2.0 * (self.matrix @ probe) + float(probe @ probe)
+        return np.sqrt(np.maximum(sq, 0.0))
+
+    def nearest(self, encoding):
+        """Returns (user_id, distance, runner_up_distance) or None when empty
+
+        runner_up_distance is the best distance to any *other* user (inf if none).
+        """
+        if not len(self):
+            return None
+        distances = self.distances(encoding)
+        best = int(np.argmin(distances))
+        user_id = int(self.user_ids[best])
+
+        others = distances[self.user_ids != user_id]
+        runner_up = float(others.min()) if len(others) else float('inf')
+        return user_id, float(distances[best]), runner_up
+
+
+class FaceEncodingCache:
+    def __init__(self, db_path='database.db'):
+        self.db_path = db_path
+        self._encodings = {}
+        self._matrix = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.version = CacheVersion('face_data', db_path)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _load(self, user_id):
+        """Read the active encoding (1-D, or K x 128 samples) for one user from the database"""
+        conn = get_connection(self.db_path)
+        row = conn.execute(
+            'SELECT face_encoding FROM face_data WHERE user_id = ? AND active = 1 ORDER BY id DESC LIMIT 1',
+            (user_id,)
+        ).fetchone()
+        conn.close()
+        return decode_encoding(row[0]) if row else _NO_FACE
+
+    def _sync(self):
+        """Drop everything when another worker process changed face_data"""
+        if self.version.changed():
+            self._drop()
+
+    def _drop(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                self._encodings.clear()
+            else:
+                for user_id in user_ids:
+                    self._encodings.pop(user_id, None)
+            self._matrix = None
+            self._generation += 1
+            self.invalidations += 1
+
+    def get(self, user_id):
+        """Get the active encoding for a user, or None if the user has no face data"""
+        self._sync()
+        with self._lock:
+            encoding = self._encodings.get(user_id)
+            if encoding is not None:
+                self.hits += 1
+                return None if encoding is _NO_FACE else encoding
+            self.misses += 1
+            generation = self._generation
+
+        encoding = self._load(user_id)
+        with self._lock:
+            # Encoding lama yang terbaca sebelum invalidate (mis. enroll ulang) tidak disimpan
+            if self._generation == generation:
+                self._encodings[user_id] = encoding
+        return None if encoding is _NO_FACE else encoding
+
+    def _load_all(self):
+        """Decode every active encoding, keyed by user_id (newest row wins)"""
+        conn = get_connection(self.db_path)
+        rows = conn.execute(
+            'SELECT user_id, face_encoding FROM face_data WHERE active = 1 ORDER BY id'
+        ).fetchall()
+        conn.close()
+
+        loaded = {}
+        for row in rows:
+            try:
+                loaded[row['user_id']] = decode_encoding(row['face_encoding'])
+            except (ValueError, TypeError) as e:
+                print(f"⚠️ Skipping face data for user {row['user_id']}: {e}")
+        return loaded
+
+    def warm_up(self):
+        """Preload every active encoding and the 1:N matrix, returns number of users loaded"""
+        self._sync()
+        with self._lock:
+            generation = self._generation
+        loaded = self._load_all()
+        matrix = EncodingMatrix(list(loaded), list(loaded.values()))
+        with self._lock:
+            if self._generation == generation:
+                self._encodings.update(loaded)
+                self._matrix = matrix
+        return len(loaded)
+
+    def matrix(self):
+        """Get the (N x 128) matrix of all active encodings, rebuilt after invalidation"""
+        self._sync()
+        with self._lock:
+            matrix = self._matrix
+            generation = self._generation
+        if matrix is None:
+            loaded = self._load_all()
+            matrix = EncodingMatrix(list(loaded), list(loaded.values()))
+            with self._lock:
+                # Jangan simpan matrix yang sudah basi kalau ada invalidasi selama rebuild
+                if self._generation == generation:
+                    self._matrix = matrix
+        return matrix
+
+    def identify(self, encoding):
+        """1:N lookup, see EncodingMatrix.nearest"""
+        return self.matrix().nearest(encoding)
+
+    def invalidate(self, user_id=None):
+        """Drop one user (or everything when user_id is None) after face_data changes"""
+        self._drop(None if user_id is None else [user_id])
+        self.version.bump()
+
+    def invalidate_many(self, user_ids):
+        self._drop(user_ids)
+        self.version.bump()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'cached_users': sum(1 for e in self._encodings.values() if e is not _NO_FACE),
+                'cached_entries': len(self._encodings),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 1) if total else 0,
+                'matrix_rows': len(self._matrix) if self._matrix is not None else None,
+                'samples': sum(len(as_samples(e)) for e in self._encodings.values() if e is not _NO_FACE),
+                'invalidations': self.invalidations,
+                'version': self.version.stats(),
+            }
+
+
+# Process-wide instance dipakai app.py dan register_web.py
+face_cache = FaceEncodingCache()
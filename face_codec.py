@@ -0,0 +1,69 @@
+"""
+Binary format untuk face_data.face_encoding
+Encodes face encodings as raw little-endian floats behind a small header, and still reads legacy JSON rows
+
+Layout (8 byte header, lalu data):
+    magic    2s   b'FE'
+    version  B    1
+    dtype    B    ord('f') float32 / ord('d') float64
+    rows     H    0 = vektor 1 dimensi, >0 = matriks rows x cols
+    cols     H    jumlah elemen per encoding (128 untuk dlib)
+"""
+
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b'FE'
+VERSION = 1
+HEADER = struct.Struct('<2sBBHH')
+
+_DTYPES = {
+    ord('f'): np.dtype('<f4'),
+    ord('d'): np.dtype('<f8'),
+}
+_DTYPE_CODES = {dtype: code for code, dtype in _DTYPES.items()}
+
+
+def encode_encoding(encoding, dtype='<f4'):
+    """Pack a face encoding (1-D or 2-D array) into the binary BLOB format"""
+    dtype = np.dtype(dtype)
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported encoding dtype: {dtype}")
+
+    array = np.ascontiguousarray(encoding, dtype=dtype)
+    if array.ndim == 1:
+        rows, cols = 0, array.shape[0]
+    elif array.ndim == 2:
+        rows, cols = array.shape
+    else:
+        raise ValueError(f"Face encoding must be 1-D or 2-D, got shape {array.shape}")
+
+    return HEADER.pack(MAGIC, VERSION, _DTYPE_CODES[dtype], rows, cols) + array.tobytes()
+
+
+def is_binary(raw):
+    return isinstance(raw, (bytes, bytearray, memoryview)) and bytes(raw[:2]) == MAGIC
+
+
+def decode_encoding(raw):
+    """Decode a stored face_encoding value (binary BLOB or legacy JSON text)
+
+    Binary values are returned as a read-only zero-copy view over the BLOB.
+    """
+    if is_binary(raw):
+        magic, version, dtype_code, rows, cols = HEADER.unpack_from(raw)
+        if version != VERSION:
+            raise ValueError(f"Unsupported face encoding version: {version}")
+        dtype = _DTYPES.get(dtype_code)
+        if dtype is None:
+            raise ValueError(f"Unsupported face encoding dtype code: {dtype_code}")
+
+        count = (rows or 1) * cols
+        array = np.frombuffer(raw, dtype=dtype, count=count, offset=HEADER.size)
+        return array.reshape(rows, cols) if rows else array
+
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        raw = bytes(raw).decode('utf-8')
+    return np.ascontiguousarray(json.loads(raw), dtype=np.float64)
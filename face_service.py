@@ -0,0 +1,281 @@
+"""
+Face verification service untuk sistem absensi
+Runs dlib face encoding in a process pool so CPU-heavy work never blocks Flask request threads
+
+Konfigurasi lewat environment variable:
+    FACE_WORKERS         jumlah worker process (default: jumlah CPU, 0 = jalankan di thread request)
+    FACE_QUEUE_SIZE      jumlah job yang boleh antre di luar yang sedang diproses (default: 4x worker)
+    FACE_VERIFY_TIMEOUT  batas tunggu mode sinkron dalam detik (default 20)
+    FACE_START_METHOD    cara membuat worker: forkserver (default di Linux) atau spawn
+    FACE_FINALIZE_THREADS  thread yang menjalankan on_done job async (default 4)
+
+Workers are never plain fork()ed: the Flask process has running threads (log writer, face
+check, request threads) whose locks would be copied into the child in whatever state they are.
+New workers import the main script again, so scripts using the pool need a __main__ guard.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor,
+                                TimeoutError as FutureTimeoutError, wait)
+from concurrent.futures.process import BrokenProcessPool
+
+FACE_WORKERS = int(os.environ.get('FACE_WORKERS', os.cpu_count() or 1))
+FACE_QUEUE_SIZE = int(os.environ.get('FACE_QUEUE_SIZE', max(FACE_WORKERS, 1) * 4))
+FACE_VERIFY_TIMEOUT = float(os.environ.get('FACE_VERIFY_TIMEOUT', 20))
+FACE_START_METHOD = os.environ.get(
+    'FACE_START_METHOD',
+    'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+FACE_FINALIZE_THREADS = int(os.environ.get('FACE_FINALIZE_THREADS', 4))
+
+# Job async yang sudah selesai disimpan selama ini (detik) untuk di-poll client
+JOB_TTL = 600
+
+
+class FaceServiceBusy(Exception):
+    """Raised when the verification queue is full"""
+
+
+class FaceServiceTimeout(Exception):
+    """Raised when a synchronous verification does not finish in time"""
+
+
+def _init_worker():
+    """Worker initializer: load dlib models once per process"""
+    import face_recognition  # noqa: F401 - import memuat model HOG, landmark & encoder
+
+
+def _ping():
+    return os.getpid()
+
+
+def _probe():
+    """Import the face libraries the way a real job does (a broken dlib install fails here)"""
+    import cv2  # noqa: F401
+    import face_recognition  # noqa: F401
+    return os.getpid()
+
+
+def _encode_job(source):
+    """Runs inside a worker process"""
+    from face_pipeline import encode_faces
+    return encode_faces(source)
+
+
+def _encode_many_job(sources):
+    """Runs inside a worker process: one chunk of a batch, per-photo errors kept in place"""
+    from face_pipeline import encode_faces
+    results = []
+    for source in sources:
+        try:
+            results.append(encode_faces(source))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+class FaceVerificationService:
+    def __init__(self, max_workers=FACE_WORKERS, max_queue=FACE_QUEUE_SIZE, timeout=FACE_VERIFY_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._finalizer = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(max_workers, 1) + max_queue)
+        self._jobs = {}
+        self.submitted = 0
+        self.rejected = 0
+
+    def start(self, preload=True):
+        """Start the worker pool; with preload, spawn every worker and load models now"""
+        if self.max_workers <= 0:
+            return
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(FACE_START_METHOD)
+                if FACE_START_METHOD == 'forkserver':
+                    # Server forkserver memuat dlib sekali, worker baru tinggal di-fork darinya
+                    context.set_forkserver_preload(['face_recognition'])
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                                     mp_context=context)
+            executor = self._executor
+        if preload:
+            futures = [executor.submit(_ping) for _ in range(self.max_workers)]
+            pids = {future.result() for future in futures}
+            print(f"✓ Face workers ready: {len(pids)} process(es)")
+
+    def check(self, timeout=120):
+        """Run one import probe in a worker: None if the face libraries load, else the error text"""
+        try:
+            self._submit(_probe).result(timeout=timeout)
+        except FaceServiceBusy:
+            return None  # worker sibuk = sudah jalan
+        except Exception as e:
+            return str(e) or e.__class__.__name__
+        return None
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def shutdown_finalizer(self):
+        """Wait for running on_done callbacks (app shutdown)"""
+        with self._lock:
+            finalizer, self._finalizer = self._finalizer, None
+        if finalizer is not None:
+            finalizer.shutdown(wait=True)
+
+    def _run_finalizer(self, fn, *args):
+        with self._lock:
+            if self._finalizer is None:
+                self._finalizer = ThreadPoolExecutor(max_workers=max(FACE_FINALIZE_THREADS, 1),
+                                                     thread_name_prefix='face-finalize')
+            finalizer = self._finalizer
+        finalizer.submit(fn, *args)
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise FaceServiceBusy("Server sedang sibuk, silakan coba lagi sebentar lagi")
+
+        try:
+            if self.max_workers <= 0:
+                # Mode tanpa pool: jalankan langsung (debug / lingkungan tanpa multiprocessing)
+                from concurrent.futures import Future
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                if self._executor is None:
+                    self.start(preload=False)
+                try:
+                    future = self._executor.submit(fn, *args)
+                except BrokenProcessPool:
+                    # Worker mati (mis. OOM), buat ulang pool sekali
+                    self.shutdown()
+                    self.start(preload=False)
+                    future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        self.submitted += 1
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def encode(self, source, timeout=None):
+        """Synchronous mode: encode faces in a worker and wait for the result"""
+        future = self._submit(_encode_job, source)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FutureTimeoutError:
+            raise FaceServiceTimeout("Verifikasi wajah terlalu lama, silakan coba lagi")
+
+    def encode_many(self, sources, timeout=None):
+        """Encode a batch of photos spread over the workers, results in input order
+
+        Each element is the list of encodings, or the exception raised for that photo.
+        Raises FaceServiceBusy only if not a single chunk could be queued.
+        """
+        if not sources:
+            return []
+        chunks = max(min(max(self.max_workers, 1), len(sources)), 1)
+        pending = [list(range(i, len(sources), chunks)) for i in range(chunks)]
+        submitted = []
+        deadline = time.time() + (timeout or self.timeout) * max(len(sources) / chunks, 1)
+
+        while pending:
+            try:
+                future = self._submit(_encode_many_job, [sources[i] for i in pending[0]])
+            except FaceServiceBusy:
+                if not submitted or time.time() > deadline:
+                    raise
+                # Antrian penuh: tunggu salah satu chunk batch ini selesai dulu
+                running = [f for _, f in submitted if not f.done()]
+                if running:
+                    wait(running, timeout=max(deadline - time.time(), 0.1), return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(0.05)
+                continue
+            submitted.append((pending.pop(0), future))
+
+        results = [None] * len(sources)
+        for indexes, future in submitted:
+            try:
+                encoded = future.result(timeout=max(deadline - time.time(), 0.1))
+            except FutureTimeoutError:
+                encoded = [FaceServiceTimeout("Verifikasi wajah terlalu lama, silakan coba lagi")] * len(indexes)
+            except Exception as e:
+                encoded = [e] * len(indexes)
+            for index, value in zip(indexes, encoded):
+                results[index] = value
+        return results
+
+    def submit_encode(self, source, on_done, owner=None, on_settled=None):
+        """Async mode: returns a job id, on_done(encodings) builds the final result dict
+
+        on_done runs in a background thread once the worker finishes, so it must not
+        touch the Flask request or session. on_settled(job) runs after it, even on errors,
+        with the finished job ({'id', 'status': done|error, 'result', ...}).
+        Both run on the finalizer threads, not the pool's result thread, so database work
+        in on_done does not hold up the results of other jobs.
+        """
+        self._prune_jobs()
+        job_id = uuid.uuid4().hex
+        job = {'id': job_id, 'status': 'pending', 'owner': owner, 'created': time.time(), 'result': None}
+        with self._lock:
+            self._jobs[job_id] = job
+
+        def finish(future):
+            try:
+                result = on_done(future.result())
+                job['status'] = 'done'
+            except Exception as e:
+                result = {'success': False, 'message': f'Error: {str(e)}'}
+                job['status'] = 'error'
+            job['result'] = result
+            job['finished'] = time.time()
+            if on_settled is not None:
+                on_settled(job)
+
+        try:
+            future = self._submit(_encode_job, source)
+        except Exception:
+            with self._lock:
+                self._jobs.pop(job_id, None)
+            raise
+        future.add_done_callback(lambda f: self._run_finalizer(finish, f))
+        return job_id
+
+    def job_status(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune_jobs(self):
+        cutoff = time.time() - JOB_TTL
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if job['created'] < cutoff]:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job['status'] == 'pending')
+        return {
+            'workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'pending_jobs': pending,
+        }
+
+
+# Process-wide instance dipakai app.py
+face_service = FaceVerificationService()
@@ -0,0 +1,495 @@
+"""
+Geofence check untuk absensi
+Indexes active coordinates in a lat/lon grid so a check-in only tests the few sites near it
+
+Setiap site didaftarkan di semua cell grid yang tertutup bounding box-nya. A check-in
+tests the sites of its own cell exactly; if it is outside all of them, nearby rings of
+cells are searched for the nearest site and, as a last resort, every site is scanned
+with one vectorized haversine (SiteSnapshot).
+
+Site bisa berupa lingkaran (latitude, longitude, radius) atau poligon. Polygons are
+stored as packed float64 (lat, lon) pairs in coordinates.polygon with a precomputed
+bounding box (min_lat .. max_lon); latitude/longitude/radius hold the centroid and
+the bounding circle so older code keeps working.
+
+Every worker process keeps its own index; invalidate() bumps the 'coordinates' cache
+version so the others rebuild theirs within CACHE_VERSION_INTERVAL (see cache_version.py).
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from cache_version import CacheVersion
+from db import get_connection
+
+EARTH_RADIUS = 6371000  # meter
+# Sama dengan haversine (EARTH_RADIUS), bukan 111320, supaya bbox tidak lebih kecil dari lingkarannya
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+# Bounding box lingkaran diperlebar sedikit terhadap pembulatan di tepi radius
+BOUNDS_MARGIN = 1.01
+
+# Ukuran cell grid dalam derajat (0.01 = ~1.1 km, radius site maksimal 1000 m)
+GEOFENCE_CELL_DEG = float(os.environ.get('GEOFENCE_CELL_DEG', 0.01))
+# Berapa ring cell di sekitar posisi dicari untuk site terdekat sebelum full scan
+GEOFENCE_SEARCH_RINGS = 3
+
+# Batas poligon: jumlah titik dan jarak titik terjauh dari pusat
+POLYGON_MAX_POINTS = 100
+POLYGON_MAX_RADIUS = 2000
+
+SITE_COLUMNS = 'id, name, latitude, longitude, radius, shape, polygon, min_lat, max_lat, min_lon, max_lon'
+
+# Kolom tambahan untuk database lama (lihat ensure_schema)
+ZONE_COLUMNS = {
+    'shape': "TEXT DEFAULT 'circle'",
+    'polygon': 'BLOB',
+    'min_lat': 'REAL',
+    'max_lat': 'REAL',
+    'min_lon': 'REAL',
+    'max_lon': 'REAL',
+}
+
+
+def ensure_schema(conn):
+    """Add the polygon/bounding box columns to an existing coordinates table"""
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(coordinates)').fetchall()}
+    added = [name for name in ZONE_COLUMNS if name not in existing]
+    for name in added:
+        conn.execute(f'ALTER TABLE coordinates ADD COLUMN {name} {ZONE_COLUMNS[name]}')
+    if added:
+        conn.commit()
+    return added
+
+
+def haversine_rad(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2):
+    """Haversine distance (meter) between two points given in radians"""
+    a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def encode_polygon(points):
+    """Pack [(lat, lon), ...] into a compact float64 BLOB"""
+    return np.ascontiguousarray(points, dtype='<f8').tobytes()
+
+
+def decode_polygon(raw):
+    """Unpack a polygon BLOB into a (N x 2) array of (lat, lon)"""
+    return np.frombuffer(raw, dtype='<f8').reshape(-1, 2)
+
+
+def parse_polygon(raw):
+    """Validate polygon input (JSON [[lat, lon], ...]), raises ValueError with a user-facing message"""
+    try:
+        points = json.loads(raw) if isinstance(raw, str) else raw
+        points = np.asarray(points, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError('Format titik poligon tidak valid')
+
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError('Format titik poligon tidak valid')
+    # Titik terakhir yang sama dengan titik pertama tidak perlu disimpan
+    if len(points) > 3 and np.allclose(points[0], points[-1]):
+        points = points[:-1]
+    if len(points) < 3:
+        raise ValueError('Poligon membutuhkan minimal 3 titik')
+    if len(points) > POLYGON_MAX_POINTS:
+        raise ValueError(f'Poligon maksimal {POLYGON_MAX_POINTS} titik')
+    if (np.abs(points[:, 0]) > 90).any() or (np.abs(points[:, 1]) > 180).any():
+        raise ValueError('Titik poligon di luar rentang latitude/longitude')
+    return points
+
+
+def polygon_zone(points):
+    """Centroid, bounding radius (meter) and bounding box for a polygon"""
+    center_lat, center_lon = points.mean(axis=0)
+    cos_center = math.cos(math.radians(center_lat))
+    radius = max(
+        haversine_rad(math.radians(center_lat), math.radians(center_lon), cos_center,
+                      math.radians(lat), math.radians(lon), math.cos(math.radians(lat)))
+        for lat, lon in points
+    )
+    return {
+        'latitude': float(center_lat),
+        'longitude': float(center_lon),
+        'radius': int(math.ceil(radius)),
+        'min_lat': float(points[:, 0].min()),
+        'max_lat': float(points[:, 0].max()),
+        'min_lon': float(points[:, 1].min()),
+        'max_lon': float(points[:, 1].max()),
+    }
+
+
+def circle_bounds(latitude, longitude, radius):
+    """Bounding box (min_lat, max_lat, min_lon, max_lon) of a circle, slightly padded"""
+    dlat = radius * BOUNDS_MARGIN / METERS_PER_DEGREE
+    # Lebar longitude diukur di tepi lingkaran yang paling dekat ke kutub
+    widest = min(abs(latitude) + dlat, 90.0)
+    dlon = radius * BOUNDS_MARGIN / (METERS_PER_DEGREE * max(math.cos(math.radians(widest)), 1e-6))
+    return latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon
+
+
+def point_in_polygon(latitude, longitude, lats, lons):
+    """Ray casting, edges treated as straight lines in lat/lon (fine at school scale)"""
+    inside = False
+    j = len(lats) - 1
+    for i in range(len(lats)):
+        if (lats[i] > latitude) != (lats[j] > latitude):
+            cross = lons[i] + (latitude - lats[i]) * (lons[j] - lons[i]) / (lats[j] - lats[i])
+            if longitude < cross:
+                inside = not inside
+        j = i
+    return inside
+
+
+def polygon_edge_distance(latitude, longitude, lats, lons):
+    """Distance (meter) from a point to the nearest polygon edge, local flat projection"""
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(latitude))
+    xs = [(lon - longitude) * scale_x for lon in lons]
+    ys = [(lat - latitude) * METERS_PER_DEGREE for lat in lats]
+    best = float('inf')
+    j = len(xs) - 1
+    for i in range(len(xs)):
+        x1, y1, x2, y2 = xs[j], ys[j], xs[i], ys[i]
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else max(0.0, min(1.0, -(x1 * dx + y1 * dy) / length))
+        best = min(best, math.hypot(x1 + t * dx, y1 + t * dy))
+        j = i
+    return best
+
+
+def _field(row, key, default=None):
+    return row[key] if key in row.keys() else default
+
+
+class SiteSnapshot:
+    """Active attendance sites as parallel arrays (lat/lon in radians, cos(lat) precomputed)
+
+    Polygons are represented by their bounding circle here; SiteIndex re-checks them exactly.
+    """
+
+    def __init__(self, rows):
+        self.ids = np.array([row['id'] for row in rows], dtype=np.int64)
+        self.names = [row['name'] for row in rows]
+        self.lat = np.radians(np.array([row['latitude'] for row in rows], dtype=np.float64))
+        self.lon = np.radians(np.array([row['longitude'] for row in rows], dtype=np.float64))
+        self.cos_lat = np.cos(self.lat)
+        self.radius = np.array([row['radius'] for row in rows], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, latitude, longitude):
+        """Haversine distance (meter) from one position to every site"""
+        lat = np.radians(latitude)
+        lon = np.radians(longitude)
+        a = np.sin((self.lat - lat) / 2) ** 2 + np.cos(lat) * self.cos_lat * np.sin((self.lon - lon) / 2) ** 2
+        return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def locate(self, latitude, longitude):
+        """Returns {'inside', 'site_id', 'name', 'shape', 'distance', 'radius', 'outside_by'} or None
+
+        Inside: the containing site closest to the position. Outside: the site whose
+        edge is closest, so the response can say how far out the user is.
+        """
+        if not len(self):
+            return None
+        distances = self.distances(latitude, longitude)
+        outside_by = distances - self.radius
+        inside = outside_by <= 0
+
+        if inside.any():
+            index = int(np.argmin(np.where(inside, distances, np.inf)))
+        else:
+            index = int(np.argmin(outside_by))
+
+        return {
+            'inside': bool(inside[index]),
+            'site_id': int(self.ids[index]),
+            'name': self.names[index],
+            'shape': 'circle',
+            'distance': round(float(distances[index]), 1),
+            'radius': float(self.radius[index]),
+            'outside_by': round(max(float(outside_by[index]), 0.0), 1),
+        }
+
+
+class SiteIndex:
+    """Grid index over active sites, updated one site at a time"""
+
+    def __init__(self, rows=(), cell_deg=None):
+        self.cell_deg = cell_deg or GEOFENCE_CELL_DEG
+        self.sites = {}
+        self.cells = defaultdict(set)
+        self._site_cells = {}
+        self._snapshot = None
+        for row in rows:
+            self.add(row)
+
+    def __len__(self):
+        return len(self.sites)
+
+    def _cell(self, latitude, longitude):
+        return int(math.floor(latitude / self.cell_deg)), int(math.floor(longitude / self.cell_deg))
+
+    def _covered_cells(self, bbox):
+        """Every cell touched by a (min_lat, max_lat, min_lon, max_lon) bounding box"""
+        lat_lo, lon_lo = self._cell(bbox[0], bbox[2])
+        lat_hi, lon_hi = self._cell(bbox[1], bbox[3])
+        return [(i, j) for i in range(lat_lo, lat_hi + 1) for j in range(lon_lo, lon_hi + 1)]
+
+    def add(self, row):
+        site_id = row['id']
+        self.remove(site_id)
+        lat = math.radians(row['latitude'])
+        site = {
+            'id': site_id,
+            'name': row['name'],
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'radius': row['radius'],
+            'lat': lat,
+            'lon': math.radians(row['longitude']),
+            'cos_lat': math.cos(lat),
+            'shape': 'circle',
+        }
+
+        polygon = _field(row, 'polygon')
+        if _field(row, 'shape') == 'polygon' and polygon:
+            points = decode_polygon(polygon)
+            site['shape'] = 'polygon'
+            site['poly_lat'] = points[:, 0].tolist()
+            site['poly_lon'] = points[:, 1].tolist()
+            if _field(row, 'min_lat') is not None:
+                site['bbox'] = (row['min_lat'], row['max_lat'], row['min_lon'], row['max_lon'])
+            else:
+                zone = polygon_zone(points)
+                site['bbox'] = (zone['min_lat'], zone['max_lat'], zone['min_lon'], zone['max_lon'])
+        else:
+            site['bbox'] = circle_bounds(row['latitude'], row['longitude'], row['radius'])
+
+        self.sites[site_id] = site
+        cells = self._covered_cells(site['bbox'])
+        for cell in cells:
+            self.cells[cell].add(site_id)
+        self._site_cells[site_id] = cells
+        self._snapshot = None
+
+    def remove(self, site_id):
+        if self.sites.pop(site_id, None) is None:
+            return
+        for cell in self._site_cells.pop(site_id):
+            bucket = self.cells[cell]
+            bucket.discard(site_id)
+            if not bucket:
+                del self.cells[cell]
+        self._snapshot = None
+
+    def snapshot(self):
+        """All sites as arrays for the vectorized fallback scan (rebuilt after changes)"""
+        if self._snapshot is None:
+            self._snapshot = SiteSnapshot(list(self.sites.values()))
+        return self._snapshot
+
+    def _ring(self, center, k):
+        ci, cj = center
+        if k == 0:
+            return [center]
+        cells = [(ci + di, cj + dj) for di in (-k, k) for dj in range(-k, k + 1)]
+        cells += [(ci + di, cj + dj) for dj in (-k, k) for di in range(-k + 1, k)]
+        return cells
+
+    def _measure(self, site, latitude, longitude, lat, lon, cos_lat):
+        """(inside, distance to the site centre, meters outside the edge) for one site"""
+        distance = haversine_rad(lat, lon, cos_lat, site['lat'], site['lon'], site['cos_lat'])
+        if site['shape'] == 'circle':
+            return distance <= site['radius'], distance, max(distance - site['radius'], 0.0)
+
+        min_lat, max_lat, min_lon, max_lon = site['bbox']
+        # Bounding box dulu, point-in-polygon hanya kalau bbox kena
+        if min_lat <= latitude <= max_lat and min_lon <= longitude <= max_lon:
+            if point_in_polygon(latitude, longitude, site['poly_lat'], site['poly_lon']):
+                return True, distance, 0.0
+        return False, distance, polygon_edge_distance(latitude, longitude, site['poly_lat'], site['poly_lon'])
+
+    def _result(self, site, inside, distance, outside_by):
+        return {
+            'inside': inside,
+            'site_id': site['id'],
+            'name': site['name'],
+            'shape': site['shape'],
+            'distance': round(distance, 1),
+            'radius': float(site['radius']),
+            'outside_by': round(outside_by, 1),
+        }
+
+    def locate(self, latitude, longitude):
+        """Same result as SiteSnapshot.locate, testing only sites from nearby cells"""
+        if not self.sites:
+            return None
+        lat = math.radians(latitude)
+        lon = math.radians(longitude)
+        cos_lat = math.cos(lat)
+        center = self._cell(latitude, longitude)
+
+        best = None  # (outside_by, distance, site)
+        inside = None  # (distance, site)
+        tested = set()
+        found_ring = None
+        for k in range(GEOFENCE_SEARCH_RINGS + 1):
+            for cell in self._ring(center, k):
+                for site_id in self.cells.get(cell, ()):
+                    if site_id in tested:
+                        continue
+                    tested.add(site_id)
+                    site = self.sites[site_id]
+                    is_inside, distance, outside_by = self._measure(site, latitude, longitude, lat, lon, cos_lat)
+                    if is_inside:
+                        if inside is None or distance < inside[0]:
+                            inside = (distance, site)
+                    elif best is None or outside_by < best[0]:
+                        best = (outside_by, distance, site)
+
+            # Cell sendiri berisi semua site yang bisa memuat posisi ini
+            if k == 0 and inside:
+                return self._result(inside[1], True, inside[0], 0.0)
+            if (best or inside) and found_ring is None:
+                found_ring = k
+            # Satu ring ekstra supaya site di cell diagonal tidak terlewat
+            if found_ring is not None and k > found_ring:
+                break
+
+        # Site yang memuat posisi selalu menang atas site luar terdekat, dari ring mana pun
+        if inside:
+            return self._result(inside[1], True, inside[0], 0.0)
+        if best:
+            return self._result(best[2], False, best[1], best[0])
+
+        result = self.snapshot().locate(latitude, longitude)
+        site = self.sites[result['site_id']]
+        if site['shape'] == 'polygon':
+            is_inside, distance, outside_by = self._measure(site, latitude, longitude, lat, lon, cos_lat)
+            result = self._result(site, is_inside, distance, outside_by)
+        return result
+
+
+class GeofenceCache:
+    def __init__(self, db_path='database.db'):
+        self.db_path = db_path
+        self._index = None
+        self._generation = 0
+        self._zones = None
+        self._lock = threading.Lock()
+        self.version = CacheVersion('coordinates', db_path)
+        self.loads = 0
+        self.updates = 0
+        self.invalidations = 0
+
+    def _rows(self, site_id=None):
+        conn = get_connection(self.db_path)
+        if site_id is None:
+            rows = conn.execute(
+                f'SELECT {SITE_COLUMNS} FROM coordinates WHERE active = 1 ORDER BY id'
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                f'SELECT {SITE_COLUMNS} FROM coordinates WHERE id = ? AND active = 1',
+                (site_id,)
+            ).fetchall()
+        conn.close()
+        return rows
+
+    def _sync(self):
+        """Drop the index when another worker process changed the coordinates"""
+        if self.version.changed():
+            with self._lock:
+                self._generation += 1
+                self._index = None
+                self._zones = None
+
+    def index(self):
+        """Get the index of active sites, fully rebuilt only when it was dropped"""
+        self._sync()
+        with self._lock:
+            index = self._index
+            generation = self._generation
+        if index is None:
+            index = SiteIndex(self._rows())
+            with self._lock:
+                self.loads += 1
+                # Jangan simpan index basi kalau koordinat berubah selama load
+                if self._generation == generation:
+                    self._index = index
+        return index
+
+    def locate(self, latitude, longitude):
+        """See SiteIndex.locate"""
+        index = self.index()
+        with self._lock:
+            return index.locate(latitude, longitude)
+
+    def zones(self):
+        """Versioned snapshot of the active zones for the browser: {'version', 'zones'}
+
+        The version is a hash of the content, so every worker process hands out
+        the same ETag for the same coordinates.
+        """
+        self._sync()
+        with self._lock:
+            zones = self._zones
+            generation = self._generation
+        if zones is None:
+            items = []
+            for row in self._rows():
+                polygon = row['polygon'] if row['shape'] == 'polygon' and row['polygon'] else None
+                items.append({
+                    'id': row['id'],
+                    'name': row['name'],
+                    'shape': 'polygon' if polygon else 'circle',
+                    'latitude': row['latitude'],
+                    'longitude': row['longitude'],
+                    'radius': row['radius'],
+                    'polygon': decode_polygon(polygon).tolist() if polygon else None,
+                })
+            digest = hashlib.sha1(json.dumps(items, sort_keys=True).encode()).hexdigest()
+            zones = {'version': digest[:16], 'zones': items}
+            with self._lock:
+                if self._generation == generation:
+                    self._zones = zones
+        return zones
+
+    def invalidate(self, site_id=None):
+        """Call after a coordinate changed: re-reads just that site, or everything when site_id is None"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._zones = None
+            if site_id is None or self._index is None:
+                self._index = None
+            else:
+                self._index.remove(int(site_id))
+                for row in self._rows(int(site_id)):
+                    self._index.add(row)
+                self.updates += 1
+        self.version.bump()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sites': len(self._index) if self._index is not None else None,
+                'cells': len(self._index.cells) if self._index is not None else None,
+                'loads': self.loads,
+                'incremental_updates': self.updates,
+                'invalidations': self.invalidations,
+                'version': self.version.stats(),
+            }
+
+
+# Process-wide instance dipakai app.py
+geofence = GeofenceCache()
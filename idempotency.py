@@ -0,0 +1,233 @@
+"""
+Idempotency-Key store untuk absen_masuk / absen_keluar
+Remembers the outcome of a submission so a retry on flaky Wi-Fi replays it instead of
+uploading and verifying the photo again
+
+Outcomes live in the idempotency_keys table (shared by every worker process) with a
+small in-memory LRU in front. A key is reserved before the request runs, so a duplicate
+arriving while the first is still verifying gets 409 instead of a second face check.
+Only final outcomes are kept (success or a rejection such as an unrecognised face); a
+request that errored (5xx) or was turned away (429) releases its key for a real retry.
+An async verification is stored as its 202 first; the job overwrites it with the final
+outcome when it finishes, so a retry or poll on another worker sees the result too.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from db import get_connection
+
+# Berapa lama hasil disimpan (detik) - cukup untuk retry hari yang sama
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600))
+# Reservasi yang tidak selesai dalam waktu ini dianggap ditinggal (worker crash)
+IDEMPOTENCY_PENDING_TIMEOUT = 120
+IDEMPOTENCY_LRU_SIZE = 1024
+# Bersihkan baris kadaluarsa setiap N reservasi
+PURGE_EVERY = 200
+
+KEY_PATTERN = re.compile(r'^[A-Za-z0-9_\-:.]{8,128}$')
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        user_id INTEGER NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        endpoint TEXT NOT NULL,
+        status_code INTEGER,
+        response TEXT,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (user_id, idempotency_key)
+    )
+'''
+
+
+def ensure_schema(conn):
+    """Create the idempotency_keys table on databases that predate it"""
+    conn.execute(SCHEMA)
+    conn.commit()
+
+
+def valid_key(key):
+    return bool(key and KEY_PATTERN.match(key))
+
+
+class IdempotencyStore:
+    def __init__(self, db_path='database.db', ttl=None, lru_size=IDEMPOTENCY_LRU_SIZE):
+        self.db_path = db_path
+        self.ttl = ttl or IDEMPOTENCY_TTL
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._reservations = 0
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, cache_key, entry):
+        with self._lock:
+            self._lru[cache_key] = entry
+            self._lru.move_to_end(cache_key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _cached(self, cache_key):
+        with self._lock:
+            entry = self._lru.get(cache_key)
+            if entry is None:
+                return None
+            if entry['created_at'] < time.time() - self.ttl:
+                del self._lru[cache_key]
+                return None
+            self._lru.move_to_end(cache_key)
+            self.hits += 1
+            return entry
+
+    def begin(self, user_id, key, endpoint):
+        """Reserve a key: ('new', None), ('done', entry), ('pending', None) or ('conflict', entry)
+
+        entry is {'endpoint', 'status_code', 'response', 'created_at'} of the stored outcome.
+        """
+        cache_key = (user_id, key)
+        entry = self._cached(cache_key)
+        if entry is not None:
+            return ('done' if entry['endpoint'] == endpoint else 'conflict'), entry
+
+        now = time.time()
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                '''SELECT endpoint, status_code, response, created_at FROM idempotency_keys
+                   WHERE user_id = ? AND idempotency_key = ?''',
+                (user_id, key)
+            ).fetchone()
+
+            expired = row is not None and (
+                row['created_at'] < now - self.ttl
+                or (row['status_code'] is None and row['created_at'] < now - IDEMPOTENCY_PENDING_TIMEOUT)
+            )
+            if row is not None and not expired:
+                conn.rollback()
+                if row['status_code'] is None:
+                    return ('pending' if row['endpoint'] == endpoint else 'conflict'), None
+                entry = {
+                    'endpoint': row['endpoint'],
+                    'status_code': row['status_code'],
+                    'response': json.loads(row['response']),
+                    'created_at': row['created_at'],
+                }
+                with self._lock:
+                    self.db_hits += 1
+                if entry['status_code'] != 202:
+                    # 202 masih bisa diganti job (di worker lain), selalu dibaca dari database
+                    self._remember(cache_key, entry)
+                return ('done' if entry['endpoint'] == endpoint else 'conflict'), entry
+
+            conn.execute(
+                '''INSERT OR REPLACE INTO idempotency_keys (user_id, idempotency_key, endpoint, created_at)
+                   VALUES (?, ?, ?, ?)''',
+                (user_id, key, endpoint, now)
+            )
+            with self._lock:
+                self.misses += 1
+                self._reservations += 1
+                purge = self._reservations % PURGE_EVERY == 0
+            if purge:
+                conn.execute('DELETE FROM idempotency_keys WHERE created_at < ?', (now - self.ttl,))
+            conn.commit()
+            return 'new', None
+        finally:
+            conn.close()
+
+    def complete(self, user_id, key, endpoint, status_code, response):
+        """Store the outcome of a reserved key
+
+        A final outcome is never replaced by a 202: an async job that finished before the
+        request stored its 202 keeps its result.
+        """
+        conn = get_connection(self.db_path)
+        try:
+            row = conn.execute(
+                '''UPDATE idempotency_keys SET status_code = ?, response = ?
+                   WHERE user_id = ? AND idempotency_key = ? AND endpoint = ?
+                     AND (status_code IS NULL OR status_code = 202)
+                   RETURNING created_at''',
+                (status_code, json.dumps(response), user_id, key, endpoint)
+            ).fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+
+        if row is None or status_code == 202:
+            # Sudah diganti hasil akhir job / dibuang, atau 202 yang masih akan diganti
+            with self._lock:
+                self._lru.pop((user_id, key), None)
+            return
+        created_at = row['created_at']
+        self._remember((user_id, key), {
+            'endpoint': endpoint,
+            'status_code': status_code,
+            'response': response,
+            'created_at': created_at,
+        })
+
+    def release(self, user_id, key):
+        """Drop a reservation whose request failed, so the client can retry for real"""
+        with self._lock:
+            self._lru.pop((user_id, key), None)
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute(
+                'DELETE FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ? AND status_code IS NULL',
+                (user_id, key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def discard(self, user_id, key):
+        """Drop a stored outcome that turned out not to be final (async job ended in an error)"""
+        with self._lock:
+            self._lru.pop((user_id, key), None)
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute(
+                'DELETE FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ?',
+                (user_id, key)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def job_outcome(self, user_id, job_id):
+        """(status_code, response) stored for an async job of this user, None if unknown"""
+        conn = get_connection(self.db_path)
+        try:
+            row = conn.execute(
+                '''SELECT status_code, response FROM idempotency_keys
+                   WHERE user_id = ? AND status_code IS NOT NULL
+                     AND json_extract(response, '$.job_id') = ? AND created_at >= ?''',
+                (user_id, job_id, time.time() - self.ttl)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return row['status_code'], json.loads(row['response'])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'lru_size': len(self._lru),
+                'lru_hits': self.hits,
+                'db_hits': self.db_hits,
+                'misses': self.misses,
+                'ttl': self.ttl,
+            }
+
+
+# Process-wide instance dipakai app.py
+idempotency = IdempotencyStore()
@@ -1,6 +1,10 @@
+import glob
+import os
 import sqlite3
 from datetime import datetime, date, timedelta
 from werkzeug.security import generate_password_hash
+import archive
+import daily_summary
 
 def init_database():
     """Initialize the SQLite database with all required tables"""
@@ -48,6 +52,9 @@ def init_database():
             date DATE NOT NULL,
             time_in TIME,
             time_out TIME,
+            time_in_sec INTEGER,
+            time_out_sec INTEGER,
+            work_minutes INTEGER,
             latitude REAL,
             longitude REAL,
             photo_path TEXT,
@@ -67,6 +74,12 @@ def init_database():
             latitude REAL NOT NULL,
             longitude REAL NOT NULL,
             radius INTEGER DEFAULT 100,
+            shape TEXT DEFAULT 'circle',
+            polygon BLOB,
+            min_lat REAL,
+            max_lat REAL,
+            min_lon REAL,
+            max_lon REAL,
             active INTEGER DEFAULT 1,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -78,7 +91,7 @@ def init_database():
         CREATE TABLE IF NOT EXISTS face_data (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
-            face_encoding TEXT NOT NULL,
+            face_encoding BLOB NOT NULL,
             photo_path TEXT,
             active INTEGER DEFAULT 1,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -97,6 +110,53 @@ def init_database():
         )
     ''')
     
+    # Hasil absen_masuk/absen_keluar per Idempotency-Key (lihat idempotency.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            user_id INTEGER NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            status_code INTEGER,
+            response TEXT,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, idempotency_key)
+        )
+    ''')
+    
+    # Rollup harian per kelas, dijaga app.py (lihat daily_summary.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_summary (
+            date DATE NOT NULL,
+            class_id INTEGER NOT NULL DEFAULT 0,
+            present INTEGER NOT NULL DEFAULT 0,
+            complete INTEGER NOT NULL DEFAULT 0,
+            incomplete INTEGER NOT NULL DEFAULT 0,
+            total_active INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (date, class_id)
+        )
+    ''')
+    
+    # Registry arsip bulanan + ringkasan per siswa (lihat archive.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_archive (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attendance_archive_users (
+            month TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            days INTEGER NOT NULL,
+            present INTEGER NOT NULL,
+            last_date DATE,
+            PRIMARY KEY (user_id, month)
+        )
+    ''')
+    
     # Create attendance_logs table for detailed logging
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS attendance_logs (
@@ -110,6 +170,7 @@ def init_database():
             ip_address TEXT,
             success INTEGER DEFAULT 1,
             error_message TEXT,
+            event_id TEXT,
             FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
         )
     ''')
@@ -165,6 +226,7 @@ def init_database():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_coordinates_active ON coordinates(active)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_face_data_user ON face_data(user_id)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_user_timestamp ON attendance_logs(user_id, timestamp)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_logs_event ON attendance_logs(event_id)')
     
     # Commit changes and close connection
     conn.commit()
@@ -184,13 +246,17 @@ def reset_database():
     print("Resetting database...")
     
     # Drop all tables
-    tables = ['attendance_logs', 'face_data', 'attendance', 'coordinates', 'settings', 'users', 'classes']
+    tables = ['attendance_archive_users', 'attendance_archive', 'daily_summary', 'idempotency_keys', 'attendance_logs', 'face_data', 'attendance', 'coordinates', 'settings', 'users', 'classes']
     for table in tables:
         cursor.execute(f'DROP TABLE IF EXISTS {table}')
     
     conn.commit()
     conn.close()
     
+    # File arsip milik database lama ikut dihapus (id absensi mulai lagi dari 1)
+    for path in glob.glob(os.path.join(archive.ARCHIVE_DIR, 'attendance_*.db')):
+        os.remove(path)
+    
     print("All tables dropped. Reinitializing...")
     init_database()
 
@@ -225,9 +291,13 @@ def add_sample_data():
         for i in range(5):  # Last 5 days
             attendance_date = today - timedelta(days=i)
             cursor.execute('''
-                INSERT OR IGNORE INTO attendance (user_id, date, time_in, time_out, latitude, longitude)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, attendance_date, '08:30:00', '17:15:00', -6.2088, 106.8456))
+                INSERT OR IGNORE INTO attendance (user_id, date, time_in, time_out, time_in_sec, time_out_sec,
+                                                  work_minutes, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, attendance_date, '08:30:00', '17:15:00', 30600, 62100, 525, -6.2088, 106.8456))
+    
+    # Rollup harian untuk data contoh
+    daily_summary.rebuild(conn, (today - timedelta(days=4)).isoformat(), today.isoformat())
     
     conn.commit()
     conn.close()
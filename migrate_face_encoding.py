@@ -0,0 +1,102 @@
+"""
+Online migration: face_data.face_encoding JSON text -> binary BLOB (lihat face_codec.py)
+
+Converts rows in small batches, each in its own short transaction, so the app keeps
+serving check-ins while it runs. Aman dijalankan ulang: only rows that are still
+stored as text are picked up, so an interrupted run simply resumes where it stopped.
+
+Usage: python migrate_face_encoding.py [--db database.db] [--batch-size 200] [--sleep 0.05] [--vacuum]
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+
+from face_codec import decode_encoding, encode_encoding
+
+
+def count_pending(conn):
+    return conn.execute(
+        "SELECT COUNT(*) FROM face_data WHERE typeof(face_encoding) = 'text'"
+    ).fetchone()[0]
+
+
+def migrate_batch(conn, last_id, batch_size):
+    """Convert one batch of legacy rows, returns (converted, failed, last_id)"""
+    rows = conn.execute(
+        """SELECT id, face_encoding FROM face_data
+           WHERE typeof(face_encoding) = 'text' AND id > ?
+           ORDER BY id LIMIT ?""",
+        (last_id, batch_size)
+    ).fetchall()
+
+    if not rows:
+        return 0, 0, None
+
+    updates = []
+    failed = 0
+    for row_id, raw in rows:
+        try:
+            updates.append((encode_encoding(decode_encoding(raw)), row_id))
+        except (ValueError, TypeError) as e:
+            failed += 1
+            print(f"⚠️ Row {row_id} skipped: {e}")
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Guard typeof() lagi supaya baris yang sudah ditulis ulang oleh setup_face tidak ditimpa
+        cursor = conn.executemany(
+            "UPDATE face_data SET face_encoding = ? WHERE id = ? AND typeof(face_encoding) = 'text'",
+            updates
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return cursor.rowcount, failed, rows[-1][0]
+
+
+def migrate(db_path='database.db', batch_size=200, sleep=0.05, vacuum=False):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 5000')
+
+    pending = count_pending(conn)
+    print(f"🔄 {pending} face encoding(s) still stored as JSON")
+
+    size_before = os.path.getsize(db_path)
+    converted = failed = 0
+    last_id = 0
+
+    while True:
+        done, bad, last_id = migrate_batch(conn, last_id, batch_size)
+        if last_id is None:
+            break
+        converted += done
+        failed += bad
+        print(f"   ... {converted}/{pending} converted")
+        if sleep:
+            time.sleep(sleep)
+
+    if vacuum:
+        print("🧹 Running VACUUM...")
+        conn.execute('VACUUM')
+
+    conn.close()
+
+    size_after = os.path.getsize(db_path)
+    print(f"✅ Migration complete: {converted} converted, {failed} failed")
+    print(f"   Database size: {size_before / 1024:.1f} KB -> {size_after / 1024:.1f} KB")
+    return converted, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert face_data.face_encoding to binary BLOB format')
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--sleep', type=float, default=0.05, help='pause between batches (seconds)')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM afterwards to reclaim space')
+    args = parser.parse_args()
+
+    migrate(args.db, args.batch_size, args.sleep, args.vacuum)
@@ -0,0 +1,275 @@
+"""
+Rebuild face_data encodings from the enrollment photos in faces/
+
+Re-encodes every active enrollment in a process pool (after changing the face model,
+face_pipeline settings or the threshold). Setiap user di-swap dalam satu transaksi
+bersama baris checkpoint-nya, so an interrupted run resumes where it stopped.
+
+Sumber foto per user: face_data.photo_path ({id}_face.jpg) plus its extra samples
+({id}_face_2.jpg, {id}_face_a<attendance_id>.jpg, ...).
+
+Usage:
+    python reencode_faces.py [--db database.db] [--workers N] [--run rebuild] [--reset]
+    python reencode_faces.py --dry-run      # bandingkan jarak ke foto absen terakhir, tanpa menulis
+
+A real run bumps the face_data cache version (cache_version.py), so a running app drops its
+cached encodings within a second instead of needing a restart.
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from cache_version import CacheVersion, ensure_schema as ensure_cache_version_schema
+from face_cache import FACE_MATCH_THRESHOLD, FACE_MAX_SAMPLES, as_samples, sample_distance
+from face_codec import decode_encoding, encode_encoding
+
+# Perubahan jarak di bawah ini dianggap noise (float32 / resize)
+DISTANCE_EPSILON = 0.01
+
+CHECKPOINT_TABLE = '''
+    CREATE TABLE IF NOT EXISTS face_reencode_checkpoint (
+        run_name TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        face_data_id INTEGER,
+        status TEXT NOT NULL,
+        samples INTEGER DEFAULT 0,
+        message TEXT,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (run_name, user_id)
+    )
+'''
+
+
+def local_path(path):
+    """Stored paths may use Windows separators (faces\\nama_1\\1_face.jpg)"""
+    return os.path.join(*path.replace('\\', '/').split('/')) if path else path
+
+
+def sample_photos(photo_path, max_samples=FACE_MAX_SAMPLES):
+    """Enrollment photo first, then extra samples oldest to newest (capped like the app)"""
+    if not photo_path:
+        return []
+    photo_path = local_path(photo_path)
+    base, ext = os.path.splitext(photo_path)
+    extras = sorted(glob.glob(f"{glob.escape(base)}_*{glob.escape(ext)}"), key=os.path.getmtime)
+    photos = ([photo_path] if os.path.exists(photo_path) else []) + extras
+    if len(photos) > max_samples:
+        photos = photos[:1] + photos[len(photos) - max_samples + 1:]
+    return photos
+
+
+def last_checkin_photo(conn, user_id):
+    """Newest check-in/check-out photo still on disk, or None"""
+    rows = conn.execute(
+        '''SELECT photo_path, photo_path_out FROM attendance
+           WHERE user_id = ? AND (photo_path IS NOT NULL OR photo_path_out IS NOT NULL)
+           ORDER BY date DESC, id DESC LIMIT 5''',
+        (user_id,)
+    ).fetchall()
+    for photo_in, photo_out in rows:
+        for path in (local_path(photo_out), local_path(photo_in)):
+            if path and os.path.exists(path):
+                return path
+    return None
+
+
+def _init_worker(max_edge, detect_scale):
+    import face_pipeline
+    from face_service import _init_worker as load_models
+
+    face_pipeline.configure(max_edge=max_edge, detect_scale=detect_scale)
+    load_models()
+
+
+def _encode_user(user_id, photos, probe_path):
+    """Runs inside a worker process: encode every sample photo (and the probe for dry-run)"""
+    from face_pipeline import encode_faces
+
+    samples = []
+    skipped = []
+    for path in photos:
+        try:
+            found = encode_faces(path)
+        except Exception as e:
+            skipped.append(f"{os.path.basename(path)}: {e}")
+            continue
+        if len(found) == 1:
+            samples.append(found[0])
+        else:
+            skipped.append(f"{os.path.basename(path)}: {len(found)} wajah")
+
+    probe = None
+    if probe_path:
+        found = encode_faces(probe_path)
+        probe = found[0] if len(found) == 1 else None
+
+    return {
+        'user_id': user_id,
+        'samples': np.vstack(samples) if samples else None,
+        'probe': probe,
+        'skipped': skipped,
+    }
+
+
+def load_jobs(conn, run_name, with_probe):
+    """Active enrollments not yet done in this run"""
+    rows = conn.execute(
+        '''SELECT f.id, f.user_id, f.photo_path, f.face_encoding FROM face_data f
+           WHERE f.active = 1
+             AND f.id = (SELECT MAX(id) FROM face_data WHERE user_id = f.user_id AND active = 1)
+             AND f.user_id NOT IN (
+                 SELECT user_id FROM face_reencode_checkpoint WHERE run_name = ? AND status = 'done'
+             )
+           ORDER BY f.user_id''',
+        (run_name,)
+    ).fetchall()
+
+    jobs = []
+    for face_id, user_id, photo_path, raw in rows:
+        jobs.append({
+            'face_data_id': face_id,
+            'user_id': user_id,
+            'photos': sample_photos(photo_path),
+            'old': decode_encoding(raw),
+            'probe_path': last_checkin_photo(conn, user_id) if with_probe else None,
+        })
+    return jobs
+
+
+def checkpoint(conn, run_name, job, status, samples=0, message=None):
+    conn.execute(
+        '''INSERT INTO face_reencode_checkpoint (run_name, user_id, face_data_id, status, samples, message)
+           VALUES (?, ?, ?, ?, ?, ?)
+           ON CONFLICT(run_name, user_id) DO UPDATE SET
+               face_data_id = excluded.face_data_id, status = excluded.status, samples = excluded.samples,
+               message = excluded.message, updated_at = CURRENT_TIMESTAMP''',
+        (run_name, job['user_id'], job['face_data_id'], status, samples, message)
+    )
+
+
+def swap_encoding(conn, run_name, job, samples):
+    """Replace one user's encoding and record the checkpoint in the same transaction"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Kalau user setup ulang wajah selama rebuild, baris lama sudah tidak aktif: jangan ditimpa
+        cursor = conn.execute(
+            'UPDATE face_data SET face_encoding = ? WHERE id = ? AND active = 1',
+            (encode_encoding(samples if len(samples) > 1 else samples[0]), job['face_data_id'])
+        )
+        if cursor.rowcount:
+            checkpoint(conn, run_name, job, 'done', len(samples))
+        else:
+            checkpoint(conn, run_name, job, 'stale', 0, 'face_data berubah selama rebuild')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return bool(cursor.rowcount)
+
+
+def record_failure(conn, run_name, job, message):
+    conn.execute('BEGIN IMMEDIATE')
+    checkpoint(conn, run_name, job, 'failed', 0, message)
+    conn.commit()
+
+
+def compare(job, result, stats):
+    """Dry-run: distance from the last check-in photo to the old vs new samples"""
+    probe = result['probe']
+    if probe is None or result['samples'] is None:
+        stats['no_probe'] += 1
+        return
+    old = sample_distance(as_samples(job['old']), probe)
+    new = sample_distance(result['samples'], probe)
+    stats['compared'] += 1
+    if abs(new - old) >= DISTANCE_EPSILON:
+        stats['changed'] += 1
+    if (old < FACE_MATCH_THRESHOLD) != (new < FACE_MATCH_THRESHOLD):
+        stats['flipped'] += 1
+        verdict = 'diterima' if new < FACE_MATCH_THRESHOLD else 'ditolak'
+        print(f"   ⚠️ user {job['user_id']}: {old:.3f} -> {new:.3f} (sekarang {verdict})")
+
+
+def rebuild(db_path='database.db', workers=None, run_name='rebuild', reset=False, dry_run=False,
+            max_edge=None, detect_scale=None):
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout = 5000')
+    conn.execute(CHECKPOINT_TABLE)
+    ensure_cache_version_schema(conn)
+    if reset and not dry_run:
+        conn.execute('DELETE FROM face_reencode_checkpoint WHERE run_name = ?', (run_name,))
+
+    jobs = load_jobs(conn, run_name if not dry_run else '', with_probe=dry_run)
+    total = len(jobs)
+    mode = 'dry-run' if dry_run else f"run '{run_name}'"
+    print(f"🔄 {total} user(s) to re-encode ({mode})")
+
+    stats = {'done': 0, 'failed': 0, 'stale': 0, 'compared': 0, 'changed': 0, 'flipped': 0, 'no_probe': 0}
+    start = time.perf_counter()
+    by_user = {job['user_id']: job for job in jobs}
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(max_edge, detect_scale)) as executor:
+        futures = [
+            executor.submit(_encode_user, job['user_id'], job['photos'], job['probe_path'])
+            for job in jobs
+        ]
+        for finished, future in enumerate(as_completed(futures), start=1):
+            try:
+                result = future.result()
+            except Exception as e:
+                stats['failed'] += 1
+                print(f"   ⚠️ worker error: {e}")
+                continue
+
+            job = by_user[result['user_id']]
+            for message in result['skipped']:
+                print(f"   ⚠️ user {job['user_id']} {message}")
+
+            if dry_run:
+                compare(job, result, stats)
+            elif result['samples'] is None:
+                stats['failed'] += 1
+                record_failure(conn, run_name, job, 'tidak ada foto sampel yang valid')
+            elif swap_encoding(conn, run_name, job, result['samples']):
+                stats['done'] += 1
+            else:
+                stats['stale'] += 1
+
+            if finished % 10 == 0 or finished == total:
+                elapsed = time.perf_counter() - start
+                print(f"   ... {finished}/{total} users ({finished / elapsed:.1f}/s)")
+
+    conn.close()
+
+    if dry_run:
+        print(f"✅ Dry-run complete: {stats['compared']} compared against their last check-in photo")
+        print(f"   Distance changed (>= {DISTANCE_EPSILON}): {stats['changed']} user(s)")
+        print(f"   Accept/reject flipped at {FACE_MATCH_THRESHOLD}: {stats['flipped']} user(s)")
+        print(f"   No usable check-in photo: {stats['no_probe']} user(s)")
+    else:
+        print(f"✅ Rebuild complete: {stats['done']} swapped, {stats['failed']} failed, {stats['stale']} stale")
+        if stats['done']:
+            CacheVersion('face_data', db_path).bump()
+            print("   Running app workers reload the face encoding cache")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-encode every active face enrollment from faces/')
+    parser.add_argument('--db', default='database.db')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--run', default='rebuild', help='checkpoint name, rerun with the same name to resume')
+    parser.add_argument('--reset', action='store_true', help='forget the checkpoint of this run and start over')
+    parser.add_argument('--dry-run', action='store_true', help='only report distance changes, write nothing')
+    parser.add_argument('--max-edge', type=int, default=None, help='override FACE_MAX_EDGE')
+    parser.add_argument('--detect-scale', type=int, default=None, help='override FACE_DETECT_SCALE')
+    args = parser.parse_args()
+
+    rebuild(args.db, args.workers, args.run, args.reset, args.dry_run, args.max_edge, args.detect_scale)
@@ -7,19 +7,37 @@ import sqlite3
 import re
 from werkzeug.security import generate_password_hash
 from datetime import datetime
+from db import get_connection
+import daily_summary
 
 class UserRegistration:
     def __init__(self, db_path='database.db'):
         self.db_path = db_path
     
     def get_db_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get pooled database connection"""
+        return get_connection(self.db_path)
     
     def validate_username(self, username):
         """Validate username format and uniqueness"""
+        format_valid, format_msg = self.validate_username_format(username)
+        if not format_valid:
+            return False, format_msg
+        
+        # Check if username exists
+        conn = self.get_db_connection()
+        existing_user = conn.execute(
+            'SELECT id FROM users WHERE username = ?', (username,)
+        ).fetchone()
+        conn.close()
+        
+        if existing_user:
+            return False, "Username sudah digunakan"
+        
+        return True, "Username valid"
+    
+    def validate_username_format(self, username):
+        """Validate username format only (bulk import checks uniqueness itself)"""
         if not username:
             return False, "Username tidak boleh kosong"
         
@@ -33,16 +51,6 @@ class UserRegistration:
         if not re.match("^[a-zA-Z0-9_]+$", username):
             return False, "Username hanya boleh huruf, angka, dan underscore"
         
-        # Check if username exists
-        conn = self.get_db_connection()
-        existing_user = conn.execute(
-            'SELECT id FROM users WHERE username = ?', (username,)
-        ).fetchone()
-        conn.close()
-        
-        if existing_user:
-            return False, "Username sudah digunakan"
-        
         return True, "Username valid"
     
     def validate_email(self, email):
@@ -50,9 +58,9 @@ class UserRegistration:
         if not email:
             return True, "Email optional"  # Email is optional
         
-        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        if not re.match(email_pattern, email):
-            return False, "Format email tidak valid"
+        format_valid, format_msg = self.validate_email_format(email)
+        if not format_valid:
+            return False, format_msg
         
         # Check if email exists
         conn = self.get_db_connection()
@@ -66,6 +74,14 @@ class UserRegistration:
         
         return True, "Email valid"
     
+    def validate_email_format(self, email):
+        """Validate email format only"""
+        email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+        if not re.match(email_pattern, email):
+            return False, "Format email tidak valid"
+        
+        return True, "Email valid"
+    
     def validate_password(self, password):
         """Validate password strength"""
         if not password:
@@ -130,13 +146,17 @@ class UserRegistration:
             # Insert user into database
             conn = self.get_db_connection()
             cursor = conn.cursor()
+            today = datetime.now().strftime('%Y-%m-%d')
             
+            cursor.execute('BEGIN IMMEDIATE')
+            daily_summary.ensure_day(conn, today)
             cursor.execute('''
                 INSERT INTO users (username, password, full_name, email, created_at, updated_at)
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
             ''', (username.lower().strip(), hashed_password, full_name.strip(), email))
             
             user_id = cursor.lastrowid
+            daily_summary.attach_user(conn, user_id, today)
             conn.commit()
             conn.close()
             
@@ -6,13 +6,11 @@ Handles web-based registration with face recognition setup
 from flask import request, render_template, redirect, url_for, flash, session, jsonify
 from werkzeug.utils import secure_filename
 import os
-import cv2
-import face_recognition
-import numpy as np
-import pickle
-import json
-import sqlite3
 from register import UserRegistration
+from face_cache import face_cache, sample_distance, FACE_MATCH_STRATEGY, FACE_MATCH_THRESHOLD
+from face_codec import encode_encoding
+from face_service import face_service, FaceServiceBusy, FaceServiceTimeout
+from admission import admission_controlled, face_unavailable_response
 
 class WebRegistration:
     def __init__(self, app, upload_folder='faces'):
@@ -38,18 +36,12 @@ class WebRegistration:
             if not os.path.exists(user_folder):
                 os.makedirs(user_folder)
             
-            # Save original image
-            filename = secure_filename(f"{user_id}_face.jpg")
-            image_path = os.path.join(user_folder, filename)
-            image_file.save(image_path)
-            
-            # Process with face_recognition
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
+            # Encode di worker pool wajah (lihat face_service.py), langsung dari buffer upload
+            image_bytes = image_file.read()
+            face_encodings = face_service.encode(image_bytes)
             
             if not face_encodings:
                 # No face detected
-                os.remove(image_path)  # Clean up
                 return False, "Tidak ada wajah terdeteksi dalam gambar"
             
             if len(face_encodings) > 1:
@@ -59,23 +51,21 @@ class WebRegistration:
             # Get the face encoding
             face_encoding = face_encodings[0]
             
-            # Convert to list for JSON serialization
-            encoding_list = face_encoding.tolist()
+            # Save original image (hanya kalau wajah valid)
+            filename = secure_filename(f"{user_id}_face.jpg")
+            image_path = os.path.join(user_folder, filename)
+            with open(image_path, 'wb') as f:
+                f.write(image_bytes)
             
             # Save encoding to database
-            import sqlite3
-            conn = sqlite3.connect('database.db')
+            conn = self.user_reg.get_db_connection()
             conn.execute('''
                 INSERT INTO face_data (user_id, face_encoding, photo_path, active)
                 VALUES (?, ?, ?, 1)
-            ''', (user_id, json.dumps(encoding_list), image_path))
+            ''', (user_id, encode_encoding(face_encoding), image_path))
             conn.commit()
             conn.close()
-            
-            # Also save as pickle for faster loading
-            encoding_file = os.path.join(user_folder, f"{user_id}_encoding.pkl")
-            with open(encoding_file, 'wb') as f:
-                pickle.dump(face_encoding, f)
+            face_cache.invalidate(user_id)
             
             return True, "Wajah berhasil didaftarkan"
             
@@ -102,7 +92,7 @@ class WebRegistration:
             
             if success:
                 # Get the user ID for face processing
-                conn = sqlite3.connect('database.db')
+                conn = self.user_reg.get_db_connection()
                 user = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
                 user_id = user[0] if user else None
                 conn.close()
@@ -128,42 +118,31 @@ class WebRegistration:
         return render_template('register.html')
     
     def verify_face(self, uploaded_image, user_id):
-        """Verify face against stored encoding"""
+        """Verify face against stored encoding (uploaded_image: path, file object or bytes)"""
         try:
-            # Get stored face encoding from database
-            import sqlite3
-            conn = sqlite3.connect('database.db')
-            face_data = conn.execute(
-                'SELECT face_encoding FROM face_data WHERE user_id = ? AND active = 1',
-                (user_id,)
-            ).fetchone()
-            conn.close()
+            # Get stored face encoding (cached)
+            stored_encoding = face_cache.get(user_id)
             
-            if not face_data:
+            if stored_encoding is None:
                 return False, "Face data not found for user"
             
-            # Load stored encoding
-            stored_encoding = np.array(json.loads(face_data[0]))
-            
-            # Process uploaded image
-            image = face_recognition.load_image_file(uploaded_image)
-            face_encodings = face_recognition.face_encodings(image)
+            # Process uploaded image in the face worker pool
+            face_encodings = face_service.encode(uploaded_image)
             
             if not face_encodings:
                 return False, "No face detected in uploaded image"
             
-            # Compare faces
-            matches = face_recognition.compare_faces([stored_encoding], face_encodings[0])
-            face_distance = face_recognition.face_distance([stored_encoding], face_encodings[0])
-            
-            # Threshold for face matching (lower = more strict)
-            threshold = 0.4
+            # Compare faces (semua sampel sekaligus, sama dengan app.match_face)
+            face_distance = sample_distance(stored_encoding, face_encodings[0], FACE_MATCH_STRATEGY)
             
-            if matches[0] and face_distance[0] < threshold:
-                return True, f"Face verified! Confidence: {(1-face_distance[0])*100:.1f}%"
+            if face_distance < FACE_MATCH_THRESHOLD:
+                return True, f"Face verified! Confidence: {(1-face_distance)*100:.1f}%"
             else:
-                return False, f"Face not recognized. Distance: {face_distance[0]:.3f}"
+                return False, f"Face not recognized. Distance: {face_distance:.3f}"
                 
+        except (FaceServiceBusy, FaceServiceTimeout):
+            # Bukan penolakan wajah: route menjawab 503/504
+            raise
         except Exception as e:
             return False, f"Error verifying face: {str(e)}"
         
@@ -174,8 +153,7 @@ class WebRegistration:
         if stats:
             # Add face registration stats
             try:
-                import sqlite3
-                conn = sqlite3.connect('database.db')
+                conn = self.user_reg.get_db_connection()
                 
                 face_users = conn.execute(
                     'SELECT COUNT(DISTINCT user_id) FROM face_data WHERE active = 1'
@@ -211,6 +189,7 @@ class WebRegistration:
             return jsonify({'available': valid, 'message': message})
         
         @self.app.route('/api/verify_face', methods=['POST'])
+        @admission_controlled
         def verify_face_api():
             """API endpoint for face verification during attendance"""
             if 'user_id' not in session:
@@ -226,24 +205,14 @@ class WebRegistration:
             if not self.allowed_file(face_file.filename):
                 return jsonify({'success': False, 'message': 'Invalid file format'})
             
-            # Save temporary file for processing
-            temp_path = os.path.join(self.upload_folder, 'temp_verify.jpg')
-            face_file.save(temp_path)
-            
             try:
-                success, message = self.verify_face(temp_path, session['user_id'])
-                
-                # Clean up temp file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                
+                # Decode langsung dari buffer upload, tanpa file sementara
+                success, message = self.verify_face(face_file.read(), session['user_id'])
                 return jsonify({'success': success, 'message': message})
                 
+            except (FaceServiceBusy, FaceServiceTimeout) as e:
+                return face_unavailable_response(e)
             except Exception as e:
-                # Clean up temp file on error
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                
                 return jsonify({'success': False, 'message': f'Verification error: {str(e)}'})
         
         @self.app.route('/admin/registration_stats')
@@ -0,0 +1,74 @@
+"""
+Shared fixtures: every test runs against a fresh database.db in a temporary folder
+
+db.py pools connections by path ('database.db', relative), so the whole session works in one
+temporary directory instead of switching per test. Modules that touch the database at import
+(app.py) are imported inside fixtures, after the switch.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Tanpa worker process: job wajah jalan langsung di thread test
+os.environ.setdefault('FACE_WORKERS', '0')
+
+
+@pytest.fixture(scope='session')
+def workdir(tmp_path_factory):
+    """Temporary working directory with a database created by init_db.py"""
+    path = tmp_path_factory.mktemp('absensi')
+    previous = os.getcwd()
+    os.chdir(path)
+    import init_db
+    init_db.init_database()
+    yield path
+    os.chdir(previous)
+
+
+@pytest.fixture(scope='session')
+def app_module(workdir):
+    """app.py imported inside workdir (its schema upgrades run on the fresh database)"""
+    import app
+    app.app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def conn(workdir):
+    from db import get_connection
+    conn = get_connection()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def make_user(app_module):
+    """Create a user in the first class, returns its id"""
+    from werkzeug.security import generate_password_hash
+    from db import get_connection
+    created = []
+
+    def make(username, active=1, class_name='X SIJA 1', email=None):
+        conn = get_connection()
+        class_id = conn.execute('SELECT id FROM classes WHERE name = ?', (class_name,)).fetchone()[0]
+        user_id = conn.execute(
+            '''INSERT INTO users (username, password, full_name, email, class_id, role, active)
+               VALUES (?, ?, ?, ?, ?, 'user', ?)''',
+            (username, generate_password_hash('secret1'), username.title(), email, class_id, active)
+        ).lastrowid
+        conn.commit()
+        conn.close()
+        created.append(user_id)
+        return user_id
+
+    yield make
+    conn = get_connection()
+    conn.executemany('DELETE FROM attendance WHERE user_id = ?', [(user_id,) for user_id in created])
+    conn.executemany('DELETE FROM users WHERE id = ?', [(user_id,) for user_id in created])
+    conn.commit()
+    conn.close()
@@ -0,0 +1,159 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import daily_summary
+from db import get_connection
+
+TODAY = datetime.now().strftime('%Y-%m-%d')
+YESTERDAY = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def counts(conn, day, with_active=True):
+    """{class_id: (present, complete, incomplete[, total_active])} without all-zero rows"""
+    columns = 'present, complete, incomplete' + (', total_active' if with_active else '')
+    rows = conn.execute(f'SELECT class_id, {columns} FROM daily_summary WHERE date = ?', (day,)).fetchall()
+    return {row[0]: tuple(row[1:]) for row in rows if any(row[1:])}
+
+
+def rebuilt(conn, day, with_active=True):
+    """What a full rebuild from attendance/users would store for the day (rolled back afterwards)"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        daily_summary.rebuild(conn, day, day)
+        return counts(conn, day, with_active)
+    finally:
+        conn.rollback()
+
+
+def assert_consistent(conn):
+    assert counts(conn, TODAY) == rebuilt(conn, TODAY)
+    # total_active hari lalu sengaja tidak ikut berubah, hitungan absennya ikut kelas sekarang
+    assert counts(conn, YESTERDAY, False) == rebuilt(conn, YESTERDAY, False)
+
+
+def class_id(conn, name):
+    return conn.execute('SELECT id FROM classes WHERE name = ?', (name,)).fetchone()[0]
+
+
+def resync(conn):
+    """Rebuild both dates: other tests delete their users' raw rows without adjusting the summary"""
+    conn.execute('BEGIN IMMEDIATE')
+    daily_summary.rebuild(conn, YESTERDAY, TODAY)
+    conn.commit()
+
+
+def attend(conn, user_id, day, time_out=None):
+    conn.execute('BEGIN IMMEDIATE')
+    daily_summary.ensure_day(conn, day)
+    conn.execute('INSERT INTO attendance (user_id, date, time_in) VALUES (?, ?, ?)', (user_id, day, '07:00:00'))
+    daily_summary.check_in(conn, user_id, day)
+    if time_out:
+        conn.execute('UPDATE attendance SET time_out = ? WHERE user_id = ? AND date = ?', (time_out, user_id, day))
+        daily_summary.check_out(conn, user_id, day)
+    conn.commit()
+
+
+@pytest.fixture
+def admin(app_module):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['username'] = 'admin'
+    return client
+
+
+@pytest.fixture
+def student(admin, conn):
+    """Student created through the API, with attendance yesterday (complete) and today (open)"""
+    resync(conn)
+    username = f'ds{time.time_ns()}'
+    response = admin.post('/api/users/create', json={
+        'username': username, 'full_name': 'Daily Summary', 'password': 'secret1',
+        'class_id': class_id(conn, 'X SIJA 1'),
+    })
+    assert response.get_json()['success'], response.get_json()
+    user_id = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()[0]
+    attend(conn, user_id, YESTERDAY, time_out='15:00:00')
+    attend(conn, user_id, TODAY)
+    yield user_id
+    conn.execute('DELETE FROM attendance WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+    conn.commit()
+    resync(conn)
+
+
+def test_create_and_attendance_counts(conn, student):
+    x1 = class_id(conn, 'X SIJA 1')
+    assert counts(conn, TODAY)[x1][:3] == (1, 0, 1)
+    assert counts(conn, YESTERDAY)[x1][:3] == (1, 1, 0)
+    assert_consistent(conn)
+
+
+def test_class_change_moves_counts(admin, conn, student):
+    before = counts(conn, TODAY)
+    response = admin.put(f'/api/users/update/{student}', json={
+        'full_name': 'Pindah Kelas', 'class_id': class_id(conn, 'XI SIJA 1')})
+    assert response.get_json()['success']
+
+    after = counts(conn, TODAY)
+    x1, xi1 = class_id(conn, 'X SIJA 1'), class_id(conn, 'XI SIJA 1')
+    assert after[xi1][0] - before.get(xi1, (0,))[0] == 1
+    assert after.get(x1, (0, 0, 0, 0))[0] == before[x1][0] - 1
+    assert_consistent(conn)
+
+
+def test_toggle_changes_total_active(admin, conn, student):
+    x1 = class_id(conn, 'X SIJA 1')
+    active = counts(conn, TODAY)[x1][3]
+
+    assert admin.post(f'/api/users/toggle-status/{student}').get_json()['new_status'] is False
+    assert counts(conn, TODAY)[x1][3] == active - 1
+    assert_consistent(conn)
+
+    assert admin.post(f'/api/users/toggle-status/{student}').get_json()['new_status'] is True
+    assert counts(conn, TODAY)[x1][3] == active
+    assert_consistent(conn)
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+def test_delete_removes_counts(admin, conn, student, bulk):
+    x1 = class_id(conn, 'X SIJA 1')
+    before = counts(conn, TODAY)[x1]
+    if bulk:
+        response = admin.post('/api/users/bulk-delete', json={'user_ids': [student]})
+    else:
+        response = admin.delete(f'/api/users/delete/{student}')
+    assert response.get_json()['success']
+
+    after = counts(conn, TODAY).get(x1, (0, 0, 0, 0))
+    assert (after[0], after[2], after[3]) == (before[0] - 1, before[2] - 1, before[3] - 1)
+    assert_consistent(conn)
+
+
+def test_failed_update_rolls_back_counts(app_module, admin, conn, student, monkeypatch):
+    before_today, before_yesterday = counts(conn, TODAY), counts(conn, YESTERDAY)
+
+    def fail(*args):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(daily_summary, 'attach_user', fail)
+    response = admin.put(f'/api/users/update/{student}', json={
+        'full_name': 'Gagal', 'class_id': class_id(conn, 'XI SIJA 1')})
+    assert response.status_code == 500
+
+    # detach_user sudah jalan di transaksi yang gagal: harus ikut di-rollback
+    assert counts(conn, TODAY) == before_today
+    assert counts(conn, YESTERDAY) == before_yesterday
+    # Write lock sudah dilepas, koneksi lain bisa menulis
+    other = get_connection()
+    other.execute('BEGIN IMMEDIATE')
+    other.rollback()
+    other.close()
+
+
+def test_invalid_class_id_is_rejected_before_writing(admin, conn):
+    response = admin.post('/api/users/create', json={
+        'username': f'bad{time.time_ns()}', 'full_name': 'X', 'password': 'secret1', 'class_id': 'abc'})
+    assert response.status_code == 400
+    assert not conn.in_transaction
@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pytest
+
+from face_codec import HEADER, decode_encoding, encode_encoding, is_binary
+
+
+def test_vector_round_trip_float32():
+    encoding = np.random.default_rng(1).normal(size=128)
+    raw = encode_encoding(encoding)
+
+    assert is_binary(raw)
+    assert len(raw) == HEADER.size + 128 * 4
+    decoded = decode_encoding(raw)
+    assert decoded.shape == (128,)
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, encoding.astype(np.float32))
+
+
+def test_sample_matrix_round_trip_float64():
+    samples = np.random.default_rng(2).normal(size=(5, 128))
+    decoded = decode_encoding(encode_encoding(samples, dtype='<f8'))
+
+    assert decoded.shape == (5, 128)
+    np.testing.assert_array_equal(decoded, samples)
+
+
+def test_decode_is_read_only_view():
+    decoded = decode_encoding(encode_encoding(np.zeros(128)))
+    with pytest.raises(ValueError):
+        decoded[0] = 1.0
+
+
+def test_memoryview_from_sqlite_blob():
+    raw = encode_encoding(np.arange(128, dtype=np.float32))
+    np.testing.assert_array_equal(decode_encoding(memoryview(raw)), np.arange(128, dtype=np.float32))
+
+
+def test_legacy_json_rows_still_decode():
+    encoding = [0.25] * 128
+    for raw in (json.dumps(encoding), json.dumps(encoding).encode()):
+        decoded = decode_encoding(raw)
+        assert decoded.dtype == np.float64
+        np.testing.assert_array_equal(decoded, encoding)
+    assert not is_binary(json.dumps(encoding).encode())
+
+
+def test_rejects_bad_shapes_and_versions():
+    with pytest.raises(ValueError):
+        encode_encoding(np.zeros((2, 2, 128)))
+    with pytest.raises(ValueError):
+        encode_encoding(np.zeros(128), dtype='<i4')
+
+    raw = bytearray(encode_encoding(np.zeros(128)))
+    raw[2] = 99  # versi tidak dikenal
+    with pytest.raises(ValueError):
+        decode_encoding(bytes(raw))
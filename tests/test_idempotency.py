@@ -0,0 +1,115 @@
+import itertools
+
+import pytest
+
+from idempotency import IdempotencyStore, ensure_schema, valid_key
+
+_keys = itertools.count()
+
+
+@pytest.fixture
+def store(conn):
+    ensure_schema(conn)
+    return IdempotencyStore()
+
+
+@pytest.fixture
+def key():
+    return f'test-key-{next(_keys):04d}'
+
+
+def test_valid_key():
+    assert valid_key('abcd-1234')
+    assert not valid_key('short')
+    assert not valid_key('spasi tidak boleh')
+    assert not valid_key(None)
+
+
+def test_reserve_then_replay(store, key):
+    assert store.begin(1, key, 'absen_masuk') == ('new', None)
+    # Request pertama belum selesai: duplikat menunggu
+    assert store.begin(1, key, 'absen_masuk') == ('pending', None)
+
+    store.complete(1, key, 'absen_masuk', 200, {'success': True, 'message': 'ok'})
+    state, entry = store.begin(1, key, 'absen_masuk')
+    assert state == 'done'
+    assert entry['status_code'] == 200
+    assert entry['response'] == {'success': True, 'message': 'ok'}
+
+    assert store.begin(1, key, 'absen_keluar')[0] == 'conflict'
+    # Key milik user lain tidak bentrok
+    assert store.begin(2, key, 'absen_masuk') == ('new', None)
+
+
+def test_replay_from_another_worker(store, key):
+    store.begin(1, key, 'absen_masuk')
+    store.complete(1, key, 'absen_masuk', 200, {'success': False, 'message': 'Wajah tidak dikenali.'})
+
+    # Worker lain: LRU kosong, hasil dibaca dari idempotency_keys
+    other = IdempotencyStore()
+    state, entry = other.begin(1, key, 'absen_masuk')
+    assert state == 'done'
+    assert entry['response']['message'] == 'Wajah tidak dikenali.'
+    assert other.db_hits == 1
+
+
+def test_release_only_drops_unfinished_reservations(store, key):
+    store.begin(1, key, 'absen_masuk')
+    store.release(1, key)
+    assert store.begin(1, key, 'absen_masuk') == ('new', None)
+
+    store.complete(1, key, 'absen_masuk', 200, {'success': True})
+    store.release(1, key)
+    assert IdempotencyStore().begin(1, key, 'absen_masuk')[0] == 'done'
+
+
+def test_async_job_outcome_replaces_202(store, key):
+    store.begin(1, key, 'absen_masuk')
+    store.complete(1, key, 'absen_masuk', 202, {'success': True, 'pending': True, 'job_id': 'job-1'})
+
+    other = IdempotencyStore()
+    state, entry = other.begin(1, key, 'absen_masuk')
+    assert (state, entry['status_code']) == ('done', 202)
+    assert other.job_outcome(1, 'job-1')[0] == 202
+
+    # Job selesai di worker pertama
+    final = {'success': True, 'message': 'Absen masuk berhasil!', 'job_id': 'job-1', 'pending': False}
+    store.complete(1, key, 'absen_masuk', 200, final)
+
+    # 202 tidak disimpan di LRU worker lain, jadi hasil akhir langsung terlihat
+    state, entry = other.begin(1, key, 'absen_masuk')
+    assert (state, entry['status_code'], entry['response']) == ('done', 200, final)
+    assert other.job_outcome(1, 'job-1') == (200, final)
+    assert other.job_outcome(2, 'job-1') is None
+
+
+def test_late_202_does_not_overwrite_final_outcome(store, key):
+    store.begin(1, key, 'absen_masuk')
+    # Job lebih cepat selesai daripada request menyimpan 202-nya
+    store.complete(1, key, 'absen_masuk', 200, {'success': True, 'job_id': 'job-2'})
+    store.complete(1, key, 'absen_masuk', 202, {'success': True, 'pending': True, 'job_id': 'job-2'})
+
+    state, entry = IdempotencyStore().begin(1, key, 'absen_masuk')
+    assert entry['status_code'] == 200
+
+
+def test_failed_job_discards_key(app_module, store, key):
+    store.begin(1, key, 'absen_masuk')
+    store.complete(1, key, 'absen_masuk', 202, {'success': True, 'pending': True, 'job_id': 'job-3'})
+
+    job = {'id': 'job-3', 'status': 'error', 'result': {'success': False, 'message': 'Error: boom'}}
+    app_module.store_job_outcome(1, key, 'absen_masuk', job)
+
+    # Error bukan penolakan: tap berikutnya diproses ulang
+    assert IdempotencyStore().begin(1, key, 'absen_masuk') == ('new', None)
+
+
+def test_finished_job_is_stored_for_replay(app_module, store, key):
+    store.begin(1, key, 'absen_masuk')
+    job = {'id': 'job-4', 'status': 'done', 'result': {'success': True, 'message': 'Absen masuk berhasil!'}}
+    app_module.store_job_outcome(1, key, 'absen_masuk', job)
+
+    status_code, response = IdempotencyStore().job_outcome(1, 'job-4')
+    assert status_code == 200
+    assert response['message'] == 'Absen masuk berhasil!'
+    assert response['pending'] is False
@@ -0,0 +1,196 @@
+import hashlib
+import hmac
+import io
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from db import get_connection
+from geofence import circle_bounds, geofence
+
+SITE = (-6.2000, 106.8166)
+PHOTO = b'\xff\xd8 offline photo'
+
+
+@pytest.fixture(scope='module')
+def site(app_module):
+    conn = get_connection()
+    site_id = conn.execute(
+        '''INSERT INTO coordinates (name, latitude, longitude, radius, min_lat, max_lat, min_lon, max_lon)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        ('Sekolah Test', *SITE, 100, *circle_bounds(*SITE, 100))
+    ).lastrowid
+    conn.commit()
+    conn.close()
+    geofence.invalidate()
+    yield site_id
+    conn = get_connection()
+    conn.execute('DELETE FROM coordinates WHERE id = ?', (site_id,))
+    conn.commit()
+    conn.close()
+    geofence.invalidate()
+
+
+@pytest.fixture
+def user_id(make_user):
+    return make_user(f'offline{time.time_ns()}')
+
+
+@pytest.fixture
+def client(app_module, site, user_id, monkeypatch):
+    # Verifikasi wajah di luar cakupan test ini: user dianggap punya wajah, pencocokan dilewati
+    monkeypatch.setattr(app_module, 'FACE_RECOGNITION_AVAILABLE', False)
+    monkeypatch.setattr(app_module.face_cache, 'get', lambda uid: np.zeros(128))
+    return login(app_module, user_id)
+
+
+def login(app_module, user_id):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+        session['username'] = 'siswa'
+    return client
+
+
+def fetch_key(client, when=None):
+    keys = client.get('/api/offline/key').get_json()['keys']
+    return keys[(when or datetime.now()).strftime('%Y-%m-%d')]
+
+
+def signed_item(key, when, action='check_in', item_id='item-1', **overrides):
+    """Same fields and HMAC as queueOffline()/signItem() in absensi.html"""
+    item = {
+        'id': item_id,
+        'action': action,
+        'timestamp': when.strftime('%Y-%m-%d %H:%M:%S'),
+        'latitude': str(SITE[0]),
+        'longitude': str(SITE[1]),
+        'key_id': key['key_id'],
+    }
+    payload = '|'.join([item['action'], item['timestamp'], item['latitude'], item['longitude'],
+                        hashlib.sha256(PHOTO).hexdigest()])
+    item['signature'] = hmac.new(key['key'].encode(), payload.encode(), hashlib.sha256).hexdigest()
+    item.update(overrides)
+    return item
+
+
+def send(client, *items):
+    data = {'items': json.dumps(list(items))}
+    for item in items:
+        data[f"photo_{item['id']}"] = (io.BytesIO(PHOTO), 'photo.jpg')
+    response = client.post('/api/attendance/batch', data=data)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['results']
+
+
+def issue(user_id, device, issued_at):
+    conn = get_connection()
+    conn.execute('INSERT INTO offline_key_issues (user_id, device, issued_at) VALUES (?, ?, ?)',
+                 (user_id, device, issued_at))
+    conn.commit()
+    conn.close()
+
+
+def crafted_key(app_module, user_id, device, issued_at, day):
+    key_id = f'{device}.{issued_at}'
+    with app_module.app.app_context():
+        return {'key_id': key_id, 'key': app_module.offline_key(user_id, day, key_id)}
+
+
+def test_key_endpoint(client):
+    response = client.get('/api/offline/key')
+    assert response.headers['Cache-Control'] == 'private, no-store'
+    keys = response.get_json()['keys']
+    today = datetime.now().date()
+    assert sorted(keys) == [str(today), str(today + timedelta(days=1))]
+    device, _, issued = keys[str(today)]['key_id'].partition('.')
+    assert device and abs(int(issued) - time.time()) < 5
+
+
+def test_signed_item_is_written_and_marked_offline(client, user_id):
+    result, = send(client, signed_item(fetch_key(client), datetime.now()))
+    assert result['success'], result['message']
+
+    conn = get_connection()
+    row = conn.execute('SELECT time_in, notes FROM attendance WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    assert row['notes'].startswith('offline masuk')
+
+    # Kiriman ulang (respons sebelumnya hilang) dianggap berhasil, tidak dobel
+    result, = send(client, signed_item(fetch_key(client), datetime.strptime(
+        f"{datetime.now():%Y-%m-%d} {row['time_in']}", '%Y-%m-%d %H:%M:%S')))
+    assert result['success']
+
+
+def test_tampered_item_is_rejected(client):
+    item = signed_item(fetch_key(client), datetime.now(), latitude=str(SITE[0] + 0.0001))
+    result, = send(client, item)
+    assert not result['success']
+    assert result['message'] == 'Tanda tangan data absen tidak valid'
+    assert result['retry'] is False
+
+
+def test_key_of_another_user_is_rejected(app_module, client, make_user):
+    other = login(app_module, make_user(f'other{time.time_ns()}'))
+    result, = send(client, signed_item(fetch_key(other), datetime.now()))
+    assert result['message'] == 'Tanda tangan data absen tidak valid'
+
+
+def test_legacy_item_without_key_id_is_rejected(client):
+    item = signed_item(fetch_key(client), datetime.now())
+    del item['key_id']
+    result, = send(client, item)
+    assert not result['success']
+    assert 'versi aplikasi lama' in result['message']
+
+
+def test_timestamp_before_key_was_issued(client):
+    result, = send(client, signed_item(fetch_key(client), datetime.now() - timedelta(hours=1)))
+    assert result['message'] == 'Waktu absen lebih awal dari key offline perangkat ini'
+
+
+def test_timestamp_in_the_future(client):
+    result, = send(client, signed_item(fetch_key(client), datetime.now() + timedelta(hours=1)))
+    assert 'masa depan' in result['message']
+
+
+def test_key_only_covers_time_until_device_is_online_again(app_module, client, user_id):
+    now = int(time.time())
+    issued, online_again = now - 3 * 3600, now - 3600
+    issue(user_id, 'device0000000001', issued)
+    issue(user_id, 'device0000000001', online_again)
+    key = crafted_key(app_module, user_id, 'device0000000001', issued,
+                      datetime.fromtimestamp(now).strftime('%Y-%m-%d'))
+    late = datetime.fromtimestamp(now - 600)
+    offline = datetime.fromtimestamp(now - 2 * 3600)
+    if late.date() != offline.date() or offline.date() != datetime.now().date():
+        pytest.skip('window crosses midnight')
+
+    late_result, = send(client, signed_item(key, late, item_id='late'))
+    assert 'online lagi' in late_result['message']
+
+    # Key yang sama untuk jam saat perangkat memang offline tetap diterima
+    offline_result, = send(client, signed_item(key, offline, item_id='offline'))
+    assert offline_result['success'], offline_result['message']
+
+
+def test_other_device_does_not_end_the_window(app_module, client, user_id):
+    key = fetch_key(client)
+    time.sleep(1.1)
+    # Browser lain milik user yang sama (session berbeda) mengambil key
+    fetch_key(login(app_module, user_id))
+    result, = send(client, signed_item(key, datetime.now()))
+    assert result['success'], result['message']
+
+
+def test_forged_key_id_breaks_the_signature(app_module, client, user_id):
+    now = int(time.time())
+    issue(user_id, 'device0000000002', now - 600)
+    key = crafted_key(app_module, user_id, 'device0000000002', now - 600, datetime.now().strftime('%Y-%m-%d'))
+    # Mundurkan waktu pemberian key tanpa bisa menghitung ulang HMAC
+    item = signed_item(key, datetime.now(), key_id=f'device0000000002.{now - 7200}')
+    result, = send(client, item)
+    assert result['message'] == 'Tanda tangan data absen tidak valid'
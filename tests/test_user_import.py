@@ -0,0 +1,166 @@
+import io
+import time
+
+import pytest
+
+import user_import
+from user_import import ImportFileError, import_users, read_file, validate
+
+HEADER = 'username,nama,password,kelas,email,active\n'
+
+
+def csv_bytes(*rows, header=HEADER, delimiter=','):
+    return (header + ''.join(row + '\n' for row in rows)).replace(',', delimiter).encode()
+
+
+@pytest.fixture
+def imported(conn):
+    """Usernames to remove after the test (import_users inserts them itself)"""
+    usernames = []
+    yield usernames
+    for username in usernames:
+        conn.execute('DELETE FROM users WHERE username = ?', (username,))
+    conn.commit()
+
+
+def errors_by_row(report_errors):
+    return {error['row']: error['errors'] for error in report_errors}
+
+
+@pytest.mark.parametrize('delimiter', [',', ';'])
+def test_read_csv(delimiter):
+    data = b'\xef\xbb\xbf' + csv_bytes('Budi_01,Budi,secret1,X SIJA 1,,', '', 'sari,Sari,secret1,1,sari@example.com,0',
+                                       delimiter=delimiter)
+    records = read_file(data, 'siswa.CSV')
+    # Baris kosong dilewati, nomor baris tetap nomor baris di file
+    assert [number for number, _ in records] == [2, 4]
+    assert records[0][1] == {'username': 'Budi_01', 'full_name': 'Budi', 'password': 'secret1', 'class': 'X SIJA 1'}
+    assert records[1][1]['email'] == 'sari@example.com'
+    assert records[1][1]['active'] == '0'
+
+
+@pytest.mark.parametrize('data, filename, message', [
+    (b'username,password\n', 'siswa.txt', 'Format file'),
+    (b'username,password\nbudi,secret1\n', 'siswa.csv', 'full_name, class'),
+    (b'', 'siswa.csv', 'File kosong'),
+    ('username,nama,password,kelas\n'.encode('utf-16'), 'siswa.csv', 'UTF-8'),
+])
+def test_read_file_errors(data, filename, message):
+    with pytest.raises(ImportFileError, match=message):
+        read_file(data, filename)
+
+
+def test_read_file_row_limit(monkeypatch):
+    monkeypatch.setattr(user_import, 'IMPORT_MAX_ROWS', 2)
+    with pytest.raises(ImportFileError, match='Maksimal 2 baris'):
+        read_file(csv_bytes('a1a,A,secret1,1', 'b1b,B,secret1,1', 'c1c,C,secret1,1'), 'siswa.csv')
+
+
+def test_validate_rows(conn, make_user):
+    make_user('taken_user', email='taken@example.com')
+    conn.execute("UPDATE classes SET active = 0 WHERE name = 'XII SIJA 1'")
+    conn.commit()
+    try:
+        records = read_file(csv_bytes(
+            'Ok_User,Ok,secret1,X SIJA 1,ok@example.com,ya',     # 2 valid, class by name
+            'ok_user,Dup,secret1,X SIJA 1,,',                    # 3 duplicate username in file
+            'other,Other,secret1,2,OK@example.com,',             # 4 duplicate email in file
+            'taken_user,Taken,secret1,X SIJA 1,,',               # 5 username in database
+            'fresh,Fresh,secret1,X SIJA 1,TAKEN@example.com,',   # 6 email in database
+            'short,Short,12345,X SIJA 1,,',                      # 7 password too short
+            'noclass,NoClass,secret1,XIII SIJA 9,,',             # 8 unknown class
+            'oldclass,Old,secret1,XII SIJA 1,,',                 # 9 inactive class
+            'status,Status,secret1,X SIJA 1,,mungkin',           # 10 unknown active value
+            'ab,,secret1,,,',                                    # 11 several problems at once
+            'byid,ById,secret1,2,,nonaktif',                     # 12 valid, class by id
+        ), 'siswa.csv')
+        valid, errors = validate(conn, records)
+    finally:
+        conn.execute("UPDATE classes SET active = 1 WHERE name = 'XII SIJA 1'")
+        conn.commit()
+
+    assert [(row['row'], row['username'], row['class_id'], row['active']) for row in valid] == [
+        (2, 'ok_user', 1, 1), (12, 'byid', 2, 0)]
+    errors = errors_by_row(errors)
+    assert errors[3] == ['Username sama dengan baris 2']
+    assert errors[4] == ['Email sama dengan baris 2']
+    assert errors[5] == ['Username sudah digunakan']
+    assert errors[6] == ['Email sudah terdaftar']
+    assert errors[7] == ['Password minimal 6 karakter']
+    assert errors[8] == ["Kelas 'XIII SIJA 9' tidak ditemukan atau tidak aktif"]
+    assert errors[9] == ["Kelas 'XII SIJA 1' tidak ditemukan atau tidak aktif"]
+    assert errors[10] == ["Status 'mungkin' tidak dikenal (gunakan 1/0)"]
+    assert errors[11] == ['Username minimal 3 karakter', 'Nama lengkap tidak boleh kosong', 'Kelas tidak boleh kosong']
+
+
+def test_dry_run_inserts_nothing(conn):
+    username = f'dry{time.time_ns()}'
+    report = import_users(conn, read_file(csv_bytes(f'{username},Dry,secret1,X SIJA 1,,'), 'siswa.csv'),
+                          dry_run=True, workers=1)
+    assert (report['total'], report['valid'], report['imported'], report['failed']) == (1, 1, 0, 0)
+    assert conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone() is None
+
+
+def test_import_and_reimport(conn, imported):
+    first, second = f'imp{time.time_ns()}', f'imq{time.time_ns()}'
+    imported += [first, second]
+    data = csv_bytes(f'{first},First,secret1,X SIJA 1,,', f'{second},Second,secret1,X SIJA 1,,0', 'x,Bad,1,X SIJA 1,,')
+
+    report = import_users(conn, read_file(data, 'siswa.csv'), workers=1)
+    assert (report['imported'], report['failed']) == (2, 1)
+    rows = conn.execute('SELECT username, active, role FROM users WHERE username IN (?, ?) ORDER BY username',
+                        (first, second)).fetchall()
+    assert [tuple(row) for row in rows] == [(first, 1, 'user'), (second, 0, 'user')]
+
+    # Import ulang file yang sama hanya melaporkan username yang sudah ada
+    report = import_users(conn, read_file(data, 'siswa.csv'), workers=1)
+    assert report['imported'] == 0
+    assert errors_by_row(report['errors'])[2] == ['Username sudah digunakan']
+
+
+def test_email_taken_after_validation(conn, imported, monkeypatch):
+    """A user registered between validation and the write lock is reported, not a failed import"""
+    username, racer = f'race{time.time_ns()}', f'racer{time.time_ns()}'
+    imported += [username, racer]
+    original = user_import.validate
+
+    def validate_then_race(conn, records):
+        result = original(conn, records)
+        conn.execute("INSERT INTO users (username, password, full_name, email, role) VALUES (?, 'x', 'Racer', ?, 'user')",
+                     (racer, 'race@example.com'))
+        conn.commit()
+        return result
+    monkeypatch.setattr(user_import, 'validate', validate_then_race)
+
+    report = import_users(conn, read_file(csv_bytes(f'{username},Race,secret1,X SIJA 1,Race@example.com,'),
+                                          'siswa.csv'), workers=1)
+    assert (report['imported'], report['failed']) == (0, 1)
+    assert report['errors'][0]['errors'] == ['Email sudah terdaftar']
+    assert conn.execute('SELECT 1 FROM users WHERE username = ?', (username,)).fetchone() is None
+
+
+def test_upload_runs_big_file_as_job(app_module, conn, imported, monkeypatch):
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['username'] = 'admin'
+    monkeypatch.setattr(app_module, 'IMPORT_HTTP_MAX_ROWS', 1)
+    usernames = [f'job{i}_{time.time_ns()}' for i in range(2)]
+    imported += usernames
+    data = csv_bytes(*(f'{username},Job,secret1,X SIJA 1,,' for username in usernames))
+
+    response = client.post('/api/users/import', data={'file': (io.BytesIO(data), 'siswa.csv')})
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+
+    for _ in range(100):
+        status = client.get(status_url).get_json()
+        if not status['pending']:
+            break
+        time.sleep(0.05)
+    assert status['status'] == 'done'
+    assert (status['imported'], status['failed']) == (2, 0)
+
+    assert client.get('/api/users/import/unknown').status_code == 404
+    response = client.post('/api/users/import', data={'file': (io.BytesIO(data), 'siswa.pdf')})
+    assert response.status_code == 400
@@ -0,0 +1,400 @@
+"""
+Import siswa massal dari file CSV / XLSX
+Onboards a whole intake (1.500+ students) in one go instead of one api_create_user call each:
+rows are validated in bulk against existing usernames, emails and classes, passwords are
+hashed in a process pool (generate_password_hash costs ~0.1 s of CPU each) and every valid
+row is inserted with one executemany in a single transaction
+
+Kolom (baris pertama = header, huruf besar/kecil bebas):
+    username       wajib, huruf/angka/underscore, disimpan lowercase
+    full_name      wajib (alias: nama, nama_lengkap)
+    password       wajib, minimal 6 karakter
+    class          wajib, nama kelas aktif atau id-nya (alias: kelas, class_id, class_name)
+    email          opsional
+    active         opsional, 1/0, ya/tidak, aktif/nonaktif (default aktif)
+
+Invalid rows are skipped and reported per row (row = line number in the file), valid rows
+are imported. Re-importing the same file only reports the already imported usernames.
+
+The upload endpoint (/api/users/import) imports files up to IMPORT_HTTP_MAX_ROWS rows inside
+the request. Bigger files (a whole intake: 1.500 hashes are minutes of CPU on a small server)
+run as a background job: the upload answers 202 with a job id and the report is polled from
+/api/users/import/<job_id>. Job state lives in the import_jobs table, so any worker can answer.
+
+Penggunaan:
+    python user_import.py siswa.xlsx
+    python user_import.py siswa.csv --dry-run     # validasi saja, tanpa hashing/insert
+
+Konfigurasi lewat environment variable:
+    IMPORT_HASH_WORKERS   jumlah proses hashing password (default: jumlah CPU)
+    IMPORT_MAX_ROWS       baris maksimal per file (default 20000)
+    IMPORT_HTTP_MAX_ROWS  upload lebih besar dari ini jalan sebagai job background (default 500)
+"""
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+import daily_summary
+from db import get_connection
+from register import UserRegistration
+
+IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', os.cpu_count() or 1))
+IMPORT_MAX_ROWS = int(os.environ.get('IMPORT_MAX_ROWS', 20000))
+IMPORT_HTTP_MAX_ROWS = int(os.environ.get('IMPORT_HTTP_MAX_ROWS', 500))
+
+# Job yang masih 'running' selama ini dianggap mati bersama worker-nya (restart/crash)
+IMPORT_JOB_TIMEOUT = 3600
+
+ALLOWED_IMPORT_EXTENSIONS = {'csv', 'xlsx'}
+
+COLUMN_ALIASES = {
+    'username': 'username',
+    'full_name': 'full_name',
+    'nama': 'full_name',
+    'nama_lengkap': 'full_name',
+    'password': 'password',
+    'class': 'class',
+    'kelas': 'class',
+    'class_id': 'class',
+    'class_name': 'class',
+    'email': 'email',
+    'active': 'active',
+    'status': 'active',
+}
+
+REQUIRED_COLUMNS = ('username', 'full_name', 'password', 'class')
+
+ACTIVE_VALUES = {
+    '': 1, '1': 1, 'ya': 1, 'yes': 1, 'true': 1, 'aktif': 1,
+    '0': 0, 'tidak': 0, 'no': 0, 'false': 0, 'nonaktif': 0,
+}
+
+INSERT_SQL = '''
+    INSERT INTO users (username, password, full_name, email, class_id, role, active)
+    VALUES (?, ?, ?, ?, ?, 'user', ?)
+'''
+
+
+JOB_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS import_jobs (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        report TEXT,
+        created_at REAL NOT NULL,
+        finished_at REAL
+    )
+'''
+
+
+def ensure_schema(conn):
+    """Create the import_jobs table on databases that predate it"""
+    conn.execute(JOB_SCHEMA)
+    conn.commit()
+
+
+class ImportFileError(Exception):
+    """Raised when an import file cannot be read at all (format, header, size)"""
+
+
+def _cell(value):
+    """Spreadsheet cell -> stripped string (NIS 12345 stored as a number stays '12345')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _header(names):
+    columns = [COLUMN_ALIASES.get(_cell(name).lower().replace(' ', '_')) for name in names]
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise ImportFileError(f"Kolom wajib tidak ada: {', '.join(missing)}")
+    return columns
+
+
+def _records(lines):
+    """(row_number, {column: value}) for every non-empty data row; header is row 1"""
+    lines = iter(lines)
+    try:
+        columns = _header(next(lines))
+    except StopIteration:
+        raise ImportFileError('File kosong')
+    records = []
+    for number, values in enumerate(lines, start=2):
+        values = [_cell(value) for value in values]
+        if not any(values):
+            continue
+        if len(records) >= IMPORT_MAX_ROWS:
+            raise ImportFileError(f'Maksimal {IMPORT_MAX_ROWS} baris per file')
+        records.append((number, {
+            column: value for column, value in zip(columns, values) if column and value
+        }))
+    return records
+
+
+def read_file(data, filename):
+    """Parse an uploaded CSV/XLSX (bytes) into (row_number, record) pairs"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension not in ALLOWED_IMPORT_EXTENSIONS:
+        raise ImportFileError('Format file harus CSV atau XLSX')
+
+    if extension == 'xlsx':
+        import openpyxl  # lazy: hanya dibutuhkan untuk import xlsx
+        try:
+            workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFileError(f'File XLSX tidak bisa dibaca: {e}')
+        try:
+            return _records(workbook.worksheets[0].iter_rows(values_only=True))
+        finally:
+            workbook.close()
+
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ImportFileError('File CSV harus UTF-8')
+    try:
+        # Excel berbahasa Indonesia menyimpan CSV dengan titik koma
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return _records(csv.reader(io.StringIO(text), dialect))
+
+
+def validate(conn, records):
+    """Check every row, returns (valid rows, per-row errors)
+
+    Uniqueness is checked against the database and against earlier rows of the same file
+    with one query per table, not one per row.
+    """
+    registration = UserRegistration()
+    usernames = {row[0] for row in conn.execute('SELECT lower(username) FROM users')}
+    emails = {row[0] for row in conn.execute("SELECT lower(email) FROM users WHERE email IS NOT NULL AND email != ''")}
+    # Username/email yang sudah dipakai baris sebelumnya di file ini -> nomor baris itu
+    seen_usernames, seen_emails = {}, {}
+    classes = {}
+    for row in conn.execute('SELECT id, name FROM classes WHERE active = 1'):
+        classes[str(row['id'])] = row['id']
+        classes[row['name'].strip().lower()] = row['id']
+
+    valid, errors = [], []
+    for number, record in records:
+        username = record.get('username', '').lower()
+        problems = []
+
+        ok, message = registration.validate_username_format(username)
+        if not ok:
+            problems.append(message)
+        elif username in seen_usernames:
+            problems.append(f'Username sama dengan baris {seen_usernames[username]}')
+        elif username in usernames:
+            problems.append('Username sudah digunakan')
+
+        full_name = record.get('full_name', '')
+        if not full_name:
+            problems.append('Nama lengkap tidak boleh kosong')
+        elif len(full_name) > 100:
+            problems.append('Nama lengkap maksimal 100 karakter')
+
+        # Aturan sama dengan api_create_user
+        password = record.get('password', '')
+        if len(password) < 6:
+            problems.append('Password minimal 6 karakter')
+        elif len(password) > 128:
+            problems.append('Password maksimal 128 karakter')
+
+        class_id = classes.get(record.get('class', '').lower())
+        if not record.get('class'):
+            problems.append('Kelas tidak boleh kosong')
+        elif class_id is None:
+            problems.append(f"Kelas '{record['class']}' tidak ditemukan atau tidak aktif")
+
+        email = record.get('email') or None
+        if email:
+            ok, message = registration.validate_email_format(email)
+            if not ok:
+                problems.append(message)
+            elif email.lower() in seen_emails:
+                problems.append(f'Email sama dengan baris {seen_emails[email.lower()]}')
+            elif email.lower() in emails:
+                problems.append('Email sudah terdaftar')
+
+        active = ACTIVE_VALUES.get(record.get('active', '').lower())
+        if active is None:
+            problems.append(f"Status '{record['active']}' tidak dikenal (gunakan 1/0)")
+
+        if problems:
+            errors.append({'row': number, 'username': username, 'errors': problems})
+            continue
+        seen_usernames[username] = number
+        if email:
+            seen_emails[email.lower()] = number
+        valid.append({
+            'row': number, 'username': username, 'full_name': full_name, 'password': password,
+            'email': email, 'class_id': class_id, 'active': active,
+        })
+    return valid, errors
+
+
+# Satu pool hashing per proses, dibuat saat pertama dipakai lalu dipakai ulang
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _hash_pool(workers):
+    """The shared hashing pool, recreated only when a different worker count is asked for"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: fork akan menyalin thread & lock proses Flask ke worker
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def hash_passwords(passwords, workers=IMPORT_HASH_WORKERS):
+    """generate_password_hash for every password, spread over the shared process pool"""
+    if workers <= 1 or len(passwords) < 2:
+        # Mode tanpa pool (1 CPU / file kecil): tidak ada biaya start proses
+        return [generate_password_hash(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(_hash_pool(workers).map(generate_password_hash, passwords, chunksize=chunksize))
+
+
+def import_users(conn, records, dry_run=False, workers=IMPORT_HASH_WORKERS):
+    """Validate, hash and insert the records, returns the report
+
+    {'total', 'imported', 'failed', 'errors': [{'row', 'username', 'errors'}]}. The write
+    lock is only taken after hashing; usernames and emails taken meanwhile are re-checked
+    inside the transaction and reported instead of failing the whole import.
+    """
+    valid, errors = validate(conn, records)
+    imported = 0
+    if valid and not dry_run:
+        hashes = hash_passwords([row['password'] for row in valid], workers)
+        today = datetime.now().strftime('%Y-%m-%d')
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            taken = {row[0] for row in conn.execute('SELECT lower(username) FROM users')}
+            taken_emails = {row[0] for row in conn.execute(
+                "SELECT lower(email) FROM users WHERE email IS NOT NULL AND email != ''")}
+            rows, active = [], {}
+            for row, hashed in zip(valid, hashes):
+                if row['username'] in taken:
+                    errors.append({'row': row['row'], 'username': row['username'],
+                                   'errors': ['Username sudah digunakan']})
+                    continue
+                if row['email'] and row['email'].lower() in taken_emails:
+                    errors.append({'row': row['row'], 'username': row['username'],
+                                   'errors': ['Email sudah terdaftar']})
+                    continue
+                rows.append((row['username'], hashed, row['full_name'], row['email'], row['class_id'], row['active']))
+                if row['active']:
+                    active[row['class_id']] = active.get(row['class_id'], 0) + 1
+            # total_active hari ini di daily_summary ikut dalam transaksi yang sama
+            daily_summary.ensure_day(conn, today)
+            conn.executemany(INSERT_SQL, rows)
+            daily_summary.add_active(conn, today, active)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        imported = len(rows)
+
+    errors.sort(key=lambda error: error['row'])
+    return {
+        'total': len(records),
+        'imported': imported,
+        'valid': len(valid),
+        'failed': len(errors),
+        'errors': errors,
+    }
+
+
+def start_import_job(records, db_path='database.db', workers=IMPORT_HASH_WORKERS):
+    """Run import_users in a background thread, returns the job id to poll with import_job()"""
+    job_id = uuid.uuid4().hex
+    conn = get_connection(db_path)
+    try:
+        conn.execute("INSERT INTO import_jobs (id, status, total, created_at) VALUES (?, 'running', ?, ?)",
+                     (job_id, len(records), time.time()))
+        conn.commit()
+    finally:
+        conn.close()
+    threading.Thread(target=_run_import_job, args=(job_id, records, db_path, workers),
+                     name='user-import', daemon=True).start()
+    return job_id
+
+
+def _run_import_job(job_id, records, db_path, workers):
+    conn = get_connection(db_path)
+    try:
+        try:
+            report, status = import_users(conn, records, workers=workers), 'done'
+        except Exception as e:
+            report, status = {'message': f'Error importing users: {str(e)}'}, 'error'
+        conn.execute('UPDATE import_jobs SET status = ?, report = ?, finished_at = ? WHERE id = ?',
+                     (status, json.dumps(report), time.time(), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def import_job(conn, job_id):
+    """{'status': running|done|error, 'total', 'report'} of an import job, None if unknown"""
+    row = conn.execute('SELECT status, total, report, created_at FROM import_jobs WHERE id = ?',
+                       (job_id,)).fetchone()
+    if row is None:
+        return None
+    if row['status'] == 'running' and row['created_at'] < time.time() - IMPORT_JOB_TIMEOUT:
+        # Worker yang menjalankan job sudah mati (restart/crash) sebelum mencatat hasilnya
+        return {'status': 'error', 'total': row['total'],
+                'report': {'message': 'Import terhenti sebelum selesai, silakan unggah ulang'}}
+    return {'status': row['status'], 'total': row['total'],
+            'report': json.loads(row['report']) if row['report'] else None}
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Bulk import students from a CSV or XLSX file')
+    parser.add_argument('file', help='.csv atau .xlsx, baris pertama = header')
+    parser.add_argument('--dry-run', action='store_true', help='validate only, insert nothing')
+    parser.add_argument('--workers', type=int, default=IMPORT_HASH_WORKERS, help='password hashing processes')
+    parser.add_argument('--db', default='database.db')
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        data = f.read()
+    try:
+        records = read_file(data, os.path.basename(args.file))
+    except ImportFileError as e:
+        parser.error(str(e))
+
+    conn = get_connection(args.db)
+    try:
+        report = import_users(conn, records, dry_run=args.dry_run, workers=args.workers)
+    finally:
+        conn.close()
+    for error in report['errors']:
+        print(f"❌ baris {error['row']} ({error['username'] or '-'}): {'; '.join(error['errors'])}")
+    if args.dry_run:
+        print(f"✅ {report['valid']} dari {report['total']} baris valid (dry run, tidak ada yang disimpan)")
+    else:
+        print(f"✅ {report['imported']} dari {report['total']} user diimpor, {report['failed']} baris gagal")
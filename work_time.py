@@ -0,0 +1,95 @@
+"""
+Kolom integer untuk jam absen: attendance.time_in_sec, time_out_sec dan work_minutes
+Reports sum and average stored integers instead of rebuilding a datetime string and
+calling julianday() twice for every row
+
+time_in_sec / time_out_sec = detik sejak tengah malam (08:30:15 -> 30615), ditulis
+bersama time_in / time_out. work_minutes = (time_out_sec - time_in_sec) / 60, dibulatkan
+ke bawah like the old CAST(julianday(...) * 24 * 60 AS INTEGER), set on check-out.
+The TEXT columns stay the source for display.
+
+Database lama di-backfill otomatis oleh create_app(); manual (mis. setelah import data):
+    python work_time.py
+"""
+
+COLUMNS = {
+    'time_in_sec': 'INTEGER',
+    'time_out_sec': 'INTEGER',
+    'work_minutes': 'INTEGER',
+}
+
+
+def seconds_of_day(clock):
+    """'HH:MM:SS' -> seconds since midnight"""
+    hours, minutes, seconds = (clock.split(':') + ['0', '0'])[:3]
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds or 0)
+
+
+def _seconds_sql(column):
+    # 'HH:MM:SS' -> detik, tanpa julianday (string 'HH:MM' juga aman: detik = 0)
+    return (f"CAST(substr({column}, 1, 2) AS INTEGER) * 3600 + CAST(substr({column}, 4, 2) AS INTEGER) * 60"
+            f" + CAST(substr({column}, 7, 2) AS INTEGER)")
+
+
+BACKFILL_SQL = f'''
+    UPDATE attendance SET
+        time_in_sec = CASE WHEN time_in IS NOT NULL THEN {_seconds_sql('time_in')} END,
+        time_out_sec = CASE WHEN time_out IS NOT NULL THEN {_seconds_sql('time_out')} END
+    WHERE (time_in IS NOT NULL AND time_in_sec IS NULL) OR (time_out IS NOT NULL AND time_out_sec IS NULL)
+'''
+
+WORK_MINUTES_SQL = '''
+    UPDATE attendance SET work_minutes = (time_out_sec - time_in_sec) / 60
+    WHERE work_minutes IS NULL AND time_in_sec IS NOT NULL AND time_out_sec IS NOT NULL
+'''
+
+
+def backfill(conn):
+    """Fill the integer columns of rows written without them, returns the number of rows"""
+    converted = conn.execute(BACKFILL_SQL).rowcount
+    conn.execute(WORK_MINUTES_SQL)
+    return converted
+
+
+def ensure_schema(conn):
+    """Add the integer time columns on databases that predate them and backfill every row
+
+    Returns the number of rows backfilled (0 if the columns already existed).
+    """
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(attendance)').fetchall()}
+    missing = [name for name in COLUMNS if name not in existing]
+    if not missing:
+        return 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Proses lain mungkin baru saja menambahkan kolomnya
+        existing = {row[1] for row in conn.execute('PRAGMA table_info(attendance)').fetchall()}
+        for name in COLUMNS:
+            if name not in existing:
+                conn.execute(f'ALTER TABLE attendance ADD COLUMN {name} {COLUMNS[name]}')
+        converted = backfill(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return converted
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description='Add/backfill attendance time_in_sec, time_out_sec and work_minutes')
+    parser.add_argument('--db', default='database.db')
+    args = parser.parse_args()
+
+    conn = get_connection(args.db)
+    try:
+        converted = ensure_schema(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        converted += backfill(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ attendance integer time columns backfilled: {converted} row(s)")